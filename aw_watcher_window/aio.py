@@ -0,0 +1,380 @@
+"""
+asyncio-native watcher core, for running alongside other collectors in one event loop.
+
+`AsyncTransport` talks HTTP/1.1 to aw-server over a single keep-alive
+connection. Its `heartbeat` and `insert_events` only queue the request, so
+the emitters in `heartbeat` can be used unchanged from a coroutine, and a
+background task sends the queue in order, retrying while the server is away.
+
+`watch` is the asynchronous counterpart of `main.heartbeat_loop`: in events
+mode it waits for X events with `loop.add_reader` on the display fd, in
+polling mode it samples in the loop's default executor and sleeps with
+`asyncio.sleep` until the next deadline.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from aw_core.models import Event
+
+from .exceptions import FatalError
+from .metrics import metrics
+from .rules import RuleEngine
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, body: bytes) -> None:
+        super().__init__(f"HTTP {status}: {body[:200]!r}")
+        self.status = status
+
+
+class AsyncTransport:
+    """
+    Sends requests to aw-server at `host`:`port` over one reused connection.
+
+    At most `max_pending` queued requests are kept while the server can't be
+    reached, beyond that the oldest are dropped.
+    """
+
+    def __init__(
+        self, host: str = "localhost", port: int = 5600, max_pending: int = 10000, timeout: float = 10.0
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.requests = 0
+        self.connects = 0
+        self.failures = 0
+        self.dropped = 0
+
+        self._pending: Deque[Tuple[str, str, Any]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @classmethod
+    def from_address(cls, server_address: str, **kwargs) -> "AsyncTransport":
+        """Transport for an address like `ActivityWatchClient.server_address`."""
+        url = urlparse(server_address)
+        return cls(url.hostname or "localhost", url.port or 5600, **kwargs)
+
+    async def __aenter__(self) -> "AsyncTransport":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._lock = asyncio.Lock()
+        self._task = asyncio.get_running_loop().create_task(self._send_pending())
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """Sends what's queued, giving up after `timeout` seconds, and closes the connection."""
+        if self._task is not None:
+            assert self._idle is not None
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Closing with {len(self._pending)} requests unsent")
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._disconnect()
+
+    # Queued requests, the same signatures as ActivityWatchClient
+
+    def heartbeat(self, bucket_id: str, event: Event, pulsetime: float, queued: bool = True) -> None:
+        self._enqueue(
+            "POST", f"/api/0/buckets/{bucket_id}/heartbeat?pulsetime={pulsetime}", event.to_json_dict()
+        )
+
+    def insert_events(self, bucket_id: str, events: List[Event]) -> None:
+        self._enqueue("POST", f"/api/0/buckets/{bucket_id}/events", [e.to_json_dict() for e in events])
+
+    def _enqueue(self, method: str, path: str, body: Any) -> None:
+        assert self._wakeup is not None and self._idle is not None, "transport not started"
+        if len(self._pending) >= self.max_pending:
+            self._pending.popleft()
+            self.dropped += 1
+        self._pending.append((method, path, body))
+        self._idle.clear()
+        self._wakeup.set()
+
+    async def _send_pending(self) -> None:
+        assert self._wakeup is not None and self._idle is not None
+        backoff = 0.5
+        while True:
+            if not self._pending:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            item = self._pending[0]
+            method, path, body = item
+            try:
+                await self.request(method, path, body)
+            except HTTPError as e:
+                if e.status >= 500:
+                    self.failures += 1
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30.0)
+                    continue
+                # The server will never accept it
+                logger.error(f"{method} {path} was rejected: {e}")
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                self.failures += 1
+                logger.warning(f"Failed to send request to aw-server, retrying in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 0.5
+            # Dropping may have replaced the head of the queue meanwhile
+            if self._pending and self._pending[0] is item:
+                self._pending.popleft()
+
+    # Direct requests
+
+    async def request(self, method: str, path: str, body: Any = None) -> Any:
+        """Sends a request and returns the decoded JSON response, raising HTTPError on an error status."""
+        assert self._lock is not None, "transport not started"
+        payload = b"" if body is None else json.dumps(body).encode("utf-8")
+        async with self._lock:
+            try:
+                status, data = await asyncio.wait_for(
+                    self._roundtrip(method, path, payload), self.timeout
+                )
+            except asyncio.TimeoutError:
+                # The response may still arrive, don't read it as the next one's
+                self._disconnect()
+                raise
+        if status >= 400:
+            raise HTTPError(status, data)
+        return json.loads(data) if data else None
+
+    async def get_info(self) -> Dict[str, Any]:
+        return await self.request("GET", "/api/0/info")
+
+    async def wait_for_start(self, interval: float = 1.0) -> None:
+        """Waits until aw-server answers."""
+        while True:
+            try:
+                await self.get_info()
+                return
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, HTTPError) as e:
+                logger.info(f"Waiting for aw-server to start: {e}")
+                await asyncio.sleep(interval)
+
+    async def create_bucket(self, bucket_id: str, event_type: str, client_name: str, hostname: str) -> None:
+        """Creates the bucket. aw-server answers 304 if it exists already, which isn't an error."""
+        await self.request(
+            "POST",
+            f"/api/0/buckets/{bucket_id}",
+            {"client": client_name, "hostname": hostname, "type": event_type},
+        )
+
+    # HTTP/1.1 over asyncio streams
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self.connects += 1
+
+    def _disconnect(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _roundtrip(self, method: str, path: str, payload: bytes) -> Tuple[int, bytes]:
+        reused = self._writer is not None
+        try:
+            return await self._exchange(method, path, payload)
+        except (OSError, asyncio.IncompleteReadError):
+            self._disconnect()
+            if not reused:
+                raise
+        # The server may have closed the idle connection, try once more on a new one
+        return await self._exchange(method, path, payload)
+
+    async def _exchange(self, method: str, path: str, payload: bytes) -> Tuple[int, bytes]:
+        if self._writer is None:
+            await self._connect()
+        reader, writer = self._reader, self._writer
+        assert reader is not None and writer is not None
+
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Connection: keep-alive\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n"
+        )
+        writer.write(head.encode("ascii") + payload)
+        await writer.drain()
+
+        while True:
+            version, status, headers = await self._read_head(reader)
+            # Interim responses, the final one follows
+            if not 100 <= status < 200:
+                break
+
+        keep_alive = version == b"HTTP/1.1" and headers.get(b"connection", b"").lower() != b"close"
+        if method == "HEAD" or status in (204, 304):
+            # Never have a body, whatever the headers say
+            data = b""
+        elif b"content-length" in headers:
+            data = await reader.readexactly(int(headers[b"content-length"]))
+        elif headers.get(b"transfer-encoding", b"").lower() == b"chunked":
+            data = await self._read_chunked(reader)
+        else:
+            # The body ends when the server closes the connection
+            data = await reader.read()
+            keep_alive = False
+        if not keep_alive:
+            self._disconnect()
+        self.requests += 1
+        return status, data
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader) -> Tuple[bytes, int, Dict[bytes, bytes]]:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("aw-server closed the connection")
+        version, status = status_line.split(b" ", 2)[:2]
+        headers: Dict[bytes, bytes] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip()
+        return version, int(status), headers
+
+    @staticmethod
+    async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+        chunks: List[bytes] = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                # Skip trailers
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+
+async def wait_for_change(watcher, timeout: float) -> List[Tuple[int, str]]:
+    """Like `PropertyWatcher.wait`, but waits for the display fd in the event loop."""
+    loop = asyncio.get_running_loop()
+    fd = watcher.fileno()
+    changes = watcher.wait(0)
+    if changes:
+        return changes
+
+    readable = loop.create_future()
+
+    def on_readable() -> None:
+        if not readable.done():
+            readable.set_result(None)
+
+    loop.add_reader(fd, on_readable)
+    try:
+        await asyncio.wait_for(readable, timeout)
+    except asyncio.TimeoutError:
+        return []
+    finally:
+        loop.remove_reader(fd)
+    return watcher.wait(0)
+
+
+async def watch(
+    transport: AsyncTransport,
+    bucket_id: str,
+    poll_time: float,
+    strategy: Optional[str] = None,
+    exclude_title: bool = False,
+    exclude_titles: list = [],
+    mode: str = "poll",
+    keepalive_time: float = 60.0,
+    heartbeats: str = "every",
+    batch_interval: float = 60.0,
+    batch_size: int = 100,
+    rules: list = [],
+) -> None:
+    """Samples the active window and sends it through `transport` until cancelled or a fatal error."""
+    # Imported here, main imports this module for its entry point
+    from .main import (
+        get_events_watcher,
+        log_emitter_stats,
+        log_rule_stats,
+        register_metrics,
+        make_emitter,
+        sample_window,
+    )
+
+    loop = asyncio.get_running_loop()
+    watcher = get_events_watcher() if mode == "events" else None
+    engine = RuleEngine(rules, exclude_titles)
+    emitter = make_emitter(
+        transport,
+        bucket_id,
+        poll_time,
+        event_driven=watcher is not None,
+        keepalive_time=keepalive_time,
+        heartbeats=heartbeats,
+        batch_interval=batch_interval,
+        batch_size=batch_size,
+    )
+    register_metrics(emitter, engine)
+
+    # Drift-free polling, skipping ticks that were missed entirely
+    deadline = loop.time()
+    try:
+        while True:
+            now = datetime.now(timezone.utc)
+            if watcher is None:
+                # Other backends may block, e.g. on a subprocess
+                current_window = await loop.run_in_executor(
+                    None, sample_window, strategy, exclude_title, engine
+                )
+            else:
+                current_window = sample_window(strategy, exclude_title, engine)
+
+            if current_window is not None:
+                with metrics.stage("send"):
+                    emitter.emit(current_window, now)
+            metrics.maybe_log()
+
+            if watcher is None:
+                deadline += poll_time
+                behind = loop.time() - deadline
+                if behind >= poll_time:
+                    deadline += behind // poll_time * poll_time
+                await asyncio.sleep(deadline - loop.time())
+            else:
+                await wait_for_change(watcher, keepalive_time)
+    except (FatalError, OSError):
+        try:
+            logger.exception("Fatal error, stopping")
+        except OSError:
+            pass
+    finally:
+        emitter.flush()
+        log_emitter_stats(emitter)
+        log_rule_stats(engine)
@@ -0,0 +1,242 @@
+"""
+Sampling before aw-server is up.
+
+At login aw-server is often still starting when the watcher is, and
+waiting for it loses the first seconds or minutes of activity. Instead the
+watcher samples from the start and sends through a `DeferredClient`: until
+the server has answered, heartbeats are merged into a local backlog the way
+aw-server would merge them. An `Attacher` thread polls the server with
+backoff, makes sure the bucket exists and then inserts the whole backlog in
+one request, after which requests go straight to aw_client.
+
+Whether the bucket exists, and the last event sent, are kept in a small
+`AttachState` file, so a restarted watcher doesn't create the bucket again.
+If a request is answered with 404, e.g. because aw-server's database was
+reset, the bucket is created again before the next one.
+"""
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import timedelta
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from aw_core.models import Event
+
+logger = logging.getLogger(__name__)
+
+
+class NotAttachedError(ConnectionError):
+    """Raised for requests that can't be kept in the backlog while aw-server isn't attached."""
+
+
+def _is_not_found(error: OSError) -> bool:
+    # requests' HTTPError carries the response
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) == 404
+
+
+class AttachState:
+    """
+    What the watcher knows about `bucket_id` on `server`, kept as JSON in `path`.
+
+    A file written for another server or bucket is ignored.
+    """
+
+    def __init__(self, path: Optional[str], server: str, bucket_id: str) -> None:
+        self.path = path
+        self.server = server
+        self.bucket_id = bucket_id
+        self.bucket_exists = False
+        self.last_event: Optional[Dict[str, Any]] = None
+        if path is not None:
+            self._load(path)
+
+    def _load(self, path: str) -> None:
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable state file {path}: {e}")
+            return
+        if data.get("server") != self.server or data.get("bucket_id") != self.bucket_id:
+            return
+        self.bucket_exists = bool(data.get("bucket_exists"))
+        self.last_event = data.get("last_event")
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        data = {
+            "server": self.server,
+            "bucket_id": self.bucket_id,
+            "bucket_exists": self.bucket_exists,
+            "last_event": self.last_event,
+        }
+        # Replaced in one step, so a crash leaves the old state or the new one
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save state file {self.path}: {e}")
+
+
+class DeferredClient:
+    """
+    Passes requests to `client` once attached, and keeps a backlog until then.
+
+    Has the `heartbeat` and `insert_events` methods the emitters use. While
+    detached, heartbeats are merged into the last backlog event if they
+    continue it, so the backlog holds about one event per change; beyond
+    `max_events` the oldest are dropped. Batched events already have a
+    buffer, `EventBatcher.pending` or the spool, so `insert_events` raises
+    `NotAttachedError` instead and they stay there.
+
+    Before a request is passed on, the bucket is created with `event_type`
+    unless the state says it exists.
+    """
+
+    def __init__(
+        self, client, bucket_id: str, event_type: str, state: AttachState, max_events: int = 10000
+    ) -> None:
+        self.client = client
+        self.bucket_id = bucket_id
+        self.event_type = event_type
+        self.state = state
+        self.max_events = max_events
+        self.attached = False
+        self.dropped = 0
+        # Events inserted from the backlog
+        self.flushed = 0
+        # The last event passed to the client
+        self.last_sent: Optional["Event"] = None
+
+        self.backlog: Deque["Event"] = deque()
+        self._lock = threading.Lock()
+
+    def heartbeat(self, bucket_id: str, event: "Event", pulsetime: float, queued: bool = False) -> None:
+        with self._lock:
+            if self.attached:
+                self._request(self.client.heartbeat, bucket_id, event, pulsetime=pulsetime, queued=queued)
+                self.last_sent = event
+                return
+
+            last = self.backlog[-1] if self.backlog else None
+            if last is not None and last.data == event.data:
+                end = last.timestamp + last.duration
+                if last.timestamp <= event.timestamp <= end + timedelta(seconds=pulsetime):
+                    last.duration = max(end, event.timestamp + event.duration) - last.timestamp
+                    return
+            self.backlog.append(event)
+            if len(self.backlog) > self.max_events:
+                self.backlog.popleft()
+                self.dropped += 1
+
+    def insert_events(self, bucket_id: str, events: List["Event"]) -> None:
+        if not self.attached:
+            raise NotAttachedError("Not attached to aw-server yet")
+        self._request(self.client.insert_events, bucket_id, events)
+        if events:
+            self.last_sent = events[-1]
+
+    def attach(self) -> int:
+        """
+        Inserts the backlog in one request and passes requests on from then on.
+
+        Returns the number of backlogged events. If the insert fails, the
+        error is raised and the backlog is kept.
+        """
+        with self._lock:
+            self._ensure_bucket()
+            events = list(self.backlog)
+            if events:
+                self._request(self.client.insert_events, self.bucket_id, events)
+                self.last_sent = events[-1]
+                self.flushed += len(events)
+                self.backlog.clear()
+            self.attached = True
+        self.save_state()
+        return len(events)
+
+    def _ensure_bucket(self) -> None:
+        if self.state.bucket_exists:
+            return
+        self.client.create_bucket(self.bucket_id, self.event_type, queued=False)
+        self.state.bucket_exists = True
+        self.state.save()
+
+    def _request(self, send: Callable[..., None], *args: Any, **kwargs: Any) -> None:
+        self._ensure_bucket()
+        try:
+            send(*args, **kwargs)
+        except OSError as e:
+            if _is_not_found(e):
+                logger.warning(f"Bucket {self.bucket_id} not found, creating it again with the next request")
+                self.state.bucket_exists = False
+                self.state.save()
+            raise
+
+    def save_state(self) -> None:
+        if self.last_sent is not None:
+            self.state.last_event = self.last_sent.to_json_dict()
+        self.state.save()
+
+    def close(self) -> None:
+        if self.backlog:
+            logger.warning(f"aw-server never answered, {len(self.backlog)} events weren't sent")
+        self.save_state()
+
+
+class Attacher(threading.Thread):
+    """
+    Polls aw-server until it answers, then attaches `deferred`, creating the bucket if needed.
+
+    After a failed attempt it waits `retry` seconds, doubling up to `max_retry`.
+    """
+
+    def __init__(self, deferred: DeferredClient, retry: float = 0.1, max_retry: float = 2.0) -> None:
+        super().__init__(name="aw-watcher-window-attach", daemon=True)
+        self.deferred = deferred
+        self.retry = retry
+        self.max_retry = max_retry
+        self.attempts = 0
+        # Seconds from starting until attached
+        self.attached_after: Optional[float] = None
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        started = monotonic()
+        delay = self.retry
+        while not self._stopped.is_set():
+            self.attempts += 1
+            try:
+                backlogged = self._attach()
+            except OSError as e:
+                # requests' exceptions are OSErrors too
+                logger.debug(f"aw-server not reachable yet, retrying in {delay:.1f}s: {e}")
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self.max_retry)
+                continue
+            self.attached_after = monotonic() - started
+            logger.info(
+                f"Attached to aw-server after {self.attached_after:.1f}s, inserted {backlogged} backlogged events"
+            )
+            return
+
+    def _attach(self) -> int:
+        deferred = self.deferred
+        deferred.client.get_info()
+        # Sends no request, aw_client's queue creates the bucket whenever it connects
+        deferred.client.create_bucket(deferred.bucket_id, deferred.event_type, queued=True)
+        return deferred.attach()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopped.set()
+        self.join(timeout)
@@ -0,0 +1,91 @@
+"""
+Small caches used on the sampling hot path.
+"""
+from collections import OrderedDict
+from time import monotonic
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """A bounded mapping that evicts the least recently used entry, counting hits and misses."""
+
+    def __init__(
+        self, maxsize: int, on_evict: Optional[Callable[[K, V], None]] = None
+    ) -> None:
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[K, V]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._data
+
+    def get(self, key: K) -> Optional[V]:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            old_key, old_value = self._data.popitem(last=False)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(old_key, old_value)
+
+    def pop(self, key: K) -> Optional[V]:
+        """Removes `key` without counting it as an eviction."""
+        return self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class ExpiringSet(Generic[K]):
+    """A bounded set that forgets keys `ttl` seconds after they were added, counting lookups that found one."""
+
+    def __init__(
+        self, ttl: float, maxsize: int = 1024, clock: Callable[[], float] = monotonic
+    ) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        # key -> time it expires, oldest first
+        self._expires: "OrderedDict[K, float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def add(self, key: K) -> None:
+        self._expires[key] = self.clock() + self.ttl
+        self._expires.move_to_end(key)
+        while len(self._expires) > self.maxsize:
+            self._expires.popitem(last=False)
+
+    def discard(self, key: K) -> None:
+        self._expires.pop(key, None)
+
+    def __contains__(self, key: K) -> bool:
+        expires = self._expires.get(key)
+        if expires is None:
+            return False
+        if self.clock() >= expires:
+            del self._expires[key]
+            return False
+        self.hits += 1
+        return True
@@ -1,17 +1,38 @@
 import argparse
-
-from aw_core.config import load_config_toml
+import sys
 
 default_config = """
 [aw-watcher-window]
 exclude_title = false
 exclude_titles = []
+rules = []
 poll_time = 1.0
+adaptive = false
+poll_time_min = 0.5
+poll_time_max = 10.0
+mode = "poll"
+keepalive_time = 60.0
+heartbeats = "every"
+batch_interval = 60.0
+batch_size = 100
+spool = true
+spool_size = 16.0
+threaded = false
+buffer_size = 1024
+backlog_size = 10000
+schedule = "skip"
+desktop_names_ttl = 60.0
+metrics = false
+metrics_port = 0
+metrics_interval = 300.0
 strategy_macos = "swift"
+strategy_linux = "xlib"
 """.strip()
 
 
 def load_config():
+    from aw_core.config import load_config_toml
+
     return load_config_toml("aw-watcher-window", default_config)["aw-watcher-window"]
 
 
@@ -19,9 +40,31 @@ def parse_args():
     config = load_config()
 
     default_poll_time = config["poll_time"]
+    default_adaptive = config["adaptive"]
+    default_poll_time_min = config["poll_time_min"]
+    default_poll_time_max = config["poll_time_max"]
     default_exclude_title = config["exclude_title"]
     default_exclude_titles = config["exclude_titles"]
-    default_strategy_macos = config["strategy_macos"]
+    default_rules = config["rules"]
+    if sys.platform.startswith("linux"):
+        default_strategy = config["strategy_linux"]
+    else:
+        default_strategy = config["strategy_macos"]
+    default_mode = config["mode"]
+    default_keepalive_time = config["keepalive_time"]
+    default_heartbeats = config["heartbeats"]
+    default_batch_interval = config["batch_interval"]
+    default_batch_size = config["batch_size"]
+    default_spool = config["spool"]
+    default_spool_size = config["spool_size"]
+    default_threaded = config["threaded"]
+    default_buffer_size = config["buffer_size"]
+    default_backlog_size = config["backlog_size"]
+    default_schedule = config["schedule"]
+    default_desktop_names_ttl = config["desktop_names_ttl"]
+    default_metrics = config["metrics"]
+    default_metrics_port = config["metrics_port"]
+    default_metrics_interval = config["metrics_interval"]
 
     parser = argparse.ArgumentParser(
         description="A cross platform window watcher for Activitywatch.\nSupported on: Linux (X11), macOS and Windows."
@@ -46,12 +89,132 @@ def parse_args():
     parser.add_argument(
         "--poll-time", dest="poll_time", type=float, default=default_poll_time
     )
+    parser.add_argument(
+        "--adaptive",
+        dest="adaptive",
+        action="store_true",
+        default=default_adaptive,
+        help="(poll mode) poll every poll-time-min after a change and back off towards poll-time-max while nothing changes",
+    )
+    parser.add_argument(
+        "--poll-time-min", dest="poll_time_min", type=float, default=default_poll_time_min
+    )
+    parser.add_argument(
+        "--poll-time-max", dest="poll_time_max", type=float, default=default_poll_time_max
+    )
+    parser.add_argument(
+        "--mode",
+        dest="mode",
+        default=default_mode,
+        choices=["poll", "events"],
+        help="(Linux only) 'poll' samples every poll-time, 'events' samples when the X server reports a window or desktop change",
+    )
+    parser.add_argument(
+        "--keepalive-time",
+        dest="keepalive_time",
+        type=float,
+        default=default_keepalive_time,
+        help="(events mode or --heartbeats=changes) seconds between heartbeats when nothing changes",
+    )
+    parser.add_argument(
+        "--heartbeats",
+        dest="heartbeats",
+        default=default_heartbeats,
+        choices=["every", "changes", "batch"],
+        help="'every' sends a heartbeat for every sample, 'changes' (poll mode) only when the window changes and every keepalive-time, 'batch' merges samples into events locally and inserts them in batches",
+    )
+    parser.add_argument(
+        "--batch-interval",
+        dest="batch_interval",
+        type=float,
+        default=default_batch_interval,
+        help="(--heartbeats=batch) seconds between inserts",
+    )
+    parser.add_argument(
+        "--batch-size",
+        dest="batch_size",
+        type=int,
+        default=default_batch_size,
+        help="(--heartbeats=batch) insert as soon as this many events are finished",
+    )
+    parser.add_argument(
+        "--no-spool",
+        dest="spool",
+        action="store_false",
+        default=default_spool,
+        help="(--heartbeats=batch) keep events that weren't inserted in memory instead of an on-disk spool",
+    )
+    parser.add_argument(
+        "--spool-size",
+        dest="spool_size",
+        type=float,
+        default=default_spool_size,
+        help="(--heartbeats=batch) maximum size of the spool in MB, the oldest events are dropped beyond it",
+    )
+    parser.add_argument(
+        "--threaded",
+        dest="threaded",
+        action="store_true",
+        default=default_threaded,
+        help="send heartbeats from a separate thread, so a slow server doesn't delay sampling",
+    )
+    parser.add_argument(
+        "--buffer-size",
+        dest="buffer_size",
+        type=int,
+        default=default_buffer_size,
+        help="(--threaded) maximum number of samples waiting to be sent",
+    )
+    parser.add_argument(
+        "--backlog-size",
+        dest="backlog_size",
+        type=int,
+        default=default_backlog_size,
+        help="maximum number of events kept until aw-server answers",
+    )
+    parser.add_argument(
+        "--schedule",
+        dest="schedule",
+        default=default_schedule,
+        choices=["skip", "catch-up"],
+        help="(poll mode) when a poll overruns past the next one, 'skip' the missed polls or 'catch-up' by running them right away",
+    )
+    parser.add_argument(
+        "--desktop-names-ttl",
+        dest="desktop_names_ttl",
+        type=float,
+        default=default_desktop_names_ttl,
+        help="(Linux, poll mode) seconds to cache desktop names before reading them again",
+    )
+    parser.add_argument(
+        "--metrics",
+        dest="metrics",
+        action="store_true",
+        default=default_metrics,
+        help="time each step of a sample and log a summary with counters every metrics-interval",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        dest="metrics_port",
+        type=int,
+        default=default_metrics_port,
+        help="serve metrics in Prometheus' text format on localhost at this port (implies --metrics)",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        dest="metrics_interval",
+        type=float,
+        default=default_metrics_interval,
+        help="(--metrics) seconds between metrics summaries in the log",
+    )
     parser.add_argument(
         "--strategy",
         dest="strategy",
-        default=default_strategy_macos,
-        choices=["jxa", "applescript", "swift"],
-        help="(macOS only) strategy to use for retrieving the active window",
+        default=default_strategy,
+        choices=["jxa", "applescript", "swift", "xlib", "snapshot", "xprop-spy", "synthetic"],
+        help="strategy to use for retrieving the active window (macOS: jxa, applescript, swift; Linux: xlib, snapshot, xprop-spy; any platform: synthetic, a generated workload for testing)",
     )
+    # Rules only come from the config file
+    parser.set_defaults(rules=default_rules)
     parsed_args = parser.parse_args()
     return parsed_args
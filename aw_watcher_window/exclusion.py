@@ -0,0 +1,102 @@
+"""
+Title exclusion with combined regexes and a cache of verdicts per title.
+
+Matching every `--exclude-titles` pattern against every sample is costly
+with many patterns, and pointless for a title that was already checked:
+most samples repeat the previous title, and the rest mostly come from a
+small set of windows.
+"""
+import re
+from typing import Dict, List, Optional, Pattern, Sequence, Tuple
+
+from .cache import LRUCache
+
+# Patterns that can't be or-ed with others: numbered or named backreferences
+# and conditional group references would point at the wrong group, and global
+# inline flags must come first
+_uncombinable_re = re.compile(r"\\[1-9]|\(\?P=|\(\?\(|^\(\?[aiLmsux]+\)")
+
+# Patterns starting with a literal character. An alternation of those is
+# scanned for its possible first characters at once, while e.g. one starting
+# with \b or a group has to be tried at every position and gains nothing
+# from being combined.
+_literal_start_re = re.compile(r"[^\\^$.|?*+()\[\]{}]|\\[^\dAbBdDsSwWZ]")
+
+
+def _combine_kind(pattern: Pattern) -> Optional[str]:
+    if _uncombinable_re.search(pattern.pattern):
+        return None
+    if pattern.pattern.startswith("^"):
+        return "anchored"
+    if _literal_start_re.match(pattern.pattern):
+        return "literal"
+    return None
+
+
+def combine_patterns(patterns: Sequence[Pattern]) -> List[Pattern]:
+    """
+    Combines `patterns` into as few regexes as possible that together
+    match the same strings, where that makes matching faster.
+    """
+    combined: List[Pattern] = []
+    groups: Dict[Tuple[str, int], List[Pattern]] = {}
+    for pattern in patterns:
+        kind = _combine_kind(pattern)
+        if kind is None:
+            combined.append(pattern)
+        else:
+            groups.setdefault((kind, pattern.flags), []).append(pattern)
+
+    for (_, flags), group in groups.items():
+        if len(group) == 1:
+            combined.extend(group)
+            continue
+        try:
+            combined.append(
+                re.compile("|".join(f"(?:{p.pattern})" for p in group), flags)
+            )
+        except re.error:
+            # E.g. the same group name in two patterns
+            combined.extend(group)
+    return combined
+
+
+class TitleExcluder:
+    """
+    Decides whether a title matches any of the exclusion `patterns`.
+
+    A title equal to the previous one is answered without any lookup,
+    others from an LRU cache of up to `cache_size` verdicts.
+    """
+
+    def __init__(self, patterns: Sequence[Pattern], cache_size: int = 1024) -> None:
+        self.patterns = list(patterns)
+        self.matchers = combine_patterns(self.patterns)
+        self.verdicts: LRUCache[str, bool] = LRUCache(cache_size)
+        # Titles answered because they were the same as the previous one
+        self.repeats = 0
+        self._last_title: Optional[str] = None
+        self._last_verdict = False
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+    def excluded(self, title: str) -> bool:
+        if title == self._last_title:
+            self.repeats += 1
+            return self._last_verdict
+
+        verdict = self.verdicts.get(title)
+        if verdict is None:
+            verdict = any(matcher.search(title) for matcher in self.matchers)
+            self.verdicts.put(title, verdict)
+
+        self._last_title = title
+        self._last_verdict = verdict
+        return verdict
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of titles answered without running a regex."""
+        total = self.repeats + self.verdicts.hits + self.verdicts.misses
+        return (self.repeats + self.verdicts.hits) / total if total else 0.0
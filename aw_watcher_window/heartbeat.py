@@ -0,0 +1,320 @@
+"""
+Turns window samples into heartbeats.
+
+aw-server merges a heartbeat into the previous event if it has the same data
+and arrives within `pulsetime` seconds of that event's end. Sending a
+heartbeat for every sample is therefore mostly redundant: while the window
+stays the same, one heartbeat every `keepalive_time` seconds stores the same
+timeline, as long as those heartbeats are sent with a pulsetime that covers
+the keep-alive interval.
+
+Going further, `EventBatcher` does the merging itself and only inserts the
+finished events, many at a time.
+"""
+import logging
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+from .sample import Sample, to_data
+from .spool import Spool
+
+if TYPE_CHECKING:
+    from aw_core.models import Event
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatEmitter:
+    """
+    Sends samples of the current window to a bucket as heartbeats.
+
+    `interval` is the time expected between two samples (the poll time), and
+    `slack` how much later than that a sample may arrive and still continue
+    the previous one.
+    If `keepalive_time` is set, a sample that is identical to the previous one
+    is only sent if `keepalive_time` seconds passed since the last heartbeat.
+    When the data changes the suppressed stretch is closed with a heartbeat of
+    the previous data at the time it was last seen, so the server ends the
+    event where it would have if every sample had been sent.
+
+    With `event_driven`, samples are only taken when something changed, so the
+    previous data is known to have lasted until the new sample.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket_id: str,
+        interval: float,
+        keepalive_time: Optional[float] = None,
+        event_driven: bool = False,
+        queued: bool = True,
+        slack: float = 1.0,
+    ) -> None:
+        self.client = client
+        self.bucket_id = bucket_id
+        self.interval = interval
+        self.slack = slack
+        self.keepalive_time = keepalive_time
+        self.event_driven = event_driven
+        self.queued = queued
+        self.sent = 0
+        self.suppressed = 0
+
+        self._last_data: Optional[Sample] = None
+        # When the last data was last sampled, and last sent
+        self._last_seen: Optional[datetime] = None
+        self._last_sent: Optional[datetime] = None
+
+    @property
+    def pulsetime(self) -> float:
+        """Pulsetime for heartbeats that follow the previous sample."""
+        return self.interval + self.slack
+
+    def _send(self, data: Sample, timestamp: datetime, pulsetime: float) -> None:
+        from aw_core.models import Event
+
+        self.client.heartbeat(
+            self.bucket_id,
+            Event(timestamp=timestamp, data=to_data(data)),
+            pulsetime=pulsetime,
+            queued=self.queued,
+        )
+        self.sent += 1
+
+    def emit(self, data: Sample, timestamp: datetime, until: Optional[datetime] = None) -> None:
+        """
+        Handles a sample of `data` taken at `timestamp`, or with `until`,
+        a run of identical samples taken from `timestamp` to `until`.
+        """
+        last_seen = self._last_seen
+        # A late sample (e.g. after suspend) must not be merged over the gap
+        gap = last_seen is not None and timestamp - last_seen > timedelta(
+            seconds=self.pulsetime
+        )
+
+        if data == self._last_data and not gap:
+            self._extend(timestamp)
+        else:
+            if self._last_data is not None:
+                assert last_seen is not None
+                # Where the previous data ended, if not sent already
+                end = timestamp if self.event_driven and not gap else last_seen
+                self._close(end)
+
+            self._send(data, timestamp, self.pulsetime)
+            self._last_data = data
+            self._last_seen = self._last_sent = timestamp
+
+        if until is not None and until > timestamp:
+            self._extend(until)
+
+    def _extend(self, timestamp: datetime) -> None:
+        """The last data was still current at `timestamp`."""
+        assert self._last_data is not None and self._last_sent is not None
+        self._last_seen = timestamp
+        if self.keepalive_time is not None and timestamp - self._last_sent < timedelta(
+            seconds=self.keepalive_time
+        ):
+            self.suppressed += 1
+            return
+        self._close(timestamp)
+
+    def _close(self, end: datetime) -> None:
+        assert self._last_data is not None and self._last_sent is not None
+        if end > self._last_sent:
+            # Wide enough to merge with the last heartbeat, however many samples were skipped since
+            pulsetime = (end - self._last_sent).total_seconds() + self.pulsetime
+            self._send(self._last_data, end, pulsetime)
+            self._last_sent = end
+
+    def flush(self) -> None:
+        """Sends the samples suppressed since the last heartbeat, e.g. before stopping."""
+        if self._last_seen is not None:
+            self._close(self._last_seen)
+
+
+class EventBatcher:
+    """
+    Merges samples into finished events locally and inserts them in batches.
+
+    Consecutive samples with the same data, no more than `interval` + `slack`
+    seconds apart, become one event with a duration, as aw-server would have
+    merged their heartbeats. Finished events are inserted with one request
+    once `batch_size` of them are waiting, or `batch_interval` seconds after
+    the last insert. In the latter case the event still in progress is sent
+    too, as a heartbeat, so the server is never more than `batch_interval`
+    behind. Once it's finished the rest of it is merged into the same event
+    with another heartbeat, so a long stretch in one window stays one event.
+
+    Events that fail to insert are kept and retried with the next batch. With
+    a `spool` they are kept on disk, so they also survive a restart. Events
+    are only spooled if they can't be inserted right away, so titles too
+    long for a spool record are only cut short then.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket_id: str,
+        interval: float,
+        batch_interval: float = 60.0,
+        batch_size: int = 100,
+        event_driven: bool = False,
+        clock: Callable[[], float] = monotonic,
+        spool: Optional[Spool] = None,
+        slack: float = 1.0,
+    ) -> None:
+        self.client = client
+        self.bucket_id = bucket_id
+        self.interval = interval
+        self.slack = slack
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self.event_driven = event_driven
+        self.clock = clock
+        self.spool = spool
+        self.samples = 0
+        self.sent = 0
+        self.requests = 0
+
+        self.pending: List["Event"] = []
+        self._current: Optional["Event"] = None
+        # The sample the current event was built from
+        self._current_data: Optional[Sample] = None
+        # End of the part of the current event the server already has
+        self._sent_until: Optional[datetime] = None
+        # Same for pending[0], once the current event is finished
+        self._continues_until: Optional[datetime] = None
+        self._flushed_at = clock()
+
+    @property
+    def pulsetime(self) -> float:
+        return self.interval + self.slack
+
+    def _finish(self) -> None:
+        if self._current is not None:
+            # It's only sent while nothing is pending, so it's pending[0] now
+            self._continues_until = self._sent_until
+            self._sent_until = None
+            self.pending.append(self._current)
+            self._current = None
+
+    def emit(self, data: Sample, timestamp: datetime, until: Optional[datetime] = None) -> None:
+        """Like `HeartbeatEmitter.emit`."""
+        self.samples += 1
+        current = self._current
+        if current is not None:
+            end = current.timestamp + current.duration
+            if timestamp - end > timedelta(seconds=self.pulsetime):
+                self._finish()
+            elif data != self._current_data:
+                if self.event_driven:
+                    # The previous data lasted until this sample
+                    current.duration = timestamp - current.timestamp
+                self._finish()
+
+        if self._current is None:
+            from aw_core.models import Event
+
+            self._current = Event(timestamp=timestamp, duration=0, data=to_data(data))
+            self._current_data = data
+        current = self._current
+        current.duration = (until or timestamp) - current.timestamp
+        self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        if len(self.pending) >= self.batch_size:
+            self._insert()
+        elif self.clock() - self._flushed_at >= self.batch_interval:
+            self._insert()
+            self._send_current()
+
+    def _heartbeat(self, event: "Event") -> None:
+        from aw_core.models import Event
+
+        # With no pulsetime it's only merged into an event starting at the same time
+        heartbeat = Event(timestamp=event.timestamp, duration=event.duration, data=event.data)
+        self.requests += 1
+        self.client.heartbeat(self.bucket_id, heartbeat, pulsetime=0, queued=False)
+
+    def _send_current(self) -> None:
+        current = self._current
+        if current is None or not current.duration:
+            return
+        if self.pending or (self.spool is not None and len(self.spool)):
+            # It would end up before events that aren't inserted yet
+            return
+        try:
+            self._heartbeat(current)
+        except OSError as e:
+            logger.warning(f"Failed to send the event in progress, retrying later: {e}")
+            return
+        self._sent_until = current.timestamp + current.duration
+
+    def _merge_continued(self) -> None:
+        sent_until = self._continues_until
+        assert sent_until is not None
+        self._continues_until = None
+        event = self.pending[0]
+        try:
+            self._heartbeat(event)
+        except OSError as e:
+            from aw_core.models import Event
+
+            logger.warning(f"Failed to merge the rest of an event, inserting it separately: {e}")
+            # Continues where the part the server has ends
+            self.pending[0] = Event(
+                timestamp=sent_until, duration=event.timestamp + event.duration - sent_until, data=event.data
+            )
+            return
+        self.pending = self.pending[1:]
+        self.sent += 1
+
+    def _spool(self, events: List["Event"]) -> List["Event"]:
+        """Appends `events` to the spool, returns those that couldn't be spooled."""
+        assert self.spool is not None
+        spooled = 0
+        try:
+            for event in events:
+                self.spool.append(event)
+                spooled += 1
+            self.spool.sync()
+        except (OSError, ValueError) as e:
+            # E.g. a full disk, or an event too large for a spool record
+            logger.warning(f"Failed to spool events, keeping {len(events) - spooled} in memory: {e}")
+        return events[spooled:]
+
+    def _insert(self) -> None:
+        self._flushed_at = self.clock()
+        if self._continues_until is not None:
+            self._merge_continued()
+        spool = self.spool
+        if spool is not None and len(spool):
+            # They have to go after the events already spooled
+            self.pending = self._spool(self.pending)
+            self.requests += 1
+            self.sent += spool.drain(self.client, self.bucket_id)
+            return
+        if not self.pending:
+            return
+        events = self.pending
+        try:
+            self.requests += 1
+            self.client.insert_events(self.bucket_id, events)
+        except OSError as e:
+            # Includes requests' RequestException
+            if spool is not None:
+                logger.warning(f"Failed to insert {len(events)} events, spooling them: {e}")
+                self.pending = self._spool(events)
+            else:
+                logger.warning(f"Failed to insert {len(events)} events, retrying later: {e}")
+            return
+        self.pending = []
+        self.sent += len(events)
+
+    def flush(self) -> None:
+        """Inserts all events including the one in progress, e.g. before stopping."""
+        self._finish()
+        self._insert()
@@ -1,85 +1,160 @@
 import sys
-from typing import Optional
+from typing import Callable, Dict, Optional, Protocol
 
 from .exceptions import FatalError
-from .virtualdesktop import get_virtual_desktop_info
+from .metrics import metrics
+from .sample import WindowSample
+from .virtualdesktop import desktop_name, get_virtual_desktop_info
 
 
-def get_current_window_linux() -> Optional[dict]:
+class WindowSource(Protocol):
+    """Anything that can be sampled for the active window, selected by strategy name."""
+
+    def get_current_window(self) -> Optional[WindowSample]:
+        ...
+
+
+def _synthetic_source() -> WindowSource:
+    from .synthetic import SyntheticSource
+
+    return SyntheticSource()
+
+
+# Sources that don't depend on the platform, created on first use
+source_factories: Dict[str, Callable[[], WindowSource]] = {"synthetic": _synthetic_source}
+_sources: Dict[str, WindowSource] = {}
+
+
+def register_source(name: str, source: WindowSource) -> None:
+    """Makes `get_current_window(name)` sample `source`, replacing any source of that name."""
+    _sources[name] = source
+
+
+def get_source(name: Optional[str]) -> Optional[WindowSource]:
+    source = _sources.get(name) if name is not None else None
+    if source is None and name in source_factories:
+        source = _sources[name] = source_factories[name]()
+    return source
+
+
+def get_current_window_linux_snapshot() -> Optional[WindowSample]:
     from . import xlib
+    from .xevents import get_watcher
+
+    with metrics.stage("snapshot"):
+        snapshot = xlib.get_snapshot()
+    if snapshot.window_id is not None:
+        # Keep title changes waking up events mode
+        watcher = get_watcher()
+        watcher.follow(xlib._get_window(snapshot.window_id))
+        watcher.poll()
+
+    return WindowSample(
+        snapshot.app,
+        snapshot.title,
+        desktop_name(snapshot.desktop, snapshot.desktop_names),
+        window_id=snapshot.window_id,
+        pid=snapshot.pid,
+    )
+
+
+def get_current_window_linux(strategy: Optional[str] = None) -> Optional[WindowSample]:
+    # `xlib` is the default strategy, `snapshot` trades some caching for fewer round-trips
+    # and `xprop-spy` follows the windows through long-lived `xprop -spy` processes.
+    if strategy == "snapshot":
+        return get_current_window_linux_snapshot()
+    elif strategy == "xprop-spy":
+        from . import xprop
+
+        with metrics.stage("xprop"):
+            window_info = xprop.get_spy_backend().get_current_window()
+        return WindowSample.from_dict(window_info)
+    elif strategy not in (None, "xlib"):
+        raise FatalError(f"invalid strategy '{strategy}'")
 
-    window = xlib.get_current_window()
+    from . import xlib
+    from .xevents import get_watcher
+
+    with metrics.stage("window_id"):
+        window = xlib.get_current_window()
 
     if window is None:
         cls = "unknown"
         name = "unknown"
     else:
-        cls = xlib.get_window_class(window)
-        name = xlib.get_window_name(window)
+        with metrics.stage("window_class"):
+            cls = xlib.get_window_class(window)
+        with metrics.stage("window_name"):
+            # The title is only re-read after a PropertyNotify said it changed
+            name = get_watcher().get_window_name(window, xlib.get_window_name)
 
-    window_info = {"app": cls, "title": name}
-    # Add virtual desktop info
-    desktop_info = get_virtual_desktop_info()
-    window_info.update(desktop_info)
-    
-    return window_info
+    with metrics.stage("desktop"):
+        desktop = get_virtual_desktop_info()["desktop"]
+    return WindowSample(
+        cls, name, desktop, window_id=window.id if window is not None else None
+    )
 
 
-def get_current_window_macos(strategy: str) -> Optional[dict]:
+def get_current_window_macos(strategy: str) -> Optional[WindowSample]:
     # TODO should we use unknown when the title is blank like the other platforms?
 
     # `jxa` is the default & preferred strategy. It includes the url + incognito status
     if strategy == "jxa":
         from . import macos_jxa
 
-        window_info = macos_jxa.getInfo()
+        get_info = macos_jxa.getInfo
     elif strategy == "applescript":
         from . import macos_applescript
 
-        window_info = macos_applescript.getInfo()
+        get_info = macos_applescript.getInfo
     else:
         raise FatalError(f"invalid strategy '{strategy}'")
-    
+
+    with metrics.stage("window"):
+        window_info = get_info()
+    if not window_info:
+        return None
     # Add virtual desktop info
-    if window_info:
-        desktop_info = get_virtual_desktop_info()
-        window_info.update(desktop_info)
-    
-    return window_info
+    with metrics.stage("desktop"):
+        window_info.update(get_virtual_desktop_info())
+    return WindowSample.from_dict(window_info)
 
 
-def get_current_window_windows() -> Optional[dict]:
+def get_current_window_windows() -> Optional[WindowSample]:
     from . import windows
 
-    window_handle = windows.get_active_window_handle()
-    try:
-        app = windows.get_app_name(window_handle)
-    except Exception:  # TODO: narrow down the exception
-        # try with wmi method
-        app = windows.get_app_name_wmi(window_handle)
+    with metrics.stage("window_id"):
+        window_handle = windows.get_active_window_handle()
+    with metrics.stage("window_class"):
+        try:
+            app = windows.get_app_name(window_handle)
+        except Exception:  # TODO: narrow down the exception
+            # try with wmi method
+            app = windows.get_app_name_wmi(window_handle)
 
-    title = windows.get_window_title(window_handle)
+    with metrics.stage("window_name"):
+        title = windows.get_window_title(window_handle)
 
     if app is None:
         app = "unknown"
     if title is None:
         title = "unknown"
 
-    window_info = {"app": app, "title": title}
-    # Add virtual desktop info
-    desktop_info = get_virtual_desktop_info()
-    window_info.update(desktop_info)
-    
-    return window_info
+    with metrics.stage("desktop"):
+        desktop = get_virtual_desktop_info()["desktop"]
+    return WindowSample(app, title, desktop)
 
 
-def get_current_window(strategy: Optional[str] = None) -> Optional[dict]:
+def get_current_window(strategy: Optional[str] = None) -> Optional[WindowSample]:
     """
     :raises FatalError: if a fatal error occurs (e.g. unsupported platform, X server closed)
     """
+    source = get_source(strategy)
+    if source is not None:
+        return source.get_current_window()
 
     if sys.platform.startswith("linux"):
-        return get_current_window_linux()
+        return get_current_window_linux(strategy)
     elif sys.platform == "darwin":
         if strategy is None:
             raise FatalError("macOS strategy not specified")
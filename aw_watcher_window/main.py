@@ -4,17 +4,21 @@ import re
 import signal
 import subprocess
 import sys
+import threading
 from datetime import datetime, timezone
-from time import sleep
-
-from aw_client import ActivityWatchClient
-from aw_core.log import setup_logging
-from aw_core.models import Event
+from time import monotonic
 
+from .attach import AttachState, Attacher, DeferredClient
 from .config import parse_args
 from .exceptions import FatalError
-from .lib import get_current_window
-from .macos_permissions import background_ensure_permissions
+from .heartbeat import EventBatcher, HeartbeatEmitter
+from .lib import get_current_window, get_source
+from .metrics import metrics, serve_metrics
+from .pipeline import SampleBuffer, Sender
+from .rules import RuleEngine, load_rules
+from .scheduler import AdaptiveInterval, Scheduler, SimulatedTime
+from .spool import Spool
+from .virtualdesktop import desktop_name_cache
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +36,17 @@ def kill_process(pid):
         logger.info("Process {} already dead".format(pid))
 
 
+def stop_on_sigterm(stop_event, mode):
+    """Sets `stop_event` on SIGTERM, waking up the loop if it's waiting for a window change."""
+
+    def stop(*_):
+        stop_event.set()
+        if mode == "events":
+            get_events_watcher().wake()
+
+    signal.signal(signal.SIGTERM, stop)
+
+
 def try_compile_title_regex(title):
     try:
         return re.compile(title, re.IGNORECASE)
@@ -40,14 +55,24 @@ def try_compile_title_regex(title):
         exit(1)
 
 
-def main():
-    args = parse_args()
+def try_load_rules(configs):
+    try:
+        return load_rules(configs)
+    except ValueError as e:
+        logger.error(f"Invalid rule: {e}")
+        exit(1)
+
 
-    if sys.platform.startswith("linux") and (
-        "DISPLAY" not in os.environ or not os.environ["DISPLAY"]
+def setup(args):
+    if (
+        sys.platform.startswith("linux")
+        and get_source(args.strategy) is None
+        and ("DISPLAY" not in os.environ or not os.environ["DISPLAY"])
     ):
         raise Exception("DISPLAY environment variable not set")
 
+    from aw_core.log import setup_logging
+
     setup_logging(
         name="aw-watcher-window",
         testing=args.testing,
@@ -57,22 +82,51 @@ def main():
     )
 
     if sys.platform == "darwin":
+        from .macos_permissions import background_ensure_permissions
+
         background_ensure_permissions()
 
+    desktop_name_cache.ttl = args.desktop_names_ttl
+
+    if args.metrics or args.metrics_port:
+        metrics.enable(log_interval=args.metrics_interval)
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+
+
+def main():
+    # aw_client pulls in requests, so it's only imported when the watcher runs
+    from aw_client import ActivityWatchClient
+    from aw_core.dirs import get_data_dir
+
+    args = parse_args()
+    setup(args)
+
     client = ActivityWatchClient(
         "aw-watcher-window", host=args.host, port=args.port, testing=args.testing
     )
 
     bucket_id = f"{client.client_name}_{client.client_hostname}"
     event_type = "currentwindow"
+    data_dir = get_data_dir("aw-watcher-window")
+    swift = sys.platform == "darwin" and args.strategy == "swift"
 
-    client.create_bucket(bucket_id, event_type, queued=True)
+    spool = None
+    if args.heartbeats == "batch" and args.spool:
+        # Replayed by the EventBatcher once aw-server is attached
+        spool = Spool(
+            os.path.join(data_dir, f"spool-{bucket_id}.bin"),
+            max_bytes=int(args.spool_size * (1 << 20)),
+        )
 
     logger.info("aw-watcher-window started")
-    client.wait_for_start()
+    if swift:
+        # The swift binary sends to aw-server itself
+        client.create_bucket(bucket_id, event_type, queued=True)
+        client.wait_for_start()
 
     with client:
-        if sys.platform == "darwin" and args.strategy == "swift":
+        if swift:
             logger.info("Using swift strategy, calling out to swift binary")
             binpath = os.path.join(
                 os.path.dirname(os.path.realpath(__file__)), "aw-watcher-window-macos"
@@ -95,70 +149,360 @@ def main():
                 print("KeyboardInterrupt")
                 kill_process(p.pid)
         else:
-            heartbeat_loop(
-                client,
-                bucket_id,
-                poll_time=args.poll_time,
-                strategy=args.strategy,
-                exclude_title=args.exclude_title,
-                exclude_titles=[
-                    try_compile_title_regex(title)
-                    for title in args.exclude_titles
-                    if title is not None
-                ],
+            # Stop at once on SIGTERM, sending what's left
+            stop_event = threading.Event()
+            stop_on_sigterm(stop_event, args.mode)
+            # Sample right away, and send once aw-server answers
+            state = AttachState(
+                os.path.join(data_dir, f"state-{bucket_id}.json"), client.server_address, bucket_id
             )
+            if state.last_event is not None:
+                logger.info(f"Last event was sent at {state.last_event['timestamp']}")
+            deferred = DeferredClient(client, bucket_id, event_type, state, max_events=args.backlog_size)
+            attacher = Attacher(deferred)
+            attacher.start()
+            register_attach_metrics(deferred, attacher)
+            try:
+                heartbeat_loop(
+                    deferred,
+                    bucket_id,
+                    poll_time=args.poll_time,
+                    strategy=args.strategy,
+                    mode=args.mode,
+                    keepalive_time=args.keepalive_time,
+                    heartbeats=args.heartbeats,
+                    batch_interval=args.batch_interval,
+                    batch_size=args.batch_size,
+                    spool=spool,
+                    threaded=args.threaded,
+                    buffer_size=args.buffer_size,
+                    schedule=args.schedule,
+                    stop_event=stop_event,
+                    adaptive=args.adaptive,
+                    poll_time_min=args.poll_time_min,
+                    poll_time_max=args.poll_time_max,
+                    exclude_title=args.exclude_title,
+                    exclude_titles=[
+                        try_compile_title_regex(title)
+                        for title in args.exclude_titles
+                        if title is not None
+                    ],
+                    rules=try_load_rules(args.rules),
+                )
+            finally:
+                attacher.stop()
+                deferred.close()
+
+    if spool is not None:
+        spool.close()
+
+
+async def async_main():
+    """
+    Runs the watcher as a coroutine, e.g. `asyncio.run(async_main())`.
+
+    Heartbeats go through an `aio.AsyncTransport` instead of aw_client, so
+    the swift strategy, the spool and --threaded don't apply.
+    """
+    from aw_client import ActivityWatchClient
+
+    from .aio import AsyncTransport, watch
+
+    args = parse_args()
+    setup(args)
+
+    client = ActivityWatchClient(
+        "aw-watcher-window", host=args.host, port=args.port, testing=args.testing
+    )
+    bucket_id = f"{client.client_name}_{client.client_hostname}"
+
+    async with AsyncTransport.from_address(client.server_address) as transport:
+        logger.info("aw-watcher-window started")
+        await transport.wait_for_start()
+        # Returns normally on aw-server's 304 for an existing bucket
+        await transport.create_bucket(
+            bucket_id, "currentwindow", client.client_name, client.client_hostname
+        )
+        await watch(
+            transport,
+            bucket_id,
+            poll_time=args.poll_time,
+            strategy=args.strategy,
+            mode=args.mode,
+            keepalive_time=args.keepalive_time,
+            heartbeats=args.heartbeats,
+            batch_interval=args.batch_interval,
+            batch_size=args.batch_size,
+            exclude_title=args.exclude_title,
+            exclude_titles=[
+                try_compile_title_regex(title)
+                for title in args.exclude_titles
+                if title is not None
+            ],
+            rules=try_load_rules(args.rules),
+        )
+
+
+def make_emitter(
+    client,
+    bucket_id,
+    poll_time,
+    event_driven=False,
+    keepalive_time=60.0,
+    heartbeats="every",
+    batch_interval=60.0,
+    batch_size=100,
+    spool=None,
+    clock=monotonic,
+):
+    # In events mode samples are only taken on changes and every keepalive_time
+    interval = keepalive_time if event_driven else poll_time
+    if heartbeats == "batch":
+        return EventBatcher(
+            client,
+            bucket_id,
+            interval=interval,
+            batch_interval=batch_interval,
+            batch_size=batch_size,
+            event_driven=event_driven,
+            clock=clock,
+            spool=spool,
+        )
+    return HeartbeatEmitter(
+        client,
+        bucket_id,
+        interval=interval,
+        keepalive_time=keepalive_time
+        if heartbeats == "changes" and not event_driven
+        else None,
+        event_driven=event_driven,
+    )
+
+
+def log_emitter_stats(emitter):
+    if isinstance(emitter, EventBatcher):
+        logger.info(
+            f"Inserted {emitter.sent} events from {emitter.samples} samples in {emitter.requests} requests"
+        )
+    else:
+        logger.info(
+            f"Sent {emitter.sent} heartbeats, suppressed {emitter.suppressed} unchanged samples"
+        )
+
+
+def register_metrics(emitter, engine):
+    if isinstance(emitter, EventBatcher):
+        metrics.register(
+            "emitter",
+            lambda: {
+                "events_inserted": emitter.sent,
+                "insert_requests": emitter.requests,
+                "events_pending": len(emitter.pending),
+                "spool_events": len(emitter.spool) if emitter.spool is not None else 0,
+            },
+            gauges=("events_pending", "spool_events"),
+        )
+    else:
+        metrics.register(
+            "emitter", lambda: {"heartbeats": emitter.sent, "heartbeats_suppressed": emitter.suppressed}
+        )
+    metrics.register(
+        "rules",
+        lambda: {"rule_cache_hits": engine.results.hits, "rule_evaluations": engine.evaluated},
+    )
+
+
+def register_attach_metrics(deferred, attacher):
+    metrics.register(
+        "attach",
+        lambda: {
+            "backlog_events": len(deferred.backlog),
+            "backlog_dropped": deferred.dropped,
+            "backlog_flushed": deferred.flushed,
+            "attach_attempts": attacher.attempts,
+        },
+        gauges=("backlog_events",),
+    )
+
+
+def log_rule_stats(engine):
+    if engine:
+        logger.info(f"Applied {engine.summary()}")
+
+
+def get_events_watcher():
+    if not sys.platform.startswith("linux"):
+        raise FatalError("events mode is only supported on Linux (X11)")
+    from .xevents import get_watcher
+
+    return get_watcher()
+
+
+def sample_window(strategy, exclude_title=False, engine=None):
+    """
+    Returns the current window with exclusions and rules applied, or None if it couldn't be fetched.
+
+    Raises FatalError or OSError if the watcher should stop.
+    """
+    metrics.count("samples")
+    current_window = None
+    try:
+        current_window = get_current_window(strategy)
+        logger.debug(current_window)
+    except (FatalError, OSError):
+        raise
+    except Exception:
+        # Non-fatal exceptions should be logged
+        #
+        # If stdout has been closed, this exception-print can cause (I think)
+        #   OSError: [Errno 5] Input/output error
+        # See: https://github.com/ActivityWatch/activitywatch/issues/756#issue-1296352264
+        #
+        # However, I'm unable to reproduce the OSError in a test (where I close stdout before logging),
+        # so I'm in uncharted waters here... but stopping on it should work.
+        metrics.count("exceptions")
+        logger.exception("Exception thrown while trying to get active window")
+
+    if current_window is None:
+        logger.debug("Unable to fetch window, trying again on next poll")
+        return None
+
+    if exclude_title:
+        current_window = current_window.with_title("excluded")
+    elif engine:
+        with metrics.stage("rules"):
+            current_window = engine.apply(current_window)
+
+    return current_window
 
 
 def heartbeat_loop(
-    client, bucket_id, poll_time, strategy, exclude_title=False, exclude_titles=[]
+    client,
+    bucket_id,
+    poll_time,
+    strategy,
+    exclude_title=False,
+    exclude_titles=[],
+    mode="poll",
+    keepalive_time=60.0,
+    heartbeats="every",
+    batch_interval=60.0,
+    batch_size=100,
+    spool=None,
+    threaded=False,
+    buffer_size=1024,
+    schedule="skip",
+    stop_event=None,
+    adaptive=False,
+    poll_time_min=0.5,
+    poll_time_max=10.0,
+    rules=[],
+    speedup=1.0,
 ):
-    while True:
-        if os.getppid() == 1:
-            logger.info("window-watcher stopped because parent process died")
-            break
-
-        current_window = None
-        try:
-            current_window = get_current_window(strategy)
-            logger.debug(current_window)
-        except (FatalError, OSError):
-            # Fatal exceptions should quit the program
-            try:
-                logger.exception("Fatal error, stopping")
-            except OSError:
-                pass
-            break
-        except Exception:
-            # Non-fatal exceptions should be logged
-            try:
-                # If stdout has been closed, this exception-print can cause (I think)
-                #   OSError: [Errno 5] Input/output error
-                # See: https://github.com/ActivityWatch/activitywatch/issues/756#issue-1296352264
-                #
-                # However, I'm unable to reproduce the OSError in a test (where I close stdout before logging),
-                # so I'm in uncharted waters here... but this solution should work.
-                logger.exception("Exception thrown while trying to get active window")
-            except OSError:
+    # Time runs `speedup` times faster, e.g. to replay a synthetic workload (poll mode only)
+    simulated = SimulatedTime(speedup) if speedup != 1.0 else None
+    clock = simulated.monotonic if simulated else monotonic
+
+    watcher = get_events_watcher() if mode == "events" else None
+    engine = RuleEngine(rules, exclude_titles)
+    emitter = make_emitter(
+        client,
+        bucket_id,
+        poll_time,
+        event_driven=watcher is not None,
+        keepalive_time=keepalive_time,
+        heartbeats=heartbeats,
+        batch_interval=batch_interval,
+        batch_size=batch_size,
+        spool=spool,
+        clock=clock,
+    )
+
+    register_metrics(emitter, engine)
+
+    sender = None
+    if threaded:
+        # Sample on schedule here and send from another thread,
+        # so a slow server doesn't delay the next sample
+        buffer = SampleBuffer(buffer_size, max_gap=lambda: emitter.pulsetime)
+        sender = Sender(buffer, emitter)
+        sender.start()
+        send = buffer.put
+    else:
+        send = emitter.emit
+
+    scheduler = None
+    interval = None
+    if watcher is None:
+        if adaptive:
+            interval = AdaptiveInterval(poll_time_min, poll_time_max)
+        scheduler = Scheduler(
+            interval.current if interval else poll_time,
+            policy=schedule,
+            clock=clock,
+            stop_event=stop_event,
+            speedup=speedup,
+        )
+
+    last_window = None
+
+    # However the loop ends, also by an exception or KeyboardInterrupt,
+    # the samples suppressed or batched so far are still sent
+    try:
+        while True:
+            if scheduler is not None:
+                if not scheduler.wait():
+                    logger.info("window-watcher stopped")
+                    break
+                # Merge samples that are as far apart as the ticks have recently been
+                emitter.interval = scheduler.period
+                emitter.slack = scheduler.slack
+            elif stop_event is not None and stop_event.is_set():
+                logger.info("window-watcher stopped")
                 break
 
-        if current_window is None:
-            logger.debug("Unable to fetch window, trying again on next poll")
-        else:
-            for pattern in exclude_titles:
-                if pattern.search(current_window["title"]):
-                    current_window["title"] = "excluded"
+            if os.getppid() == 1:
+                logger.info("window-watcher stopped because parent process died")
+                break
 
-            if exclude_title:
-                current_window["title"] = "excluded"
+            now = simulated.now() if simulated else datetime.now(timezone.utc)
+            try:
+                with metrics.stage("sample"):
+                    current_window = sample_window(strategy, exclude_title, engine)
+            except (FatalError, OSError):
+                # Fatal exceptions should quit the program
+                try:
+                    logger.exception("Fatal error, stopping")
+                except OSError:
+                    pass
+                break
+
+            if current_window is not None:
+                with metrics.stage("send"):
+                    send(current_window, now)
+                if interval is not None:
+                    # Poll faster while windows are switched, slower while they aren't
+                    scheduler.period = interval.update(current_window != last_window)
+                last_window = current_window
 
-            now = datetime.now(timezone.utc)
-            current_window_event = Event(timestamp=now, data=current_window)
+            metrics.maybe_log()
 
-            # Set pulsetime to 1 second more than the poll_time
-            # This since the loop takes more time than poll_time
-            # due to sleep(poll_time).
-            client.heartbeat(
-                bucket_id, current_window_event, pulsetime=poll_time + 1.0, queued=True
+            if watcher is not None:
+                watcher.wait(keepalive_time)
+    finally:
+        if scheduler is not None:
+            logger.info(
+                f"Ran {scheduler.ticks} ticks, skipped {scheduler.skipped}, lateness {scheduler.lateness.summary()}"
+            )
+            logger.info(
+                f"Woke up {scheduler.wakeups_per_hour():.0f} times per hour, polling every {poll_time}s would be {3600 / poll_time:.0f}"
             )
 
-        sleep(poll_time)
+        if sender is not None:
+            sender.stop()
+            logger.info(
+                f"Sample buffer reached a depth of {buffer.max_depth}, coalesced {buffer.coalesced} and dropped {buffer.dropped} samples"
+            )
+        emitter.flush()
+        log_emitter_stats(emitter)
+        log_rule_stats(engine)
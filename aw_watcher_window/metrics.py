@@ -0,0 +1,178 @@
+"""
+Opt-in timings and counters for the sampling hot path.
+
+Each step of taking a sample is wrapped in `metrics.stage(name)`, which
+times it into a `Histogram` per stage. While metrics are disabled, the
+default, `stage` returns a shared no-op context manager and `count` returns
+right away, so instrumented code costs about a method call per step.
+
+Counters the watcher keeps anyway (heartbeats sent, cache hits, X
+round-trips) are not counted twice: their owners register a collector
+that reads them when metrics are reported. Collectors can also report
+gauges, values like a queue's length that go down as well as up. Reports are a one-line summary
+logged every `log_interval` seconds, and optionally Prometheus' text format
+served on localhost by `serve_metrics`.
+"""
+import logging
+import threading
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING, Callable, Collection, Dict, List, Mapping, Set
+
+from .stats import Histogram
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "aw_watcher_window"
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_no_stage = _NoStage()
+
+
+class _Stage:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self) -> None:
+        self.start = perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(perf_counter() - self.start)
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.log_interval = 300.0
+        self.stages: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self._collectors: Dict[str, Callable[[], Mapping[str, float]]] = {}
+        # Collector key -> the names of its values that are gauges
+        self._gauges: Dict[str, Collection[str]] = {}
+        self._logged_at = monotonic()
+
+    def enable(self, log_interval: float = 300.0) -> None:
+        self.enabled = True
+        self.log_interval = log_interval
+        self._logged_at = monotonic()
+
+    def stage(self, name: str):
+        """Context manager timing one step of a sample as `name`."""
+        if not self.enabled:
+            return _no_stage
+        histogram = self.stages.get(name)
+        if histogram is None:
+            histogram = self.stages[name] = Histogram()
+        return _Stage(histogram)
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def register(
+        self, key: str, collector: Callable[[], Mapping[str, float]], gauges: Collection[str] = ()
+    ) -> None:
+        """
+        Adds counters read from `collector` when reporting, replacing the
+        collector registered before under `key`. The values named in
+        `gauges` are gauges instead of counters.
+        """
+        self._collectors[key] = collector
+        self._gauges[key] = frozenset(gauges)
+
+    def gauges(self) -> Set[str]:
+        """The names of the values that are gauges."""
+        return {name for names in list(self._gauges.values()) for name in names}
+
+    def values(self) -> Dict[str, float]:
+        values: Dict[str, float] = dict(self.counters)
+        for key, collector in list(self._collectors.items()):
+            try:
+                values.update(collector())
+            except Exception:
+                logger.exception(f"Failed to collect {key} metrics")
+        return values
+
+    def summary(self) -> str:
+        counters = " ".join(f"{name}={value}" for name, value in sorted(self.values().items()))
+        stages = ", ".join(
+            f"{name} p50={h.quantile(0.5) * 1000:.1f}ms p99={h.quantile(0.99) * 1000:.1f}ms"
+            for name, h in self.stages.items()
+        )
+        return f"{counters}; {stages}" if stages else counters
+
+    def maybe_log(self) -> None:
+        """Logs the summary if `log_interval` seconds passed since it was last logged."""
+        if self.enabled and monotonic() - self._logged_at >= self.log_interval:
+            self._logged_at = monotonic()
+            logger.info(f"Metrics: {self.summary()}")
+
+    def render(self) -> str:
+        """The metrics in Prometheus' text exposition format."""
+        lines: List[str] = []
+        name = f"{PREFIX}_stage_seconds"
+        if self.stages:
+            lines.append(f"# TYPE {name} histogram")
+        for stage, h in list(self.stages.items()):
+            cumulative = 0
+            for bound, count in zip(h.bounds, h.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound!r}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {h.sum!r}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {h.count}')
+        gauges = self.gauges()
+        for counter, value in sorted(self.values().items()):
+            if counter in gauges:
+                lines.append(f"# TYPE {PREFIX}_{counter} gauge")
+                lines.append(f"{PREFIX}_{counter} {value}")
+            else:
+                lines.append(f"# TYPE {PREFIX}_{counter}_total counter")
+                lines.append(f"{PREFIX}_{counter}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+    """Serves `metrics` at http://`host`:`port`/metrics from a daemon thread."""
+    # Only needed with --metrics-port, and slow to import
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="aw-watcher-window-metrics", daemon=True
+    ).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,126 @@
+"""
+Decouples sampling the active window from sending it to aw-server.
+
+The sampler (the main loop) timestamps each sample and puts it into a
+bounded `SampleBuffer`; a `Sender` thread takes samples out and hands them
+to an emitter. A slow server then only makes the buffer deeper instead of
+delaying the next sample.
+"""
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Deque, List, NamedTuple, Optional
+
+from .sample import Sample
+
+logger = logging.getLogger(__name__)
+
+
+class SampleRun(NamedTuple):
+    """Identical consecutive samples, taken from `start` to `end`."""
+
+    data: Sample
+    start: datetime
+    end: datetime
+
+
+class SampleBuffer:
+    """
+    A bounded, thread-safe FIFO of sample runs.
+
+    When full, the oldest two adjacent runs with the same data (no more than
+    `max_gap()` seconds apart) are coalesced into one. If there are none, the
+    oldest run is dropped. `max_gap` is called each time, so it can follow
+    an emitter's pulsetime as that changes.
+    """
+
+    def __init__(self, maxsize: int = 1024, max_gap: Optional[Callable[[], float]] = None) -> None:
+        self.maxsize = maxsize
+        self.max_gap = max_gap
+        self.coalesced = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._runs: Deque[SampleRun] = deque()
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def depth(self) -> int:
+        return len(self._runs)
+
+    def _coalesce(self) -> bool:
+        runs = self._runs
+        max_gap = None if self.max_gap is None else timedelta(seconds=self.max_gap())
+        for i in range(len(runs) - 1):
+            first, second = runs[i], runs[i + 1]
+            if first.data != second.data:
+                continue
+            if max_gap is not None and second.start - first.end > max_gap:
+                continue
+            runs[i] = first._replace(end=second.end)
+            del runs[i + 1]
+            self.coalesced += 1
+            return True
+        return False
+
+    def put(self, data: Sample, timestamp: datetime) -> None:
+        with self._cond:
+            if len(self._runs) >= self.maxsize and not self._coalesce():
+                self._runs.popleft()
+                self.dropped += 1
+            self._runs.append(SampleRun(data, timestamp, timestamp))
+            self.max_depth = max(self.max_depth, len(self._runs))
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[SampleRun]:
+        """Takes the oldest run, waiting up to `timeout` for one. None if there's none or the buffer is closed and empty."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._runs or self._closed, timeout)
+            if not self._runs:
+                return None
+            return self._runs.popleft()
+
+    def drain(self) -> List[SampleRun]:
+        with self._cond:
+            runs = list(self._runs)
+            self._runs.clear()
+            return runs
+
+    def close(self) -> None:
+        """Wakes up waiting consumers. Runs still buffered can be taken out."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+
+class Sender(threading.Thread):
+    """Takes sample runs out of `buffer` and passes them to `emitter` until the buffer is closed."""
+
+    def __init__(self, buffer: SampleBuffer, emitter) -> None:
+        super().__init__(name="aw-watcher-window-sender", daemon=True)
+        self.buffer = buffer
+        self.emitter = emitter
+        self.errors = 0
+
+    def run(self) -> None:
+        while True:
+            run = self.buffer.get()
+            if run is None:
+                if self.buffer.closed:
+                    return
+                continue
+            try:
+                self.emitter.emit(run.data, run.start, until=run.end)
+            except Exception:
+                self.errors += 1
+                logger.exception("Exception thrown while sending a sample")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Sends what's left in the buffer and stops."""
+        self.buffer.close()
+        self.join(timeout)
@@ -0,0 +1,183 @@
+"""
+Title rewrite and redaction rules, configured in the `[aw-watcher-window]` section:
+
+    [[aw-watcher-window.rules]]
+    app = "soffice*"                # exact name, glob, or app_regex = "..."
+    title = '^(.*) - (\\w+)\\.odt'  # regex the title must match, default any
+    action = "rewrite"              # "exclude", "rewrite" or "hash"
+    replace = "\\2 document"        # for rewrite, may use the title's groups
+    desktop = "Work"                # only on this desktop (glob), default any
+
+Rules are indexed by app, so a sample only evaluates the rules that can
+apply to its app: exact names first, then globs, then regexes, then rules
+for any app. Among those, rules for the sample's desktop come first, and
+the first rule whose title regex matches is applied. The `--exclude-titles`
+patterns are checked before any rule, against the original title, so a
+title they match is excluded whatever the rules would have made of it.
+"""
+import hashlib
+import re
+from fnmatch import fnmatchcase
+from time import perf_counter
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Pattern, Sequence, Tuple
+
+from .cache import LRUCache
+from .exclusion import TitleExcluder
+from .sample import WindowSample
+from .stats import Histogram
+
+ACTIONS = ("exclude", "rewrite", "hash")
+
+_glob_chars = set("*?[")
+
+
+class Rule(NamedTuple):
+    action: str
+    title: Optional[Pattern]
+    replace: str = ""
+    desktop: Optional[str] = None
+    app: Optional[str] = None
+    app_regex: Optional[Pattern] = None
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> "Rule":
+        """Builds a rule from its TOML table, raising ValueError if it's invalid."""
+        unknown = set(config) - {"app", "app_regex", "title", "action", "replace", "desktop"}
+        if unknown:
+            raise ValueError(f"Unknown rule keys: {', '.join(sorted(unknown))}")
+        action = config.get("action", "exclude")
+        if action not in ACTIONS:
+            raise ValueError(f"Rule action must be one of {', '.join(ACTIONS)}, not {action!r}")
+        if action == "rewrite" and "replace" not in config:
+            raise ValueError("Rewrite rules need a replace template")
+        if "app" in config and "app_regex" in config:
+            raise ValueError("Rules can have either app or app_regex")
+        try:
+            title = re.compile(config["title"], re.IGNORECASE) if "title" in config else None
+            app_regex = re.compile(config["app_regex"]) if "app_regex" in config else None
+        except re.error as e:
+            raise ValueError(f"Invalid regex in rule: {e}")
+        return cls(
+            action=action,
+            title=title,
+            replace=config.get("replace", ""),
+            desktop=config.get("desktop"),
+            app=config.get("app"),
+            app_regex=app_regex,
+        )
+
+    def apply(self, title: str, desktop: str) -> Optional[str]:
+        """The rewritten title, or None if the rule doesn't apply."""
+        if self.desktop is not None and not fnmatchcase(desktop, self.desktop):
+            return None
+        match = None
+        if self.title is not None:
+            match = self.title.search(title)
+            if match is None:
+                return None
+        if self.action == "exclude":
+            return "excluded"
+        if self.action == "hash":
+            return "sha256:" + hashlib.sha256(title.encode("utf-8")).hexdigest()[:16]
+        return match.expand(self.replace) if match else self.replace
+
+
+class RuleEngine:
+    """Applies `rules` and the `exclude_titles` patterns to window titles."""
+
+    def __init__(
+        self, rules: Sequence[Rule] = (), exclude_titles: Sequence[Pattern] = (), cache_size: int = 1024
+    ) -> None:
+        self.rules = list(rules)
+        self.excluder = TitleExcluder(exclude_titles)
+
+        self._exact: Dict[str, List[Rule]] = {}
+        self._globs: List[Rule] = []
+        self._regexes: List[Rule] = []
+        self._any_app: List[Rule] = []
+        for rule in self.rules:
+            if rule.app_regex is not None:
+                self._regexes.append(rule)
+            elif rule.app is None:
+                self._any_app.append(rule)
+            elif _glob_chars & set(rule.app):
+                self._globs.append(rule)
+            else:
+                self._exact.setdefault(rule.app, []).append(rule)
+
+        # app -> the rules that can apply to it, in order
+        self._by_app: LRUCache[str, List[Rule]] = LRUCache(256)
+        # (app, desktop, title) -> rewritten title
+        self.results: LRUCache[Tuple[str, str, str], str] = LRUCache(cache_size)
+        self._last: Optional[Tuple[str, str, str]] = None
+        self._last_result = ""
+
+        self.samples = 0
+        # Rules whose title regex was run
+        self.evaluated = 0
+        self.timings = Histogram()
+
+    def __bool__(self) -> bool:
+        return bool(self.rules) or bool(self.excluder)
+
+    def rules_for(self, app: str) -> List[Rule]:
+        rules = self._by_app.get(app)
+        if rules is None:
+            rules = (
+                self._exact.get(app, [])
+                + [rule for rule in self._globs if rule.app is not None and fnmatchcase(app, rule.app)]
+                + [rule for rule in self._regexes if rule.app_regex is not None and rule.app_regex.search(app)]
+                + self._any_app
+            )
+            self._by_app.put(app, rules)
+        return rules
+
+    def _evaluate(self, app: str, desktop: str, title: str) -> str:
+        # Exclusion wins, even if a rule would rewrite the title into one it doesn't match
+        if self.excluder and self.excluder.excluded(title):
+            return "excluded"
+        rules = self.rules_for(app)
+        # Rules for this desktop override the others
+        for specific in (True, False):
+            for rule in rules:
+                if (rule.desktop is not None) != specific:
+                    continue
+                self.evaluated += 1
+                result = rule.apply(title, desktop)
+                if result is not None:
+                    return result
+        return title
+
+    def apply(self, sample: WindowSample) -> WindowSample:
+        """The sample with its title rewritten, the same sample if no rule changed it."""
+        start = perf_counter()
+        key = (sample.app, sample.desktop, sample.title)
+        if key == self._last:
+            result = self._last_result
+        else:
+            cached = self.results.get(key)
+            if cached is None:
+                cached = self._evaluate(*key)
+                self.results.put(key, cached)
+            result = cached
+            self._last, self._last_result = key, result
+        sample = sample.with_title(result)
+        self.samples += 1
+        self.timings.observe(perf_counter() - start)
+        return sample
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.rules)} rules and {len(self.excluder.patterns)} exclusion patterns,"
+            f" {self.evaluated} rule evaluations for {self.samples} samples, {self.timings.summary()}"
+        )
+
+
+def load_rules(configs: Sequence[Mapping[str, Any]]) -> List[Rule]:
+    rules = []
+    for i, config in enumerate(configs):
+        try:
+            rules.append(Rule.from_config(config))
+        except ValueError as e:
+            raise ValueError(f"Rule {i + 1}: {e}")
+    return rules
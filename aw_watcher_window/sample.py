@@ -0,0 +1,102 @@
+"""
+The active window as sampled by the watcher.
+
+A `WindowSample` is immutable and only turned into the dict stored as an
+event's data when a heartbeat or event is sent. App and desktop names are
+interned, so the samples of a long session share a handful of strings;
+titles are not, as they can change endlessly (clocks, counters) and would
+then stay interned for good.
+"""
+import sys
+from typing import Any, Dict, Optional, Tuple, Union
+
+
+class WindowSample:
+    """
+    One sample of the active window.
+
+    Samples are equal when they would be stored as the same event data, the
+    `window_id` and `pid` of the window they were taken from don't count.
+    `extra` holds further data some backends report, e.g. the URL on macOS.
+    """
+
+    __slots__ = ("app", "title", "desktop", "window_id", "pid", "extra", "_key")
+
+    app: str
+    title: str
+    desktop: str
+    window_id: Optional[int]
+    pid: Optional[int]
+    extra: Tuple[Tuple[str, Any], ...]
+    # What equality and the hash are based on
+    _key: Tuple[str, str, str, Tuple[Tuple[str, Any], ...]]
+
+    def __init__(
+        self,
+        app: str,
+        title: str,
+        desktop: str = "unknown",
+        window_id: Optional[int] = None,
+        pid: Optional[int] = None,
+        extra: Tuple[Tuple[str, Any], ...] = (),
+    ) -> None:
+        app = sys.intern(app)
+        desktop = sys.intern(desktop)
+        _set = object.__setattr__
+        _set(self, "app", app)
+        _set(self, "title", title)
+        _set(self, "desktop", desktop)
+        _set(self, "window_id", window_id)
+        _set(self, "pid", pid)
+        _set(self, "extra", extra)
+        _set(self, "_key", (app, title, desktop, extra))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "WindowSample":
+        data = dict(data)
+        app = data.pop("app", "unknown")
+        title = data.pop("title", "unknown")
+        desktop = data.pop("desktop", "unknown")
+        return cls(app, title, desktop, extra=tuple(sorted(data.items())))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, WindowSample):
+            return self is other or self._key == other._key
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    def __repr__(self) -> str:
+        return (
+            f"WindowSample(app={self.app!r}, title={self.title!r}, desktop={self.desktop!r},"
+            f" window_id={self.window_id!r}, pid={self.pid!r})"
+        )
+
+    def with_title(self, title: str) -> "WindowSample":
+        if title == self.title:
+            return self
+        return WindowSample(self.app, title, self.desktop, self.window_id, self.pid, self.extra)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"app": self.app, "title": self.title, "desktop": self.desktop}
+        data.update(self.extra)
+        return data
+
+
+# What emitters accept: they compare samples as they are, and only build the
+# event data when sending
+Sample = Union[WindowSample, Dict[str, Any]]
+
+
+def to_data(sample: Sample) -> Dict[str, Any]:
+    """Event data for `sample`, which may also be a plain dict already."""
+    if isinstance(sample, WindowSample):
+        return sample.to_dict()
+    return sample
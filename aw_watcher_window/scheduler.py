@@ -0,0 +1,146 @@
+"""
+Deadline-based scheduling for the polling loop.
+
+Sleeping `poll_time` after each sample makes the real period `poll_time`
+plus however long sampling and sending took, so the loop drifts. The
+`Scheduler` instead wakes up at fixed deadlines on the monotonic clock and
+measures how late each wake-up was. The period can be changed between
+ticks, e.g. by an `AdaptiveInterval`.
+"""
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from time import monotonic
+from typing import Callable, Deque, Optional
+
+from .stats import Histogram
+
+POLICIES = ("skip", "catch-up")
+
+
+class Scheduler:
+    """
+    Wakes up every `period` seconds.
+
+    If a tick is missed entirely because the previous iteration overran,
+    the "skip" policy drops it and waits for the next deadline, while
+    "catch-up" runs the missed ticks right away. `stop()` ends the current
+    or next wait immediately, from a signal handler or another thread.
+
+    With a `clock` that runs `speedup` times faster than real time, e.g.
+    `SimulatedTime.monotonic`, waits are shortened to match.
+    """
+
+    def __init__(
+        self,
+        period: float,
+        policy: str = "skip",
+        clock: Callable[[], float] = monotonic,
+        stop_event: Optional[threading.Event] = None,
+        window: int = 64,
+        speedup: float = 1.0,
+    ) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        self.period = period
+        self.policy = policy
+        self.clock = clock
+        self.speedup = speedup
+        self.ticks = 0
+        self.skipped = 0
+        # How long after its deadline each tick started
+        self.lateness = Histogram()
+
+        self._stop = stop_event or threading.Event()
+        self._started: Optional[float] = None
+        self._deadline: Optional[float] = None
+        # Lateness of recent ticks
+        self._recent: Deque[float] = deque(maxlen=window)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    @property
+    def slack(self) -> float:
+        """
+        How much longer than `period` recent ticks may have been apart:
+        the worst recent lateness, plus a margin of a tenth of the period.
+        """
+        return max(self._recent, default=0.0) + self.period / 10
+
+    def wakeups_per_hour(self) -> float:
+        if self._started is None:
+            return 0.0
+        elapsed = self.clock() - self._started
+        return self.ticks / elapsed * 3600 if elapsed > 0 else 0.0
+
+    def wait(self) -> bool:
+        """Waits for the next tick. Returns False if the scheduler was stopped instead."""
+        now = self.clock()
+        if self._deadline is None:
+            self._deadline = self._started = now
+        else:
+            self._deadline += self.period
+            behind = now - self._deadline
+            if self.policy == "skip" and behind >= self.period:
+                missed = int(behind // self.period)
+                self._deadline += missed * self.period
+                self.skipped += missed
+
+        delay = self._deadline - now
+        if delay > 0:
+            self._stop.wait(delay / self.speedup)
+        if self._stop.is_set():
+            return False
+
+        late = max(self.clock() - self._deadline, 0.0)
+        self.lateness.observe(late)
+        self._recent.append(late)
+        self.ticks += 1
+        return True
+
+
+class SimulatedTime:
+    """Monotonic and wall-clock time that run `speedup` times faster than real time from now on."""
+
+    def __init__(self, speedup: float) -> None:
+        self.speedup = speedup
+        self._start = monotonic()
+        self._start_wall = datetime.now(timezone.utc)
+
+    def elapsed(self) -> float:
+        return (monotonic() - self._start) * self.speedup
+
+    def monotonic(self) -> float:
+        return self._start + self.elapsed()
+
+    def now(self) -> datetime:
+        return self._start_wall + timedelta(seconds=self.elapsed())
+
+
+class AdaptiveInterval:
+    """
+    A poll interval that follows how often the sampled data changes.
+
+    It drops to `minimum` after a change and grows by `factor` with every
+    sample that didn't change, up to `maximum`.
+    """
+
+    def __init__(self, minimum: float, maximum: float, factor: float = 2.0) -> None:
+        if not 0 < minimum <= maximum:
+            raise ValueError("Adaptive poll interval needs 0 < minimum <= maximum")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.current = minimum
+
+    def update(self, changed: bool) -> float:
+        if changed:
+            self.current = self.minimum
+        else:
+            self.current = min(self.current * self.factor, self.maximum)
+        return self.current
@@ -0,0 +1,257 @@
+"""
+Append-only on-disk spool for events that haven't reached aw-server yet.
+
+The spool is a file of fixed-size records, each holding one event as JSON
+behind a small header with its length and CRC32. Appends are fsynced in
+batches, and replay reads the file through mmap and inserts the events in
+large batches. How far replay got is kept in a separate head file, so the
+spool survives restarts, and a record cut short by a crash is detected by
+its size or checksum and dropped when the spool is opened.
+
+Compaction copies the records still waiting to a new file that replaces the
+spool. The head file holds the inode of the spool file it was written for,
+so a head left over from before a compaction is recognised and the new
+file is replayed from its start.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from typing import TYPE_CHECKING, BinaryIO, Iterator, List
+
+if TYPE_CHECKING:
+    from aw_core.models import Event
+
+logger = logging.getLogger(__name__)
+
+RECORD_SIZE = 1024
+MAGIC = b"AWSP"
+# magic, payload length, payload crc32
+HEADER = struct.Struct("<4sII")
+MAX_PAYLOAD = RECORD_SIZE - HEADER.size
+# index of the first record waiting, inode of the spool file
+HEAD = struct.Struct("<QQ")
+
+
+def _dump(data: dict) -> bytes:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def encode_record(event: "Event") -> bytes:
+    data = event.to_json_dict()
+    payload = _dump(data)
+    if len(payload) > MAX_PAYLOAD:
+        logger.warning(f"Cutting a {len(payload)} byte event short to fit a spool record")
+    while len(payload) > MAX_PAYLOAD and data["data"].get("title"):
+        # Only the title can get this long, cut it to fit
+        title = data["data"]["title"].encode("utf-8")
+        cut = len(title) - (len(payload) - MAX_PAYLOAD)
+        data["data"]["title"] = title[: max(cut, 0)].decode("utf-8", errors="ignore")
+        payload = _dump(data)
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError("Event too large for a spool record")
+    header = HEADER.pack(MAGIC, len(payload), zlib.crc32(payload))
+    return header + payload + bytes(MAX_PAYLOAD - len(payload))
+
+
+def decode_record(record: bytes) -> "Event":
+    """Decodes a record written by `encode_record`, raising ValueError if it's damaged."""
+    magic, length, crc = HEADER.unpack_from(record)
+    if magic != MAGIC or length > MAX_PAYLOAD:
+        raise ValueError("Not a spool record")
+    payload = record[HEADER.size : HEADER.size + length]
+    if zlib.crc32(payload) != crc:
+        raise ValueError("Spool record checksum mismatch")
+    from aw_core.models import Event
+
+    return Event(**json.loads(payload))
+
+
+class Spool:
+    """
+    Events waiting to be inserted, stored in `path` and bounded to `max_bytes`.
+
+    When the spool is full the oldest tenth of it is dropped to make room.
+    `fsync_every` appends are written before the file is fsynced, `sync()`
+    fsyncs the rest.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 16 << 20, fsync_every: int = 64) -> None:
+        self.path = path
+        self.head_path = path + ".head"
+        self.max_records = max(max_bytes // RECORD_SIZE, 1)
+        self.fsync_every = fsync_every
+        self.appended = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.fsyncs = 0
+
+        # Index of the first record that hasn't been inserted yet, and of the next record to write
+        self.head = 0
+        self.tail = 0
+        self._unsynced = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = self._open()
+        self._recover()
+
+    def _open(self) -> BinaryIO:
+        # Unbuffered, so what's written is in the file before it's fsynced
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o600)
+        return os.fdopen(fd, "r+b", buffering=0)
+
+    def __len__(self) -> int:
+        return self.tail - self.head
+
+    def _recover(self) -> None:
+        size = os.fstat(self._file.fileno()).st_size
+        self.tail = size // RECORD_SIZE
+        self.head = min(self._read_head(), self.tail)
+
+        # Drop a record that was only partly written, or whose bytes never hit the disk
+        valid = self.head
+        for _ in self._records(self.head, self.tail, stop_at_damage=True):
+            valid += 1
+        if valid < self.tail or size % RECORD_SIZE:
+            logger.warning(
+                f"Dropping {self.tail - valid} damaged records from the end of the spool at {self.path}"
+            )
+            self._file.truncate(valid * RECORD_SIZE)
+            self.tail = valid
+
+    def _records(self, start: int, end: int, stop_at_damage: bool = False) -> Iterator["Event"]:
+        if start >= end:
+            return
+        with mmap.mmap(self._file.fileno(), end * RECORD_SIZE, access=mmap.ACCESS_READ) as buf:
+            for index in range(start, end):
+                offset = index * RECORD_SIZE
+                try:
+                    yield decode_record(buf[offset : offset + RECORD_SIZE])
+                except ValueError:
+                    if stop_at_damage:
+                        return
+                    logger.warning(f"Skipping damaged record {index} in the spool at {self.path}")
+
+    def _read_head(self) -> int:
+        try:
+            with open(self.head_path, "rb") as f:
+                head, inode = HEAD.unpack(f.read(HEAD.size))
+        except (OSError, struct.error):
+            return 0
+        if inode != os.fstat(self._file.fileno()).st_ino:
+            # Written before the spool was compacted, the new file starts at that head
+            return 0
+        return head
+
+    def _write_head(self) -> None:
+        tmp_path = self.head_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEAD.pack(self.head, os.fstat(self._file.fileno()).st_ino))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.head_path)
+        self.fsyncs += 1
+
+    def _sync_dir(self) -> None:
+        if os.name == "nt":
+            # Directories can't be opened on Windows, and renames are durable there
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _compact(self) -> None:
+        """
+        Replaces the spool with a file of only the records that are still waiting.
+
+        A crash before the new file replaces the old one leaves the old file
+        and head, and one after it the new file with a head that's ignored.
+        """
+        if self.head == 0:
+            return
+        remaining = self.tail - self.head
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            if remaining:
+                with mmap.mmap(self._file.fileno(), self.tail * RECORD_SIZE, access=mmap.ACCESS_READ) as buf:
+                    f.write(buf[self.head * RECORD_SIZE :])
+            f.flush()
+            os.fsync(f.fileno())
+        # Windows can't replace a file that's open
+        self._file.close()
+        try:
+            os.replace(tmp_path, self.path)
+        finally:
+            self._file = self._open()
+        self._sync_dir()
+        self.fsyncs += 2
+        self.head, self.tail = 0, remaining
+        self._write_head()
+
+    def _make_room(self) -> None:
+        if self.tail < self.max_records:
+            return
+        waiting = self.tail - self.head
+        if waiting >= self.max_records:
+            drop = max(self.max_records // 10, 1)
+            logger.warning(f"Spool at {self.path} is full, dropping the {drop} oldest events")
+            self.head += drop
+            self.dropped += drop
+        self._compact()
+
+    def append(self, event: "Event") -> None:
+        self._make_room()
+        record = encode_record(event)
+        self._file.seek(self.tail * RECORD_SIZE)
+        self._file.write(record)
+        self.tail += 1
+        self.appended += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+
+    def extend(self, events: List["Event"]) -> None:
+        for event in events:
+            self.append(event)
+        self.sync()
+
+    def sync(self) -> None:
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+            self._unsynced = 0
+
+    def drain(self, client, bucket_id: str, batch_size: int = 1000) -> int:
+        """
+        Inserts the spooled events into `bucket_id`, `batch_size` at a time.
+
+        Stops at the first batch that fails to insert, leaving it spooled.
+        Returns the number of events inserted.
+        """
+        self.sync()
+        inserted = 0
+        while self.head < self.tail:
+            end = min(self.head + batch_size, self.tail)
+            events = list(self._records(self.head, end))
+            try:
+                if events:
+                    client.insert_events(bucket_id, events)
+            except OSError as e:
+                # Includes requests' RequestException
+                logger.warning(f"Failed to replay spooled events, {len(self)} left: {e}")
+                break
+            inserted += len(events)
+            self.replayed += len(events)
+            self.head = end
+            self._write_head()
+
+        if self.head and self.head == self.tail:
+            self._compact()
+        return inserted
+
+    def close(self) -> None:
+        self.sync()
+        self._file.close()
@@ -0,0 +1,48 @@
+"""
+Cheap fixed-bucket histograms for timings on the sampling hot path.
+"""
+from bisect import bisect_left
+from typing import List, Sequence
+
+# Upper bounds in seconds, from half a millisecond to 5 seconds
+DEFAULT_BOUNDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Counts observations into buckets with the given upper bounds, plus one for anything larger."""
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BOUNDS) -> None:
+        self.bounds = tuple(bounds)
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile, the maximum if that's the last one."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> str:
+        return (
+            f"n={self.count} mean={self.mean * 1000:.1f}ms p50={self.quantile(0.5) * 1000:.1f}ms"
+            f" p99={self.quantile(0.99) * 1000:.1f}ms max={self.max * 1000:.1f}ms"
+        )
@@ -0,0 +1,122 @@
+"""
+A synthetic window source, for load and soak testing without a display.
+
+It plays a reproducible switching workload. Apps are picked from a Zipf
+distribution, so a few are active most of the time. The active app moves
+between its titles now and then, mostly ones seen before, sometimes a new
+one (an unread counter, a new document). The desktop flips occasionally,
+and short bursts of rapid switching, like alt-tabbing, break up the calm
+stretches. All choices come from one seeded `random.Random`, so a seed
+always gives the same sequence of samples.
+
+Use it with `--strategy synthetic`, or register a configured one with
+`lib.register_source("synthetic", SyntheticSource(...))`.
+"""
+import random
+from itertools import accumulate
+from typing import List
+
+from .sample import WindowSample
+
+APP_NAMES = [
+    "Firefox", "Code", "Slack", "Terminal", "Thunderbird", "LibreOffice", "Spotify",
+    "Zoom", "Nautilus", "Evince", "GIMP", "Inkscape", "Signal", "Obsidian", "Chromium",
+]
+WORDS = ["report", "invoice", "meeting", "draft", "budget", "notes", "design", "review", "plan", "todo"]
+
+
+def _zipf_weights(count: int, exponent: float) -> List[float]:
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+class SyntheticSource:
+    """
+    Generates one sample per `get_current_window()` call.
+
+    Probabilities are per sample: `switch` to change app (`burst_switch`
+    during a burst), `title_churn` to change title within the app, of which
+    `new_title` are titles never seen before, `desktop_flip` to change desktop
+    and `burst_start` to start a burst of `burst_length` samples.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        apps: int = 40,
+        titles: int = 50,
+        desktops: int = 4,
+        zipf: float = 1.2,
+        switch: float = 0.02,
+        title_churn: float = 0.05,
+        new_title: float = 0.1,
+        desktop_flip: float = 0.005,
+        burst_start: float = 0.002,
+        burst_switch: float = 0.5,
+        burst_length: int = 10,
+    ) -> None:
+        self.random = random.Random(seed)
+        self.switch = switch
+        self.title_churn = title_churn
+        self.new_title = new_title
+        self.desktop_flip = desktop_flip
+        self.burst_start = burst_start
+        self.burst_switch = burst_switch
+        self.burst_length = burst_length
+        self.samples = 0
+        self.changes = 0
+        self.bursts = 0
+
+        self.apps = [
+            APP_NAMES[i] if i < len(APP_NAMES) else f"{APP_NAMES[i % len(APP_NAMES)]}-{i}"
+            for i in range(apps)
+        ]
+        self.titles = titles
+        self.desktops = [f"Desktop {i + 1}" for i in range(desktops)]
+        self._app_weights = _zipf_weights(apps, zipf)
+        self._title_weights = _zipf_weights(titles, zipf)
+
+        self._app = 0
+        self._title = self._known_title(0)
+        self._desktop = 0
+        self._burst_left = 0
+        self._unique = 0
+
+    def _known_title(self, app: int) -> str:
+        [index] = self.random.choices(range(self.titles), cum_weights=self._title_weights)
+        return f"{WORDS[index % len(WORDS)]}-{index}.txt - {self.apps[app]}"
+
+    def _next_title(self, app: int) -> str:
+        if self.random.random() < self.new_title:
+            self._unique += 1
+            return f"({self._unique}) Inbox - {self.apps[app]}"
+        return self._known_title(app)
+
+    def get_current_window(self) -> WindowSample:
+        rand = self.random.random
+        self.samples += 1
+
+        if self._burst_left:
+            self._burst_left -= 1
+            switch = self.burst_switch
+        else:
+            if rand() < self.burst_start:
+                self._burst_left = self.burst_length
+                self.bursts += 1
+            switch = self.switch
+
+        changed = False
+        if rand() < switch:
+            [self._app] = self.random.choices(range(len(self.apps)), cum_weights=self._app_weights)
+            self._title = self._next_title(self._app)
+            changed = True
+        elif rand() < self.title_churn:
+            self._title = self._next_title(self._app)
+            changed = True
+        if rand() < self.desktop_flip:
+            self._desktop = self.random.randrange(len(self.desktops))
+            changed = True
+        if changed:
+            self.changes += 1
+
+        # A fresh sample every time, like a real backend
+        return WindowSample(self.apps[self._app], self._title, self.desktops[self._desktop])
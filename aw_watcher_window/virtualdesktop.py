@@ -3,7 +3,10 @@ Virtual Desktop information retrieval for different platforms
 """
 import sys
 import logging
-from typing import Optional, Dict
+from time import monotonic
+from typing import Optional, Dict, List
+
+from .metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -81,6 +84,116 @@ def get_virtual_desktop_windows() -> Dict[str, str]:
         return {"desktop": "Desktop 1"}
 
 
+def parse_desktop_names(value: bytes) -> List[str]:
+    """Decodes the null-separated _NET_DESKTOP_NAMES property value."""
+    if not value:
+        return []
+    names = value.decode('utf-8', errors='ignore').split('\x00')
+    return [n for n in names if n]  # Remove empty strings
+
+
+def desktop_name(current: int, names: List[str]) -> str:
+    """Name of desktop number `current` (-1 if unknown), falling back to its number."""
+    if current < 0:
+        return "Desktop 1"
+    if current < len(names) and names[current]:
+        return names[current]
+    # Fallback to desktop number
+    return f"Desktop {current + 1}"
+
+
+class DesktopNameCache:
+    """
+    Caches the decoded _NET_DESKTOP_NAMES list and the _NET_CURRENT_DESKTOP index on Linux (X11).
+
+    While the root window is watched for PropertyNotify (events mode) both are
+    only re-read after they changed. In polling mode the index is read on every
+    sample and the names are re-read every `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self.names: Optional[List[str]] = None
+        # -1 when the window manager doesn't set _NET_CURRENT_DESKTOP
+        self.current: Optional[int] = None
+        self.name_reads = 0
+        self.current_reads = 0
+        self._names_read_at = 0.0
+        self._watcher = None
+        self._connects = 0
+
+    def invalidate_names(self) -> None:
+        self.names = None
+
+    def invalidate_current(self) -> None:
+        self.current = None
+
+    def _bind(self, watcher) -> None:
+        if self._watcher is watcher:
+            return
+        watcher.on_root_change("_NET_DESKTOP_NAMES", self.invalidate_names)
+        watcher.on_root_change("_NET_NUMBER_OF_DESKTOPS", self.invalidate_names)
+        watcher.on_root_change("_NET_CURRENT_DESKTOP", self.invalidate_current)
+        self._watcher = watcher
+
+    def _read_current(self, connection) -> int:
+        import Xlib.X
+
+        self.current_reads += 1
+        current_desktop = connection.root.get_full_property(
+            connection.atom('_NET_CURRENT_DESKTOP'),
+            Xlib.X.AnyPropertyType
+        )
+        return current_desktop.value[0] if current_desktop else -1
+
+    def _read_names(self, connection) -> List[str]:
+        import Xlib.X
+
+        self.name_reads += 1
+        desktop_names = connection.root.get_full_property(
+            connection.atom('_NET_DESKTOP_NAMES'),
+            Xlib.X.AnyPropertyType
+        )
+        if not desktop_names:
+            return []
+        return parse_desktop_names(desktop_names.value)
+
+    def get_desktop_name(self, connection, watcher) -> str:
+        self._bind(watcher)
+        if self._connects != connection.connects:
+            # Anything could have changed while we were disconnected
+            self.invalidate_names()
+            self.invalidate_current()
+            self._connects = connection.connects
+
+        # Apply invalidations from PropertyNotify events that already arrived
+        watcher.poll()
+        event_driven = watcher.watching_root
+
+        if self.current is None or not event_driven:
+            self.current = self._read_current(connection)
+        if self.current < 0:
+            return desktop_name(self.current, [])
+
+        if self.names is None or (
+            not event_driven and monotonic() - self._names_read_at >= self.ttl
+        ):
+            self.names = self._read_names(connection)
+            self._names_read_at = monotonic()
+
+        return desktop_name(self.current, self.names)
+
+
+desktop_name_cache = DesktopNameCache()
+metrics.register(
+    "desktop_names",
+    lambda: {
+        "desktop_name_reads": desktop_name_cache.name_reads,
+        "desktop_current_reads": desktop_name_cache.current_reads,
+    },
+)
+
+
 def get_virtual_desktop_linux() -> Dict[str, str]:
     """Get workspace name on Linux (X11)"""
     try:
@@ -89,41 +202,12 @@ def get_virtual_desktop_linux() -> Dict[str, str]:
         if not os.environ.get('DISPLAY'):
             logger.debug("No DISPLAY environment variable, using default desktop")
             return {"desktop": "Desktop 1"}
-            
-        from . import xlib
-        import Xlib.display
-        
-        display = Xlib.display.Display()
-        root = display.screen().root
-        
-        # Get current desktop number
-        current_desktop = root.get_full_property(
-            display.intern_atom('_NET_CURRENT_DESKTOP'),
-            Xlib.X.AnyPropertyType
-        )
-        
-        if current_desktop:
-            desktop_num = current_desktop.value[0]
-            
-            # Try to get desktop names
-            desktop_names = root.get_full_property(
-                display.intern_atom('_NET_DESKTOP_NAMES'),
-                Xlib.X.AnyPropertyType
-            )
-            
-            if desktop_names and desktop_names.value:
-                # Parse null-terminated strings
-                names = desktop_names.value.decode('utf-8', errors='ignore').split('\x00')
-                names = [n for n in names if n]  # Remove empty strings
-                
-                if desktop_num < len(names) and names[desktop_num]:
-                    return {"desktop": names[desktop_num]}
-            
-            # Fallback to desktop number
-            return {"desktop": f"Desktop {desktop_num + 1}"}
-        
-        return {"desktop": "Desktop 1"}
-        
+
+        from .xconnection import get_connection
+        from .xevents import get_watcher
+
+        return {"desktop": desktop_name_cache.get_desktop_name(get_connection(), get_watcher())}
+
     except Exception as e:
         logger.debug(f"Linux virtual desktop detection failed: {e}")
         return {"desktop": "unknown"}
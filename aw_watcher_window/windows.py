@@ -46,7 +46,15 @@ def get_active_window_handle():
 
 # WMI-version, used as fallback if win32gui/win32process/win32api fails (such as for "run as admin" processes)
 
-c = wmi.WMI()
+_wmi = None
+
+
+def get_wmi():
+    """Returns the WMI connection, opened on first use since that takes a while."""
+    global _wmi
+    if _wmi is None:
+        _wmi = wmi.WMI()
+    return _wmi
 
 """
 Much of this derived from: http://stackoverflow.com/a/14973422/965332
@@ -57,7 +65,7 @@ def get_app_name_wmi(hwnd) -> Optional[str]:
     """Get application filename given hwnd."""
     name = None
     _, pid = win32process.GetWindowThreadProcessId(hwnd)
-    for p in c.query("SELECT Name FROM Win32_Process WHERE ProcessId = %s" % str(pid)):
+    for p in get_wmi().query("SELECT Name FROM Win32_Process WHERE ProcessId = %s" % str(pid)):
         name = p.Name
         break
     return name
@@ -68,7 +76,7 @@ def get_app_path_wmi(hwnd) -> Optional[str]:
     path = None
 
     _, pid = win32process.GetWindowThreadProcessId(hwnd)
-    for p in c.query(
+    for p in get_wmi().query(
         "SELECT ExecutablePath FROM Win32_Process WHERE ProcessId = %s" % str(pid)
     ):
         path = p.ExecutablePath
@@ -0,0 +1,124 @@
+"""
+Shared, long-lived X11 connection for the Linux backends.
+
+Opening a display is expensive (socket connect, setup handshake and a handful
+of extension queries), so `xlib` and `virtualdesktop` share one connection and
+look atoms up in a table that is filled once per connection.
+"""
+import logging
+from typing import Dict, Optional
+
+import Xlib.display
+import Xlib.error
+from Xlib.protocol import request
+
+logger = logging.getLogger(__name__)
+
+# Every atom the watcher asks the X server about, interned once per connection.
+EWMH_ATOMS = (
+    "_NET_ACTIVE_WINDOW",
+    "_NET_CLIENT_LIST",
+    "_NET_CURRENT_DESKTOP",
+    "_NET_DESKTOP_NAMES",
+    "_NET_NUMBER_OF_DESKTOPS",
+    "_NET_WM_NAME",
+    "_NET_WM_PID",
+    "UTF8_STRING",
+)
+
+
+class XConnection:
+    """Owns one Xlib display and the atoms interned on it.
+
+    The display is opened on first use and can be reopened with `reconnect()`
+    after the X server dropped the connection.
+    """
+
+    def __init__(self, display_name: Optional[str] = None) -> None:
+        self.display_name = display_name
+        self.atoms: Dict[str, int] = {}
+        # Number of times the display has been (re)opened
+        self.connects = 0
+        # Number of times the client blocked waiting for a reply from the server
+        self.roundtrips = 0
+        self._display: Optional[Xlib.display.Display] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._display is not None
+
+    @property
+    def display(self) -> Xlib.display.Display:
+        if self._display is None:
+            self.connect()
+        assert self._display is not None
+        return self._display
+
+    @property
+    def root(self):
+        return self.display.screen().root
+
+    def atom(self, name: str) -> int:
+        """Returns the atom for `name`, interning it if it's not in the table."""
+        display = self.display
+        if name not in self.atoms:
+            self.atoms[name] = display.intern_atom(name)
+        return self.atoms[name]
+
+    def connect(self) -> None:
+        display = Xlib.display.Display(self.display_name)
+        self._count_roundtrips(display)
+
+        # Send all InternAtom requests before reading any reply,
+        # so the whole table costs a single round-trip.
+        pending = [
+            (name, request.InternAtom(display=display.display, defer=1, name=name, only_if_exists=0))
+            for name in EWMH_ATOMS
+        ]
+        self.atoms = {}
+        for name, req in pending:
+            req.reply()
+            self.atoms[name] = req.atom
+
+        self._display = display
+        self.connects += 1
+        logger.debug(f"Connected to X display {display.get_display_name()}")
+
+    def close(self) -> None:
+        if self._display is None:
+            return
+        display, self._display = self._display, None
+        try:
+            display.close()
+        except (Xlib.error.ConnectionClosedError, OSError):
+            # The server is already gone, nothing left to clean up
+            pass
+
+    def reconnect(self) -> None:
+        logger.info("Reconnecting to X display")
+        self.close()
+        self.connect()
+
+    def _count_roundtrips(self, display: Xlib.display.Display) -> None:
+        # Replies are waited for through send_and_recv(request=serial),
+        # which is only called while the reply hasn't been received yet.
+        protocol_display = display.display
+        send_and_recv = protocol_display.send_and_recv
+
+        def counting_send_and_recv(*args, **kwargs):
+            if kwargs.get("request") is not None:
+                self.roundtrips += 1
+            return send_and_recv(*args, **kwargs)
+
+        protocol_display.send_and_recv = counting_send_and_recv
+
+
+_connection: Optional[XConnection] = None
+
+
+def get_connection() -> XConnection:
+    """Returns the process-wide X connection."""
+    global _connection
+    if _connection is None:
+        _connection = XConnection()
+    return _connection
@@ -0,0 +1,259 @@
+"""
+Event-driven change detection for X11.
+
+Instead of sampling on a fixed interval, select PropertyChangeMask on the root
+window and block on the display fd until the active window or the current
+desktop changes.
+
+The focused window is subscribed to as well, so title changes are reported
+as events and its title only has to be re-read after it actually changed.
+Windows whose properties are cached elsewhere can be tracked to learn when
+they are destroyed.
+"""
+import logging
+import os
+import select
+from time import monotonic
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import Xlib.error
+from Xlib import X
+from Xlib.xobject.drawable import Window
+
+from .exceptions import FatalError
+from .xconnection import XConnection, get_connection
+
+logger = logging.getLogger(__name__)
+
+# Root window properties that mean the focused window or the desktop changed
+ROOT_ATOMS = ("_NET_ACTIVE_WINDOW", "_NET_CURRENT_DESKTOP")
+
+# Properties of the focused window that hold its title
+TITLE_ATOMS = ("_NET_WM_NAME", "WM_NAME")
+
+
+class PropertyWatcher:
+    """Waits for PropertyNotify events on the root window and the focused window."""
+
+    def __init__(
+        self,
+        connection: Optional[XConnection] = None,
+        root_atoms: Iterable[str] = ROOT_ATOMS,
+    ) -> None:
+        self.connection = connection or get_connection()
+        self.root_atoms = tuple(root_atoms)
+        self.events = 0
+        # Title reads answered from the cache vs. read from the server
+        self.title_hits = 0
+        self.title_misses = 0
+
+        self.focused_window: Optional[int] = None
+        self._title: Optional[str] = None
+        # Root property name -> callbacks run when it changes
+        self._root_listeners: Dict[str, List[Callable[[], None]]] = {}
+        # Windows we want DestroyNotify for, and who to tell
+        self._tracked: Set[int] = set()
+        self._destroy_listeners: List[Callable[[int], None]] = []
+        # connection.connects at the time of subscribing, a reconnect drops our event masks
+        self._root_connects = 0
+        self._window_connects = 0
+        # Written to by wake(), so a signal handler can end a wait
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+
+    def _subscribe_root(self) -> None:
+        root = self.connection.root
+        if self._root_connects == self.connection.connects:
+            return
+        root.change_attributes(event_mask=X.PropertyChangeMask)
+        self.connection.display.flush()
+        self._root_connects = self.connection.connects
+        logger.debug("Subscribed to PropertyNotify on the root window")
+
+    @property
+    def watching_root(self) -> bool:
+        """Whether root PropertyNotify events are currently being delivered to us."""
+        return self.connection.connected and self._root_connects == self.connection.connects
+
+    def on_root_change(self, name: str, callback: Callable[[], None]) -> None:
+        """Runs `callback` whenever the root window property `name` changes (while watching the root)."""
+        self._root_listeners.setdefault(name, []).append(callback)
+
+    def on_destroy(self, callback: Callable[[int], None]) -> None:
+        """Runs `callback(window_id)` when a tracked or the focused window is destroyed."""
+        self._destroy_listeners.append(callback)
+
+    def _sync_windows(self) -> None:
+        if self._window_connects != self.connection.connects:
+            # The window subscriptions died with the old connection
+            self.focused_window = None
+            self._tracked.clear()
+            self._window_connects = self.connection.connects
+
+    def _update_event_mask(self, window_id: int) -> None:
+        event_mask = X.NoEventMask
+        if window_id == self.focused_window:
+            event_mask |= X.PropertyChangeMask | X.StructureNotifyMask
+        if window_id in self._tracked:
+            event_mask |= X.StructureNotifyMask
+        window = self.connection.display.create_resource_object("window", window_id)
+        # The window may be gone already, which is fine either way
+        window.change_attributes(
+            event_mask=event_mask, onerror=Xlib.error.CatchError(Xlib.error.BadWindow)
+        )
+
+    def track(self, window_id: int) -> None:
+        """Starts listening for DestroyNotify on `window_id`."""
+        self._sync_windows()
+        if window_id in self._tracked:
+            return
+        self._tracked.add(window_id)
+        self._update_event_mask(window_id)
+        self.connection.display.flush()
+
+    def untrack(self, window_id: int) -> None:
+        if window_id not in self._tracked:
+            return
+        self._tracked.discard(window_id)
+        if self.connection.connected:
+            self._update_event_mask(window_id)
+
+    def follow(self, window: Window) -> None:
+        """Moves the title subscription to `window`, dropping the one on the previously focused window."""
+        self._sync_windows()
+        if window.id == self.focused_window:
+            return
+
+        previous, self.focused_window = self.focused_window, window.id
+        if previous is not None:
+            self._update_event_mask(previous)
+        self._update_event_mask(window.id)
+        self.connection.display.flush()
+
+        self._title = None
+
+    def get_window_name(self, window: Window, fetch: Callable[[Window], str]) -> str:
+        """
+        Returns the title of `window`, calling `fetch` only if it's not cached
+        or a PropertyNotify said it changed since it was last read.
+        """
+        self.follow(window)
+        self.poll()
+        if self._title is None:
+            self.title_misses += 1
+            self._title = fetch(window)
+        else:
+            self.title_hits += 1
+        return self._title
+
+    def _drain(self) -> List[Tuple[int, str]]:
+        display = self.connection.display
+        root_id = self.connection.root.id
+        root_atoms = {
+            self.connection.atom(name): name
+            for name in set(self.root_atoms) | set(self._root_listeners)
+        }
+        title_atoms = {self.connection.atom(name): name for name in TITLE_ATOMS}
+
+        changes = []
+        while display.pending_events():
+            event = display.next_event()
+            self.events += 1
+            if event.type == X.DestroyNotify:
+                self._destroyed(event.window.id)
+                continue
+            if event.type != X.PropertyNotify:
+                continue
+            window_id = event.window.id
+            if window_id == root_id and event.atom in root_atoms:
+                name = root_atoms[event.atom]
+                for callback in self._root_listeners.get(name, []):
+                    callback()
+                changes.append((root_id, name))
+            elif window_id == self.focused_window and event.atom in title_atoms:
+                self._title = None
+                changes.append((window_id, title_atoms[event.atom]))
+        return changes
+
+    def _destroyed(self, window_id: int) -> None:
+        self._tracked.discard(window_id)
+        if window_id == self.focused_window:
+            self.focused_window = None
+            self._title = None
+        for callback in self._destroy_listeners:
+            callback(window_id)
+
+    def fileno(self) -> int:
+        """
+        Subscribes to root window changes and returns the display fd, for waiting in an event loop.
+
+        Events that were already read from the fd are not signalled by it again,
+        so call `wait(0)` before waiting on it.
+        """
+        self._subscribe_root()
+        return self.connection.display.fileno()
+
+    def poll(self) -> List[Tuple[int, str]]:
+        """Handles the events that have already arrived, without blocking."""
+        return self._drain()
+
+    def wait(self, timeout: float) -> List[Tuple[int, str]]:
+        """
+        Blocks until a watched property changes, `timeout` seconds have passed or `wake` is called.
+
+        Returns the changes as (window id, atom name) pairs, empty on timeout.
+        """
+        try:
+            return self._wait(timeout)
+        except Xlib.error.ConnectionClosedError:
+            try:
+                self.connection.reconnect()
+            except Xlib.error.DisplayError:
+                raise FatalError("X server closed connection")
+            # We may have missed changes while disconnected
+            return [(self.connection.root.id, name) for name in self.root_atoms]
+
+    def wake(self) -> None:
+        """Makes a running or the next `wait` return right away. Safe to call from a signal handler."""
+        try:
+            os.write(self._wake_write, b"\0")
+        except BlockingIOError:
+            # Plenty of wake-ups are pending already
+            pass
+
+    def _woken(self) -> bool:
+        woken = False
+        try:
+            while os.read(self._wake_read, 512):
+                woken = True
+        except BlockingIOError:
+            pass
+        return woken
+
+    def _wait(self, timeout: float) -> List[Tuple[int, str]]:
+        self._subscribe_root()
+        deadline = monotonic() + timeout
+        while True:
+            changes = self._drain()
+            if changes:
+                return changes
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return []
+            readable, _, _ = select.select(
+                [self.connection.display.fileno(), self._wake_read], [], [], remaining
+            )
+            if not readable or self._woken():
+                return []
+
+
+_watcher: Optional[PropertyWatcher] = None
+
+
+def get_watcher() -> PropertyWatcher:
+    """Returns the process-wide watcher on the shared X connection."""
+    global _watcher
+    if _watcher is None:
+        _watcher = PropertyWatcher()
+    return _watcher
@@ -1,25 +1,40 @@
 import logging
-from typing import Optional
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar
 
 import Xlib
-import Xlib.display
-from Xlib import X
+import Xlib.error
+from Xlib import X, Xatom
+from Xlib.protocol import request
 from Xlib.xobject.drawable import Window
 
+from .cache import ExpiringSet, LRUCache
 from .exceptions import FatalError
+from .metrics import metrics
+from .virtualdesktop import parse_desktop_names
+from .xconnection import get_connection
+from .xevents import get_watcher
 
 logger = logging.getLogger(__name__)
 
-display = Xlib.display.Display()
-screen = display.screen()
+# Opened on the first request, so importing this module doesn't need a display
+connection = get_connection()
 
-NET_WM_NAME = display.intern_atom("_NET_WM_NAME")
-UTF8_STRING = display.intern_atom("UTF8_STRING")
+T = TypeVar("T")
+
+# Some WMs leave the id of a closed window in _NET_ACTIVE_WINDOW for a while.
+# Ids that turned out to be invalid are remembered this long (in seconds) and
+# reported as "unknown" without asking the X server again.
+DEAD_WINDOW_TTL = 5.0
+dead_windows: ExpiringSet[int] = ExpiringSet(ttl=DEAD_WINDOW_TTL)
+
+# Length (in 32-bit units) asked for in one GetProperty, enough for any title or
+# desktop name list, so that no property needs a second request.
+PROPERTY_LENGTH = 1 << 16
 
 
 def _get_current_window_id() -> Optional[int]:
-    atom = display.get_atom("_NET_ACTIVE_WINDOW")
-    window_prop = screen.root.get_full_property(atom, X.AnyPropertyType)
+    atom = connection.atom("_NET_ACTIVE_WINDOW")
+    window_prop = connection.root.get_full_property(atom, X.AnyPropertyType)
 
     if window_prop is None:
         logger.warning("window_prop was None")
@@ -32,27 +47,37 @@ def _get_current_window_id() -> Optional[int]:
 
 
 def _get_window(window_id: int) -> Window:
-    return display.create_resource_object("window", window_id)
+    return connection.display.create_resource_object("window", window_id)
+
+
+def _with_reconnect(fetch: Callable[[], T]) -> T:
+    try:
+        return fetch()
+    except Xlib.error.ConnectionClosedError:
+        # The connection may have been dropped while the server is still around,
+        # so try once with a fresh one before giving up.
+        try:
+            connection.reconnect()
+            return fetch()
+        except (Xlib.error.ConnectionClosedError, Xlib.error.DisplayError):
+            # when the X server closes the connection, we should exit
+            # note that stdio is probably closed at this point, so we can't print anything (causes OSError)
+            try:
+                logger.warning("X server closed connection, exiting")
+            except OSError:
+                pass
+            raise FatalError()
 
 
 def get_current_window() -> Optional[Window]:
     """
     Returns the current window, or None if no window is active.
     """
-    try:
-        window_id = _get_current_window_id()
-        if window_id is None:
-            return None
-        else:
-            return _get_window(window_id)
-    except Xlib.error.ConnectionClosedError:
-        # when the X server closes the connection, we should exit
-        # note that stdio is probably closed at this point, so we can't print anything (causes OSError)
-        try:
-            logger.warning("X server closed connection, exiting")
-        except OSError:
-            pass
-        raise FatalError()
+    window_id = _with_reconnect(_get_current_window_id)
+    if window_id is None or window_id in dead_windows:
+        return None
+    else:
+        return _get_window(window_id)
 
 
 # Things that can lead to unknown cls/name:
@@ -64,7 +89,13 @@ def get_window_name(window: Window) -> str:
     """After some annoying debugging I resorted to pretty much copying selfspy.
     Source: https://github.com/gurgeh/selfspy/blob/8a34597f81000b3a1be12f8cde092a40604e49cf/selfspy/sniff_x.py#L165"""
     try:
-        d = window.get_full_property(NET_WM_NAME, UTF8_STRING)
+        d = window.get_full_property(
+            connection.atom("_NET_WM_NAME"), connection.atom("UTF8_STRING")
+        )
+    except Xlib.error.BadWindow:
+        # The window is gone, WM_NAME won't be any better
+        _window_died(window.id)
+        return "unknown"
     except Xlib.error.XError as e:
         logger.warning(
             f"Unable to get window property NET_WM_NAME, got a {type(e).__name__} exception from Xlib"
@@ -84,6 +115,7 @@ def get_window_name(window: Window) -> str:
                 )
                 return r.decode("latin1")  # WM_NAME with type=STRING.
         except Xlib.error.BadWindow as e:
+            _window_died(window.id)
             # I comment on the log, the number of messages that pop up is very annoying
             # Also, it does not give much information about the error
             # But I leave it in case someone sees it useful
@@ -106,21 +138,60 @@ def get_window_name(window: Window) -> str:
                 return d.value.encode("utf8").decode("utf8", "ignore")
 
 
-def get_window_class(window: Window) -> str:
+class WindowClass(NamedTuple):
+    cls: str
+    # The window WM_CLASS was read from: the window itself or the ancestor it was found on
+    toplevel: int
+
+
+def _evict_class(window_id: int, entry: Optional[WindowClass] = None) -> None:
+    get_watcher().untrack(window_id)
+
+
+# A window's class doesn't change during its lifetime, so it's resolved once per window id.
+# Entries are dropped when the window is destroyed (DestroyNotify) or found to be gone (BadWindow).
+class_cache: LRUCache[int, WindowClass] = LRUCache(maxsize=256, on_evict=_evict_class)
+_class_cache_connects = 0
+
+
+def _forget_window(window_id: int) -> None:
+    class_cache.pop(window_id)
+    get_watcher().untrack(window_id)
+
+
+def _window_died(window_id: int) -> None:
+    _forget_window(window_id)
+    dead_windows.add(window_id)
+
+
+get_watcher().on_destroy(_window_died)
+metrics.register(
+    "xlib",
+    lambda: {
+        "class_cache_hits": class_cache.hits,
+        "class_cache_misses": class_cache.misses,
+        "dead_window_hits": dead_windows.hits,
+        "x_roundtrips": connection.roundtrips,
+    },
+)
+
+
+def _resolve_window_class(window: Window) -> Optional[WindowClass]:
     cls = None
 
     try:
         cls = window.get_wm_class()
     except Xlib.error.BadWindow:
-        logger.warning("Unable to get window class, got a BadWindow exception.")
+        logger.debug("Unable to get window class, got a BadWindow exception.")
+        _window_died(window.id)
+        return None
 
     # TODO: Is this needed?
     # nikanar: Indeed, it seems that it is. But it would be interesting to see how often this succeeds, and if it is low, maybe fail earlier.
     if not cls:
-        print("")
-        logger.warning("Code made an unclear branch")
+        logger.debug("No WM_CLASS on window, looking at its parent")
         try:
-            window = window.query_tree().parent
+            parent = window.query_tree().parent
         except Xlib.error.BadWindow:
             # I comment on the log, the number of messages that pop up is very annoying
             # Also, it does not give much information about the error
@@ -128,23 +199,182 @@ def get_window_class(window: Window) -> str:
             # logger.warning(
             #     "Unable to get window query_tree().parent, got a BadWindow exception."
             # )
-            return "unknown"
+            _window_died(window.id)
+            return None
         except Xlib.error.XError as e:
             logger.warning(
                 f"Unable to get window query_tree().parent, got a {type(e).__name__} exception from Xlib"
             )
-            return "unknown"
-        if window:
-            return get_window_class(window)
+            return None
+        if parent:
+            return _resolve_window_class(parent)
         else:
-            return "unknown"
+            return None
+
+    return WindowClass(cls[1], window.id)
+
+
+def resolve_window_class(window: Window) -> Optional[WindowClass]:
+    """
+    Returns the class of `window` and the window it was read from, or None if it can't be resolved.
+
+    Results are cached per window id, so only the first lookup for a window talks to the X server.
+    """
+    global _class_cache_connects
+
+    watcher = get_watcher()
+    # Apply DestroyNotify evictions that already arrived
+    watcher.poll()
+    if _class_cache_connects != connection.connects:
+        # Subscriptions don't survive a reconnect, so we'd miss DestroyNotify for cached windows
+        class_cache.clear()
+        _class_cache_connects = connection.connects
+
+    entry = class_cache.get(window.id)
+    if entry is None:
+        entry = _resolve_window_class(window)
+        # Failures aren't cached, the window may not have its WM_CLASS set yet
+        if entry is not None:
+            class_cache.put(window.id, entry)
+            watcher.track(window.id)
+    return entry
+
+
+def get_window_class(window: Window) -> str:
+    entry = resolve_window_class(window)
+    return entry.cls if entry is not None else "unknown"
+
+
+class WindowSnapshot(NamedTuple):
+    """Everything a sample needs from the X server, fetched in one burst of requests."""
+
+    window_id: Optional[int]
+    app: str
+    title: str
+    pid: Optional[int]
+    # -1 when the window manager doesn't set _NET_CURRENT_DESKTOP
+    desktop: int
+    desktop_names: List[str]
+
+
+# The window focused at the last snapshot, its properties are requested
+# together with the root properties on the guess that focus didn't move.
+_last_snapshot_window: Optional[int] = None
+
+
+def _request_property(
+    window_id: int, atom: int, property_type: int = X.AnyPropertyType
+) -> request.GetProperty:
+    # defer=1 sends the request without waiting for its reply
+    return request.GetProperty(
+        display=connection.display.display,
+        defer=1,
+        delete=0,
+        window=window_id,
+        property=atom,
+        type=property_type,
+        long_offset=0,
+        long_length=PROPERTY_LENGTH,
+    )
+
+
+def _property_reply(req: request.GetProperty) -> Optional[Tuple[int, int, Any]]:
+    """
+    Waits for a deferred GetProperty, returning (type, format, value) or None if the property is missing.
+
+    The value is bytes for format 8 and a sequence of ints otherwise.
+    """
+    req.reply()
+    if not req.property_type:
+        return None
+    fmt, value = req.value
+    return req.property_type, fmt, value
+
+
+def _request_window_properties(window_id: int) -> Dict[str, request.GetProperty]:
+    return {
+        "class": _request_property(window_id, Xatom.WM_CLASS, Xatom.STRING),
+        "net_wm_name": _request_property(
+            window_id, connection.atom("_NET_WM_NAME"), connection.atom("UTF8_STRING")
+        ),
+        "wm_name": _request_property(window_id, Xatom.WM_NAME),
+        "pid": _request_property(window_id, connection.atom("_NET_WM_PID"), Xatom.CARDINAL),
+    }
 
-    cls = cls[1]
-    return cls
+
+def _decode_title(net_wm_name, wm_name) -> str:
+    # Same preference as get_window_name: _NET_WM_NAME (UTF-8), then WM_NAME
+    if net_wm_name is not None and net_wm_name[1] == 8:
+        return net_wm_name[2].decode("utf8", "ignore")
+    if wm_name is not None and wm_name[1] == 8:
+        property_type, _, value = wm_name
+        encoding = "utf8" if property_type == connection.atom("UTF8_STRING") else "latin1"
+        return value.decode(encoding, "ignore")
+    return "unknown"
+
+
+def _get_snapshot() -> WindowSnapshot:
+    global _last_snapshot_window
+
+    root_id = connection.root.id
+
+    active_req = _request_property(root_id, connection.atom("_NET_ACTIVE_WINDOW"))
+    current_req = _request_property(root_id, connection.atom("_NET_CURRENT_DESKTOP"))
+    names_req = _request_property(root_id, connection.atom("_NET_DESKTOP_NAMES"))
+    guess = _last_snapshot_window
+    window_reqs = _request_window_properties(guess) if guess else None
+
+    active = _property_reply(active_req)
+    window_id = active[2][0] if active and len(active[2]) > 0 else 0
+    if not window_id or window_id in dead_windows:
+        window_id, window_reqs = None, None
+    elif window_id != guess:
+        # Focus moved, this costs a second round-trip
+        window_reqs = _request_window_properties(window_id)
+    _last_snapshot_window = window_id
+
+    current = _property_reply(current_req)
+    names = _property_reply(names_req)
+    desktop = current[2][0] if current and len(current[2]) > 0 else -1
+    desktop_names = parse_desktop_names(names[2]) if names and names[1] == 8 else []
+
+    if window_id is None or window_reqs is None:
+        return WindowSnapshot(None, "unknown", "unknown", None, desktop, desktop_names)
+
+    try:
+        replies = {key: _property_reply(req) for key, req in window_reqs.items()}
+    except Xlib.error.BadWindow:
+        _window_died(window_id)
+        _last_snapshot_window = None
+        return WindowSnapshot(None, "unknown", "unknown", None, desktop, desktop_names)
+
+    parts = replies["class"][2].split(b"\0") if replies["class"] else []
+    if len(parts) >= 2 and parts[1]:
+        app = parts[1].decode("latin1")
+    else:
+        # No WM_CLASS on the window itself, walk up the tree the slow way
+        app = get_window_class(_get_window(window_id))
+
+    title = _decode_title(replies["net_wm_name"], replies["wm_name"])
+    pid_reply = replies["pid"]
+    pid = pid_reply[2][-1] if pid_reply and len(pid_reply[2]) > 0 else None
+
+    return WindowSnapshot(window_id, app, title, pid, desktop, desktop_names)
+
+
+def get_snapshot() -> WindowSnapshot:
+    """
+    Returns the focused window and desktop in one go.
+
+    All GetProperty requests are sent before any reply is read, so this costs
+    one round-trip to the X server when focus didn't move since the last
+    snapshot, and two when it did.
+    """
+    return _with_reconnect(_get_snapshot)
 
 
 def get_window_pid(window: Window) -> str:
-    atom = display.get_atom("_NET_WM_PID")
+    atom = connection.atom("_NET_WM_PID")
     pid_property = window.get_full_property(atom, X.AnyPropertyType)
     if pid_property:
         pid = pid_property.value[-1]
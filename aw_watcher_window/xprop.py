@@ -1,9 +1,13 @@
+import os
 import sys
+import select
 import subprocess
 import re
 import logging
-from subprocess import PIPE
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import PIPE, DEVNULL
+from time import monotonic
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -17,11 +21,11 @@ if not cur_version >= req_version:
     exit(1)
 
 
-def xprop_id(window_id) -> str:
+def xprop_id(window_id, timeout: Optional[float] = None) -> str:
     cmd = ["xprop"]
     cmd.append("-id")
     cmd.append(window_id)
-    p = subprocess.run(cmd, stdout=PIPE)
+    p = subprocess.run(cmd, stdout=PIPE, timeout=timeout)
     return str(p.stdout, "utf8")
 
 
@@ -32,92 +36,344 @@ def xprop_root() -> str:
     return str(p.stdout, "utf8")
 
 
+_wid_re = re.compile(r"0x[0-9a-f]+")
+
+
+def get_property_line(xprop_output: str, prefix: str) -> Optional[str]:
+    """Returns the first line of `xprop_output` starting with `prefix`, without splitting the output."""
+    if xprop_output.startswith(prefix):
+        start = 0
+    else:
+        start = xprop_output.find("\n" + prefix)
+        if start < 0:
+            return None
+        start += 1
+    end = xprop_output.find("\n", start)
+    return xprop_output[start:] if end < 0 else xprop_output[start:end]
+
+
 def get_active_window_id():
-    lines = xprop_root().split("\n")
-    match="_NET_ACTIVE_WINDOW(WINDOW)"
-    result = None
-    for line in lines:
-        if match in line:
-            result = line
-            break
+    line = get_property_line(xprop_root(), "_NET_ACTIVE_WINDOW(WINDOW)")
     wid = "0x0"
-    if result:
-        wids = re.findall("0x[0-9a-f]*", result)
+    if line:
+        wids = _wid_re.findall(line)
         if len(wids) > 0:
             wid = wids[0]
     return wid
 
 
 def get_window_ids():
-    lines = xprop_root().split("\n")
-    client_list = next(filter(lambda x: "_NET_CLIENT_LIST(" in x, lines))
-    window_ids = re.findall("0x[0-9a-f]*", client_list)
-    return window_ids
+    line = get_property_line(xprop_root(), "_NET_CLIENT_LIST(WINDOW)")
+    return _wid_re.findall(line) if line else []
 
 
-def _extract_xprop_field(line):
-    return "".join(line.split("=")[1:]).strip(" \n")
+# Field of XpropWindow -> the xprop property it's read from.
+# A property also matches with a _NET_ prefix (so WM_DESKTOP is read from
+# _NET_WM_DESKTOP), and the first match in the output wins.
+XPROP_FIELDS = {
+    "name": "WM_NAME",
+    "cls": "WM_CLASS",
+    "desktop": "WM_DESKTOP",
+    "command": "WM_COMMAND",
+    "role": "WM_WINDOW_ROLE",
+    "pid": "WM_PID",
+}
 
+# One pattern for all fields. It starts with the literal "WM_", which the regex
+# engine searches for directly, so the output is scanned once and the big
+# multi-line values (WM_HINTS, _NET_WM_ICON, ...) are skipped cheaply.
+_field_by_suffix = {fieldname[len("WM_"):]: field for field, fieldname in XPROP_FIELDS.items()}
+_window_field_re = re.compile(
+    r"WM_(" + "|".join(_field_by_suffix) + r")\([^)\n]*\) = ([^\n]*)"
+)
 
-def get_xprop_field(fieldname, xprop_output):
-    return list(map(_extract_xprop_field, re.findall(fieldname + ".*\n", xprop_output)))
 
+class XpropWindow(NamedTuple):
+    id: str
+    active: bool
+    name: str
+    cls: List[str]
+    desktop: int
+    command: List[str]
+    role: List[str]
+    pid: int
 
-def get_xprop_field_str(fieldname, xprop_output) -> str:
-    field = None
-    try:
-        field = get_xprop_field(fieldname, xprop_output)[0].strip('"')
-    except IndexError:
-        pass
-    if not field:
-        field = "unknown"
-    return field
+    def to_dict(self) -> dict:
+        """The dict get_window has always returned."""
+        return {
+            "id": self.id,
+            "active": self.active,
+            "name": self.name,
+            "class": self.cls,
+            "desktop": self.desktop,
+            "command": self.command,
+            "role": self.role,
+            "pid": self.pid,
+        }
 
 
-def get_xprop_field_strlist(fieldname, xprop_output) -> List[str]:
-    return [s.strip('"') for s in get_xprop_field(fieldname, xprop_output)]
+def tokenize_xprop(xprop_output: str) -> Dict[str, List[str]]:
+    """Collects the values of every XPROP_FIELDS property in `xprop_output` in a single pass."""
+    values: Dict[str, List[str]] = {field: [] for field in XPROP_FIELDS}
+    for match in _window_field_re.finditer(xprop_output):
+        # Only count property names (WM_X or _NET_WM_X at the start of a line),
+        # not text that happens to look like one further into a line
+        start = match.start()
+        if xprop_output.endswith("_NET_", 0, start):
+            start -= len("_NET_")
+        if start > 0 and xprop_output[start - 1] != "\n":
+            continue
+        values[_field_by_suffix[match.group(1)]].append(match.group(2).strip(" "))
+    return values
 
 
-def get_xprop_field_int(fieldname, xprop_output) -> int:
-    field = None
+def _first_int(values: List[str]) -> int:
     try:
-        field = int(get_xprop_field(fieldname, xprop_output)[0])
-    except IndexError:
-        pass
-    if not field:
-        field = -1
-    return field
+        return int(values[0])
+    except (IndexError, ValueError):
+        return -1
 
 
-def get_xprop_field_class(xprop_output) -> List[str]:
-    classname: List[str] = []
+def parse_window(xprop_output: str, wid: str, active_window: bool = False) -> XpropWindow:
+    values = tokenize_xprop(xprop_output)
+    name = values["name"][0].strip('"') if values["name"] else ""
+    classname = [c.strip('", ') for c in values["cls"][0].split(",")] if values["cls"] else []
+    return XpropWindow(
+        id=wid,
+        active=active_window,
+        name=name or "unknown",
+        cls=classname or ["unknown"],
+        desktop=_first_int(values["desktop"]),
+        command=values["command"],
+        role=[s.strip('"') for s in values["role"]],
+        pid=_first_int(values["pid"]),
+    )
+
+
+def get_window(wid, active_window=False, timeout: Optional[float] = None):
+    """
+    :param timeout: seconds to wait for xprop, the window is reported with unknown fields if it takes longer
+    """
     try:
-        classname = [c.strip('", ') for c in get_xprop_field("WM_CLASS", xprop_output)[0].split(',')]
-    except IndexError:
-        pass
-    if not classname:
-        classname = ["unknown"]
-    return classname
-
-
-def get_window(wid, active_window=False):
-    s = xprop_id(wid)
-    window = {
-        "id": wid,
-        "active": active_window,
-        "name": get_xprop_field_str("WM_NAME", s),
-        "class": get_xprop_field_class(s),
-        "desktop": get_xprop_field_int("WM_DESKTOP", s),
-        "command": get_xprop_field("WM_COMMAND", s),
-        "role": get_xprop_field_strlist("WM_WINDOW_ROLE", s),
-        "pid": get_xprop_field_int("WM_PID", s),
-    }
-
-    return window
-
-
-def get_windows(wids, active_window_id=None):
-    return [get_window(wid, active_window=(wid == active_window_id)) for wid in wids]
+        s = xprop_id(wid, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.warning(f"xprop -id {wid} took more than {timeout}s, skipping it")
+        s = ""
+    return parse_window(s, wid, active_window).to_dict()
+
+
+def get_windows(wids, active_window_id=None, workers: int = 1, timeout: Optional[float] = None):
+    """
+    Returns get_window for every window id, in the order given.
+
+    :param workers: with more than one, that many xprop processes are run concurrently
+    :param timeout: per-window timeout, see get_window
+    """
+    def get(wid):
+        return get_window(wid, active_window=(wid == active_window_id), timeout=timeout)
+
+    if workers <= 1:
+        return [get(wid) for wid in wids]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(get, wids))
+
+
+# "NAME(TYPE) = value", "NAME(TYPE): window id # 0x..." or "NAME:  not found."
+_spy_line_re = re.compile(r"^(?P<name>[A-Za-z0-9_]+)(?:\((?P<type>[^)]*)\))?(?::| =)\s*(?P<value>.*)$")
+_quoted_re = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+
+def parse_spy_line(line: str) -> Optional[Tuple[str, Optional[str]]]:
+    """Parses one line of `xprop -spy` output into (property name, value), with None as value if the property isn't set."""
+    match = _spy_line_re.match(line)
+    if match is None:
+        return None
+    value = match.group("value")
+    if match.group("type") is None and value.startswith("not found"):
+        return match.group("name"), None
+    return match.group("name"), value
+
+
+def parse_strings(value: Optional[str]) -> List[str]:
+    """Parses a list of quoted xprop strings, e.g. `"xterm", "XTerm"`."""
+    if value is None:
+        return []
+    return [re.sub(r"\\(.)", r"\1", s) for s in _quoted_re.findall(value)]
+
+
+class XpropSpy:
+    """
+    A long-lived `xprop -spy` child whose output is parsed as a line stream.
+
+    xprop prints the current value of every requested property when it starts
+    and then one line each time a property changes, so once it's running the
+    latest values are available without spawning anything.
+    """
+
+    def __init__(
+        self,
+        args: Sequence[str],
+        properties: Sequence[str],
+        command: Sequence[str] = ("xprop",),
+    ) -> None:
+        self.args = list(args)
+        self.properties = list(properties)
+        self.command = list(command)
+        self.values: Dict[str, Optional[str]] = {}
+        self.spawns = 0
+        self.exited = False
+        self._process: Optional[subprocess.Popen] = None
+        self._buffer = b""
+
+    @property
+    def ready(self) -> bool:
+        """Whether every requested property has been reported at least once."""
+        return all(name in self.values for name in self.properties)
+
+    def start(self) -> None:
+        self._process = subprocess.Popen(
+            self.command + ["-spy"] + self.args + self.properties,
+            stdout=PIPE,
+            stderr=DEVNULL,
+        )
+        self.spawns += 1
+        self.exited = False
+        self.values = {}
+        self._buffer = b""
+
+    def stop(self) -> None:
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        if process.poll() is None:
+            process.terminate()
+            process.wait()
+        # Started with stdout=PIPE
+        assert process.stdout is not None
+        process.stdout.close()
+
+    def _read_chunk(self, fd: int) -> bool:
+        """Parses the next chunk of output, returns False once the child has exited."""
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            return False
+        *lines, self._buffer = (self._buffer + chunk).split(b"\n")
+        for line in lines:
+            parsed = parse_spy_line(line.decode("utf8", "replace"))
+            if parsed is not None:
+                name, value = parsed
+                self.values[name] = value
+        return True
+
+    def update(self, timeout: float = 0.0) -> None:
+        """
+        Applies the output that has arrived since the last call.
+
+        Until every property has been reported, waits up to `timeout` seconds for it.
+        """
+        if self._process is None:
+            self.start()
+        assert self._process is not None and self._process.stdout is not None
+        fd = self._process.stdout.fileno()
+        deadline = monotonic() + timeout
+        while True:
+            wait = 0.0 if self.ready else max(0.0, deadline - monotonic())
+            readable, _, _ = select.select([fd], [], [], wait)
+            if not readable:
+                return
+            if not self._read_chunk(fd):
+                logger.debug(f"xprop -spy {' '.join(self.args)} exited")
+                self.stop()
+                self.exited = True
+                return
+
+
+class XpropSpyBackend:
+    """
+    Window backend built on `xprop -spy` children.
+
+    One child follows the root window for the active window and the desktop,
+    another follows the focused window's class and title and is only replaced
+    when focus moves, so sampling spawns no processes while nothing changes.
+    """
+
+    ROOT_PROPERTIES = ("_NET_ACTIVE_WINDOW", "_NET_CURRENT_DESKTOP", "_NET_DESKTOP_NAMES")
+    WINDOW_PROPERTIES = ("WM_CLASS", "_NET_WM_NAME", "WM_NAME")
+
+    def __init__(self, command: Sequence[str] = ("xprop",), startup_timeout: float = 1.0) -> None:
+        self.command = command
+        self.startup_timeout = startup_timeout
+        self.root = XpropSpy(["-root"], self.ROOT_PROPERTIES, command)
+        self.window: Optional[XpropSpy] = None
+        self.window_id: Optional[str] = None
+        self.window_spawns = 0
+
+    @property
+    def spawns(self) -> int:
+        return self.root.spawns + self.window_spawns
+
+    def _follow(self, window_id: Optional[str]) -> None:
+        if window_id == self.window_id:
+            return
+        if self.window is not None:
+            self.window.stop()
+            self.window = None
+        self.window_id = window_id
+        if window_id is not None:
+            self.window = XpropSpy(["-id", window_id], self.WINDOW_PROPERTIES, self.command)
+            self.window.start()
+            self.window_spawns += 1
+
+    def get_current_window(self) -> dict:
+        if self.root.exited:
+            # update() starts a new child
+            logger.warning("xprop -spy -root exited, restarting it")
+        self.root.update(self.startup_timeout)
+
+        wids = _wid_re.findall(self.root.values.get("_NET_ACTIVE_WINDOW") or "")
+        window_id = wids[0] if wids and int(wids[0], 16) != 0 else None
+        self._follow(window_id)
+
+        app, title = "unknown", "unknown"
+        if self.window is not None:
+            spawns = self.window.spawns
+            self.window.update(self.startup_timeout)
+            if self.window.exited:
+                # E.g. the window was re-mapped or xprop hit an X error, the
+                # title would be stuck until focus moves. update() starts a new child.
+                logger.debug(f"xprop -spy -id {self.window_id} exited, restarting it")
+                self.window.update(self.startup_timeout)
+            self.window_spawns += self.window.spawns - spawns
+            classes = parse_strings(self.window.values.get("WM_CLASS"))
+            titles = parse_strings(
+                self.window.values.get("_NET_WM_NAME") or self.window.values.get("WM_NAME")
+            )
+            if len(classes) >= 2 and classes[1]:
+                app = classes[1]
+            if titles and titles[0]:
+                title = titles[0]
+
+        from .virtualdesktop import desktop_name
+
+        current = self.root.values.get("_NET_CURRENT_DESKTOP")
+        desktop = int(current) if current and current.strip().isdigit() else -1
+        names = parse_strings(self.root.values.get("_NET_DESKTOP_NAMES"))
+
+        return {"app": app, "title": title, "desktop": desktop_name(desktop, names)}
+
+    def stop(self) -> None:
+        self._follow(None)
+        self.root.stop()
+
+
+_spy_backend: Optional[XpropSpyBackend] = None
+
+
+def get_spy_backend() -> XpropSpyBackend:
+    global _spy_backend
+    if _spy_backend is None:
+        _spy_backend = XpropSpyBackend()
+    return _spy_backend
 
 
 if __name__ == "__main__":
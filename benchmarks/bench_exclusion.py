@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Benchmark title exclusion with many patterns on a realistic title stream.
+
+Compares the original loop over every pattern, the combined regexes, and the
+TitleExcluder (combined regexes plus repeat and LRU verdict caches). The
+stream mostly repeats the previous title, as a 1 s poll would, and picks
+new titles from a Zipf distribution over --titles distinct titles.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_watcher_window.exclusion import TitleExcluder, combine_patterns
+
+WORDS = ["report", "invoice", "meeting", "draft", "budget", "notes", "design", "review", "plan", "todo"]
+APPS = ["Mozilla Firefox", "Visual Studio Code", "Slack", "Terminal", "LibreOffice Writer"]
+
+
+def make_patterns(count, rng):
+    patterns = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            patterns.append(f"client-{i}")
+        elif kind == 1:
+            patterns.append(rf"^{rng.choice(WORDS)}-{i}\b")
+        elif kind == 2:
+            patterns.append(rf"(private|secret)[ -]{i}")
+        else:
+            patterns.append(rf"\bticket #{i}\d\b")
+    return [re.compile(p, re.IGNORECASE) for p in patterns]
+
+
+def make_titles(count, rng):
+    titles = []
+    for i in range(count):
+        title = f"{rng.choice(WORDS)}-{rng.randrange(10000)} {rng.choice(WORDS)}.txt - {rng.choice(APPS)}"
+        if i % 20 == 0:
+            # Some windows should be excluded
+            title = f"client-{4 * rng.randrange(10)} " + title
+        titles.append(title)
+    return titles
+
+
+def title_stream(titles, samples, repeat, rng):
+    weights = [1 / (rank + 1) for rank in range(len(titles))]
+    title = titles[0]
+    for _ in range(samples):
+        if rng.random() >= repeat:
+            title = rng.choices(titles, weights)[0]
+        yield title
+
+
+def timed(label, stream, check):
+    start = time.perf_counter()
+    excluded = sum(1 for title in stream if check(title))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / len(stream) * 1e6:8.2f} us/sample  ({excluded} excluded)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--patterns", type=int, nargs="+", default=[40, 200, 500])
+    parser.add_argument("--titles", type=int, default=300)
+    parser.add_argument("--samples", type=int, default=100000)
+    parser.add_argument("--repeat", type=float, default=0.9, help="chance a sample repeats the previous title")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    titles = make_titles(args.titles, rng)
+    stream = list(title_stream(titles, args.samples, args.repeat, rng))
+
+    for count in args.patterns:
+        patterns = make_patterns(count, rng)
+        print(f"{count} patterns, {args.titles} titles, {args.samples} samples")
+        loop = timed("loop over patterns", stream, lambda t: any(p.search(t) for p in patterns))
+        matchers = combine_patterns(patterns)
+        timed("combined regexes", stream, lambda t: any(m.search(t) for m in matchers))
+        excluder = TitleExcluder(patterns)
+        cached = timed("TitleExcluder", stream, excluder.excluded)
+        print(
+            f"{'':<28} {loop / cached:8.1f}x faster, repeats {excluder.repeats / len(stream):.1%},"
+            f" LRU hits {excluder.verdicts.hits / len(stream):.1%}, total hit rate {excluder.hit_rate:.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
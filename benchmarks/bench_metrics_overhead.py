@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Benchmark the cost of the hot-path metrics, disabled and enabled.
+
+Times an empty loop, the same loop with a `metrics.stage()` block and a
+`metrics.count()` per iteration, and reports the difference per stage.
+A sample goes through about ten of each, so the disabled cost times ten
+is the overhead --metrics adds to every poll while it's off.
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_watcher_window.metrics import Metrics
+
+
+def empty(m, n):
+    for _ in range(n):
+        pass
+
+
+def instrumented(m, n):
+    for _ in range(n):
+        with m.stage("window_name"):
+            pass
+        m.count("samples")
+
+
+def timed(run, m, n):
+    start = time.perf_counter()
+    run(m, n)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = min(timed(empty, None, args.iterations) for _ in range(args.repeat))
+    for label, enabled in (("disabled", False), ("enabled", True)):
+        m = Metrics()
+        if enabled:
+            m.enable()
+        elapsed = min(timed(instrumented, m, args.iterations) for _ in range(args.repeat))
+        print(f"{label:<10} {(elapsed - baseline) / args.iterations * 1e9:8.1f} ns per stage and count")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Benchmark replaying the on-disk spool into the mock server.
+
+Fills a spool with --events events, as after a day offline, then drains it
+into tests/mock_server.py once per --batch-sizes entry. A batch size of 1
+is one request per event, which is how queued heartbeats are replayed.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_client import ActivityWatchClient
+from aw_core.models import Event
+
+from aw_watcher_window.spool import Spool
+from tests.mock_server import MockActivityWatchHandler, MockActivityWatchServer
+
+
+def fill(spool, count):
+    start = datetime.now(timezone.utc) - timedelta(days=1)
+    for i in range(count):
+        spool.append(
+            Event(
+                timestamp=start + timedelta(seconds=5 * i),
+                duration=5,
+                data={"app": f"app{i % 7}", "title": f"Document {i % 113}", "desktop": "Work"},
+            )
+        )
+    spool.sync()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100, 1000, 5000])
+    parser.add_argument("--port", type=int, default=5669)
+    args = parser.parse_args()
+
+    server = MockActivityWatchServer(port=args.port)
+    if not server.start():
+        sys.exit(1)
+    client = ActivityWatchClient("bench-spool", host="localhost", port=args.port, testing=True)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spool.bin")
+            for batch_size in args.batch_sizes:
+                spool = Spool(path, max_bytes=(args.events + 1) * 1024)
+                start = time.perf_counter()
+                fill(spool, args.events)
+                fill_time = time.perf_counter() - start
+
+                MockActivityWatchHandler.events.clear()
+                start = time.perf_counter()
+                inserted = spool.drain(client, "bench", batch_size=batch_size)
+                replay_time = time.perf_counter() - start
+                spool.close()
+
+                assert inserted == args.events
+                assert len(MockActivityWatchHandler.events["bench"]) == args.events
+                print(
+                    f"batch {batch_size:>5}: append {args.events / fill_time:9.0f} events/s"
+                    f" ({spool.fsyncs} fsyncs), replay {inserted / replay_time:9.0f} events/s"
+                )
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
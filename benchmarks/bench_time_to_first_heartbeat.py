@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+Measure the time from starting the watcher to its first sample and heartbeat.
+
+Runs `python -m aw_watcher_window --strategy synthetic` against
+tests/mock_server.py --runs times, measuring from spawning the process until
+the mock server stored the first event, and until the first sample, which is
+when that event starts. The synthetic strategy needs no display, so this
+measures startup: imports, config and connecting to the server. With
+--server-delay the mock server is only started that many seconds after the
+watcher, like aw-server still booting at login. Exits with 1 if the median
+time to the first sample is above --target seconds.
+
+The watcher runs with fresh config and data directories. aw_client holds
+queued heartbeats back for its `commit_interval` (5 s when testing), which
+is set to 0 there, so the first heartbeat is sent with the second sample,
+--poll-time seconds after the first.
+
+    python benchmarks/bench_time_to_first_heartbeat.py --runs 5 --server-delay 15
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.mock_server import MockActivityWatchHandler, MockActivityWatchServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Median seconds from spawning the watcher to its first sample
+TARGET = 1.0
+
+
+def first_event_start():
+    """Start of the earliest stored event, or None if there is none yet."""
+    with MockActivityWatchHandler.lock:
+        timestamps = [event["timestamp"] for events in MockActivityWatchHandler.events.values() for event in events]
+    return min(map(datetime.fromisoformat, timestamps), default=None)
+
+
+def import_time(module):
+    """Cumulative `python -X importtime` of `module` in a fresh interpreter, in seconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() == module:
+            return int(cumulative) / 1e6
+    raise RuntimeError(f"{module} not in importtime output")
+
+
+def isolated_env(directory):
+    """Environment with XDG directories in `directory` and aw_client's pre-merging turned off."""
+    env = dict(os.environ)
+    for name in ("CONFIG", "DATA", "CACHE", "STATE"):
+        env[f"XDG_{name}_HOME"] = os.path.join(directory, name.lower())
+    client_config = os.path.join(directory, "config", "activitywatch", "aw-client")
+    os.makedirs(client_config)
+    with open(os.path.join(client_config, "aw-client.toml"), "w") as f:
+        f.write("[client-testing]\ncommit_interval = 0\n")
+    return env
+
+
+def time_to_first_heartbeat(server, server_delay, poll_time, timeout):
+    """Returns the seconds from spawning the watcher to its first sample, and to its first stored event."""
+    with MockActivityWatchHandler.lock:
+        MockActivityWatchHandler.events.clear()
+    with tempfile.TemporaryDirectory(prefix="aw-first-heartbeat-") as directory:
+        env = isolated_env(directory)
+        starter = threading.Timer(server_delay, server.start)
+        starter.start()
+        try:
+            return _run_watcher(server.port, poll_time, timeout + server_delay, env)
+        finally:
+            starter.join()
+            server.stop()
+
+
+def _run_watcher(port, poll_time, timeout, env):
+    spawned = datetime.now(timezone.utc)
+    start = time.monotonic()
+    watcher = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "aw_watcher_window",
+            "--testing",
+            "--port",
+            str(port),
+            "--strategy",
+            "synthetic",
+            "--poll-time",
+            str(poll_time),
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            first_sample = first_event_start()
+            if first_sample is not None:
+                return (first_sample - spawned).total_seconds(), time.monotonic() - start
+            if watcher.poll() is not None:
+                raise RuntimeError(f"Watcher exited with {watcher.returncode} before its first heartbeat")
+            if time.monotonic() - start > timeout:
+                raise RuntimeError(f"No heartbeat within {timeout:.0f}s")
+            time.sleep(0.005)
+    finally:
+        watcher.send_signal(signal.SIGTERM)
+        try:
+            watcher.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            watcher.kill()
+            watcher.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=5673)
+    parser.add_argument("--poll-time", type=float, default=0.1)
+    parser.add_argument("--server-delay", type=float, default=0.0, help="seconds to start the mock server after the watcher")
+    parser.add_argument("--target", type=float, default=TARGET, help="seconds, median")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    server = MockActivityWatchServer(port=args.port)
+    results = [
+        time_to_first_heartbeat(server, args.server_delay, args.poll_time, args.timeout)
+        for _ in range(args.runs)
+    ]
+    samples = [first_sample for first_sample, _ in results]
+    heartbeats = [first_heartbeat for _, first_heartbeat in results]
+
+    report = {
+        "import_main_s": import_time("aw_watcher_window.main"),
+        "server_delay_s": args.server_delay,
+        "first_sample_s": samples,
+        "first_heartbeat_s": heartbeats,
+        "median_first_sample_s": statistics.median(samples),
+        "median_first_heartbeat_s": statistics.median(heartbeats),
+        "target_s": args.target,
+    }
+    print(f"import aw_watcher_window.main: {report['import_main_s'] * 1000:.0f} ms")
+    print(
+        f"first sample: median {report['median_first_sample_s']:.2f}s, max {max(samples):.2f}s"
+        f" (target {args.target:.2f}s)"
+    )
+    print(
+        f"first heartbeat: median {report['median_first_heartbeat_s']:.2f}s, max {max(heartbeats):.2f}s"
+        f" (server started after {args.server_delay:.1f}s)"
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if report["median_first_sample_s"] > args.target:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
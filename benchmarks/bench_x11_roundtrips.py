@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Benchmark X round-trips per sample on the Linux (X11) sampling path.
+
+Compares the old per-sample connection in get_virtual_desktop_linux
+(new Display + intern_atom on every poll) with the shared XConnection.
+Needs a running X server (DISPLAY), e.g. `xvfb-run python benchmarks/bench_x11_roundtrips.py`.
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Xlib.display
+import Xlib.X
+from Xlib.protocol import display as protocol_display
+
+
+class RoundtripCounter:
+    """
+    Counts every blocking wait for a reply, on any display (including connection setup).
+
+    With `latency` set, each wait is delayed by that many seconds to simulate
+    a remote X server (e.g. over SSH).
+    """
+
+    def __init__(self, latency=0.0):
+        self.count = 0
+        self.latency = latency
+        self._original = protocol_display.Display.send_and_recv
+
+    def __enter__(self):
+        counter = self
+        original = self._original
+
+        def send_and_recv(self, *args, **kwargs):
+            if kwargs.get("request") is not None:
+                counter.count += 1
+                if counter.latency:
+                    time.sleep(counter.latency)
+            return original(self, *args, **kwargs)
+
+        protocol_display.Display.send_and_recv = send_and_recv
+        return self
+
+    def __exit__(self, *exc):
+        protocol_display.Display.send_and_recv = self._original
+
+
+def sample_desktop_per_poll_display():
+    """The sampling path before the shared connection: one Display per poll."""
+    display = Xlib.display.Display()
+    try:
+        root = display.screen().root
+        current = root.get_full_property(
+            display.intern_atom("_NET_CURRENT_DESKTOP"), Xlib.X.AnyPropertyType
+        )
+        root.get_full_property(
+            display.intern_atom("_NET_DESKTOP_NAMES"), Xlib.X.AnyPropertyType
+        )
+        return current
+    finally:
+        display.close()
+
+
+def sample_desktop_shared_connection():
+    from aw_watcher_window.virtualdesktop import get_virtual_desktop_linux
+
+    return get_virtual_desktop_linux()
+
+
+def run(name, sample, samples):
+    sample()  # warm up (connect, intern atoms)
+    with RoundtripCounter() as counter:
+        start = time.perf_counter()
+        for _ in range(samples):
+            sample()
+        elapsed = time.perf_counter() - start
+    print(
+        f"{name:<24} {counter.count / samples:8.2f} round-trips/sample"
+        f" {elapsed / samples * 1000:8.3f} ms/sample"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    if not os.environ.get("DISPLAY"):
+        print("DISPLAY is not set, this benchmark needs an X server (try xvfb-run)")
+        sys.exit(1)
+
+    run("per-poll display", sample_desktop_per_poll_display, args.samples)
+    run("shared connection", sample_desktop_shared_connection, args.samples)
+
+
+if __name__ == "__main__":
+    main()
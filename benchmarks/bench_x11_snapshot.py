@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Benchmark the pipelined EWMH snapshot against the serial X11 sampling path.
+
+The serial path reads _NET_ACTIVE_WINDOW, WM_CLASS, the title and the desktop
+one blocking request at a time; xlib.get_snapshot() sends every GetProperty
+before reading any reply. Use --rtt-ms to simulate a remote X server.
+Needs a running X server (DISPLAY), e.g. `xvfb-run python benchmarks/bench_x11_snapshot.py`.
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Xlib import X
+
+from benchmarks.bench_x11_roundtrips import RoundtripCounter
+
+
+def sample_serial():
+    from aw_watcher_window import xlib
+
+    window = xlib.get_current_window()
+    if window is not None:
+        xlib.get_window_class(window)
+        xlib.get_window_name(window)
+    root = xlib.connection.root
+    root.get_full_property(xlib.connection.atom("_NET_CURRENT_DESKTOP"), X.AnyPropertyType)
+    root.get_full_property(xlib.connection.atom("_NET_DESKTOP_NAMES"), X.AnyPropertyType)
+
+
+def sample_snapshot():
+    from aw_watcher_window import xlib
+
+    xlib.get_snapshot()
+
+
+def run(name, sample, samples, latency):
+    sample()  # warm up (connect, intern atoms, first focus guess)
+    with RoundtripCounter(latency) as counter:
+        start = time.perf_counter()
+        for _ in range(samples):
+            sample()
+        elapsed = time.perf_counter() - start
+    print(
+        f"{name:<10} {counter.count / samples:8.2f} round-trips/sample"
+        f" {elapsed / samples * 1000:8.3f} ms/sample"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="simulated round-trip latency")
+    args = parser.parse_args()
+
+    if not os.environ.get("DISPLAY"):
+        print("DISPLAY is not set, this benchmark needs an X server (try xvfb-run)")
+        sys.exit(1)
+
+    run("serial", sample_serial, args.samples, args.rtt_ms / 1000)
+    run("snapshot", sample_snapshot, args.samples, args.rtt_ms / 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+"""
+Benchmark the Linux sampling backends against Xvfb and a scripted window manager.
+
+Starts Xvfb (unless --display is given) and a fake window manager process
+that creates --windows windows with WM_CLASS, _NET_WM_NAME, _NET_WM_PID and
+_NET_WM_DESKTOP set, and rotates _NET_ACTIVE_WINDOW and _NET_CURRENT_DESKTOP
+at the given rates. Each backend then samples as fast as it can for
+--duration seconds, and the results are written as JSON:
+
+    samples_per_sec     throughput of back-to-back samples
+    p50_ms, p99_ms      latency of one sample
+    roundtrips_per_sample  blocking X requests, null for xprop-spy (they
+                        happen in the xprop children)
+    cpu_seconds_per_hour   CPU of the watcher and its children per hour
+                        of polling every --poll-time seconds
+
+Compare against an earlier run with --baseline, e.g.
+
+    python benchmarks/bench_x11_suite.py --output before.json
+    git checkout my-branch
+    python benchmarks/bench_x11_suite.py --baseline before.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import select
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKENDS = ("xlib", "snapshot", "xprop-spy")
+
+
+def start_xvfb(timeout=10.0):
+    """Starts Xvfb on a free display, returns the process and the display name."""
+    if shutil.which("Xvfb") is None:
+        raise RuntimeError("Xvfb not found, install it or pass --display")
+    read_fd, write_fd = os.pipe()
+    process = subprocess.Popen(
+        ["Xvfb", "-displayfd", str(write_fd), "-screen", "0", "640x480x24", "-nolisten", "tcp"],
+        pass_fds=(write_fd,),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    os.close(write_fd)
+    number = b""
+    deadline = time.monotonic() + timeout
+    try:
+        while not number.endswith(b"\n"):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([read_fd], [], [], remaining)[0]:
+                process.kill()
+                raise RuntimeError("Xvfb didn't report its display")
+            chunk = os.read(read_fd, 16)
+            if not chunk:
+                raise RuntimeError(f"Xvfb exited with {process.wait()}")
+            number += chunk
+    finally:
+        os.close(read_fd)
+    return process, f":{number.decode().strip()}"
+
+
+def fake_wm(display_name, windows, desktops, focus_rate, desktop_rate, title_rate, ready, stop):
+    """Sets up the EWMH properties a window manager would and rotates focus and desktop until `stop`."""
+    import Xlib.display
+    from Xlib import Xatom
+
+    display = Xlib.display.Display(display_name)
+    screen = display.screen()
+    root = screen.root
+    atom = display.intern_atom
+    utf8 = atom("UTF8_STRING")
+
+    root.change_property(
+        atom("_NET_SUPPORTED"),
+        Xatom.ATOM,
+        32,
+        [atom(name) for name in ("_NET_ACTIVE_WINDOW", "_NET_CURRENT_DESKTOP", "_NET_DESKTOP_NAMES", "_NET_WM_NAME")],
+    )
+    root.change_property(atom("_NET_NUMBER_OF_DESKTOPS"), Xatom.CARDINAL, 32, [desktops])
+    names = b"".join(f"Desktop {i + 1}\x00".encode() for i in range(desktops))
+    root.change_property(atom("_NET_DESKTOP_NAMES"), utf8, 8, names)
+
+    clients = []
+    for i in range(windows):
+        window = root.create_window(0, 0, 10, 10, 0, screen.root_depth)
+        window.set_wm_class(f"app{i}", f"App{i % 10}")
+        window.set_wm_name(f"Document {i}")
+        window.change_property(atom("_NET_WM_NAME"), utf8, 8, f"Document {i} – App{i % 10}".encode())
+        window.change_property(atom("_NET_WM_PID"), Xatom.CARDINAL, 32, [10000 + i])
+        window.change_property(atom("_NET_WM_DESKTOP"), Xatom.CARDINAL, 32, [i % desktops])
+        clients.append(window)
+    root.change_property(atom("_NET_CLIENT_LIST"), Xatom.WINDOW, 32, [w.id for w in clients])
+
+    active, desktop, edits = 0, 0, 0
+    root.change_property(atom("_NET_ACTIVE_WINDOW"), Xatom.WINDOW, 32, [clients[0].id])
+    root.change_property(atom("_NET_CURRENT_DESKTOP"), Xatom.CARDINAL, 32, [0])
+    display.sync()
+    ready.set()
+
+    now = time.monotonic()
+    # Period and next due time of each kind of change
+    schedule = {
+        kind: [1 / rate, now + 1 / rate]
+        for kind, rate in (("focus", focus_rate), ("desktop", desktop_rate), ("title", title_rate))
+        if rate > 0
+    }
+    while not stop.is_set():
+        if not schedule:
+            stop.wait(0.1)
+            continue
+        kind, (period, due) = min(schedule.items(), key=lambda item: item[1][1])
+        delay = due - time.monotonic()
+        if delay > 0 and stop.wait(delay):
+            break
+        schedule[kind][1] = due + period
+        if kind == "focus":
+            active = (active + 1) % windows
+            root.change_property(atom("_NET_ACTIVE_WINDOW"), Xatom.WINDOW, 32, [clients[active].id])
+        elif kind == "desktop":
+            desktop = (desktop + 1) % desktops
+            root.change_property(atom("_NET_CURRENT_DESKTOP"), Xatom.CARDINAL, 32, [desktop])
+        else:
+            edits += 1
+            clients[active].change_property(
+                atom("_NET_WM_NAME"), utf8, 8, f"Document {active} ({edits}) – App{active % 10}".encode()
+            )
+        display.flush()
+    display.close()
+
+
+def make_sampler(backend):
+    from aw_watcher_window import lib
+
+    def sample():
+        return lib.get_current_window_linux(backend)
+
+    def stop():
+        if backend == "xprop-spy":
+            from aw_watcher_window import xprop
+
+            xprop.get_spy_backend().stop()
+
+    return sample, stop
+
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_backend(backend, duration, warmup, poll_time):
+    from benchmarks.bench_x11_roundtrips import RoundtripCounter
+
+    sample, stop = make_sampler(backend)
+    for _ in range(warmup):
+        sample()
+
+    latencies = []
+    seen = set()
+    cpu_start, children_start = time.process_time(), children_cpu()
+    with RoundtripCounter() as counter:
+        start = time.perf_counter()
+        end = start + duration
+        before = start
+        while before < end:
+            window = sample()
+            latencies.append(time.perf_counter() - before)
+            seen.add(window)
+            before = time.perf_counter()
+        elapsed = before - start
+    # Stopped xprop children are waited for, so their CPU shows up in RUSAGE_CHILDREN
+    stop()
+    cpu = time.process_time() - cpu_start + children_cpu() - children_start
+
+    count = len(latencies)
+    cuts = statistics.quantiles(latencies, n=100) if count > 1 else latencies * 99
+    return {
+        "samples": count,
+        "samples_per_sec": count / elapsed,
+        "p50_ms": cuts[49] * 1000,
+        "p99_ms": cuts[98] * 1000,
+        "roundtrips_per_sample": None if backend == "xprop-spy" else counter.count / count,
+        "cpu_seconds_per_hour": cpu / count * 3600 / poll_time,
+        "distinct_samples": len(seen),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    for backend, result in results.items():
+        before = baseline.get("results", {}).get(backend)
+        if not before:
+            continue
+        changes = []
+        for key in ("samples_per_sec", "p50_ms", "p99_ms", "roundtrips_per_sample", "cpu_seconds_per_hour"):
+            if result.get(key) is not None and before.get(key):
+                changes.append(f"{key} {result[key] / before[key] - 1:+.1%}")
+        print(f"{backend:<10} vs baseline: {', '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--windows", type=int, default=50)
+    parser.add_argument("--desktops", type=int, default=4)
+    parser.add_argument("--focus-rate", type=float, default=2.0, help="_NET_ACTIVE_WINDOW changes per second")
+    parser.add_argument("--desktop-rate", type=float, default=0.5, help="_NET_CURRENT_DESKTOP changes per second")
+    parser.add_argument("--title-rate", type=float, default=1.0, help="title changes of the active window per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to sample each backend")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--poll-time", type=float, default=1.0, help="poll time CPU per hour is computed for")
+    parser.add_argument("--display", help="use this X server instead of starting Xvfb")
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    xvfb = None
+    if args.display:
+        display = args.display
+    else:
+        try:
+            xvfb, display = start_xvfb()
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+    # Before anything connects to the X server
+    os.environ["DISPLAY"] = display
+
+    ready, stop = multiprocessing.Event(), multiprocessing.Event()
+    wm = multiprocessing.Process(
+        target=fake_wm,
+        args=(display, args.windows, args.desktops, args.focus_rate, args.desktop_rate, args.title_rate, ready, stop),
+        daemon=True,
+    )
+    wm.start()
+    try:
+        if not ready.wait(10):
+            raise RuntimeError("the fake window manager didn't start")
+        results = {}
+        for backend in args.backends:
+            if backend == "xprop-spy" and shutil.which("xprop") is None:
+                print("xprop not found, skipping the xprop-spy backend", file=sys.stderr)
+                continue
+            results[backend] = run_backend(backend, args.duration, args.warmup, args.poll_time)
+    finally:
+        stop.set()
+        wm.join(5)
+        if xvfb is not None:
+            xvfb.terminate()
+            xvfb.wait()
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("windows", "desktops", "focus_rate", "desktop_rate", "title_rate", "duration", "poll_time")
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
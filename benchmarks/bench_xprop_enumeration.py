@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Benchmark serial vs. concurrent xprop.get_windows on many dummy windows.
+
+Creates --windows client windows on the X server, lists them in
+_NET_CLIENT_LIST like a window manager would, then enumerates them with
+1 worker (the serial path) and with each --workers count.
+Needs a running X server (DISPLAY) and xprop, e.g.
+`xvfb-run python benchmarks/bench_xprop_enumeration.py --windows 80`.
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Xlib.display
+from Xlib import Xatom
+
+from aw_watcher_window import xprop
+
+
+def create_windows(display, count):
+    root = display.screen().root
+    windows = []
+    for i in range(count):
+        window = root.create_window(0, 0, 100, 100, 0, display.screen().root_depth)
+        window.set_wm_class(f"app{i % 7}", f"App{i % 7}")
+        window.set_wm_name(f"Dummy window {i}")
+        window.change_property(display.intern_atom("_NET_WM_PID"), Xatom.CARDINAL, 32, [1000 + i])
+        windows.append(window)
+    root.change_property(
+        display.intern_atom("_NET_CLIENT_LIST"), Xatom.WINDOW, 32, [w.id for w in windows]
+    )
+    display.sync()
+    return windows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--windows", type=int, default=80)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8, 16])
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if not os.environ.get("DISPLAY"):
+        print("DISPLAY is not set, this benchmark needs an X server (try xvfb-run)")
+        sys.exit(1)
+
+    display = Xlib.display.Display()
+    windows = create_windows(display, args.windows)
+    try:
+        wids = xprop.get_window_ids()
+        active = wids[0]
+        serial = None
+        for workers in [1] + args.workers:
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = xprop.get_windows(wids, active, workers=workers, timeout=args.timeout)
+                best = min(best, time.perf_counter() - start)
+            assert [w["id"] for w in result] == wids
+            serial = serial or best
+            print(f"{workers:>3} workers {best * 1000:9.1f} ms {serial / best:6.1f}x")
+    finally:
+        for window in windows:
+            window.destroy()
+        display.sync()
+        display.close()
+
+
+if __name__ == "__main__":
+    main()
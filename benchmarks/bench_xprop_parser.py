@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of the xprop output parsers.
+
+Compares the previous parsing (one uncompiled re.findall over the whole
+output per field, and a linear scan of the split root dump) with the
+single-pass precompiled tokenizer, over generated dumps with hundreds of
+clients. No X server needed.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_watcher_window import xprop
+from benchmarks.xprop_dumps import root_dump, window_dump, window_ids
+
+
+def _legacy_field(fieldname, s):
+    # The previous parser: one findall per field over the whole output
+    return ["".join(line.split("=")[1:]).strip(" \n") for line in re.findall(fieldname + ".*\n", s)]
+
+
+def _legacy_int(fieldname, s):
+    values = _legacy_field(fieldname, s)
+    return (int(values[0]) if values else None) or -1
+
+
+def legacy_get_window(s, wid):
+    names = _legacy_field("WM_NAME", s)
+    classes = _legacy_field("WM_CLASS", s)
+    return {
+        "id": wid,
+        "active": False,
+        "name": (names[0].strip('"') if names else None) or "unknown",
+        "class": [c.strip('", ') for c in classes[0].split(",")] if classes else ["unknown"],
+        "desktop": _legacy_int("WM_DESKTOP", s),
+        "command": _legacy_field("WM_COMMAND", s),
+        "role": [v.strip('"') for v in _legacy_field("WM_WINDOW_ROLE", s)],
+        "pid": _legacy_int("WM_PID", s),
+    }
+
+
+def legacy_root(s):
+    lines = s.split("\n")
+    active = next(line for line in lines if "_NET_ACTIVE_WINDOW(WINDOW)" in line)
+    client_list = next(filter(lambda x: "_NET_CLIENT_LIST(" in x, lines))
+    return re.findall("0x[0-9a-f]*", active)[0], re.findall("0x[0-9a-f]*", client_list)
+
+
+def new_root(s):
+    active = xprop.get_property_line(s, "_NET_ACTIVE_WINDOW(WINDOW)")
+    client_list = xprop.get_property_line(s, "_NET_CLIENT_LIST(WINDOW)")
+    return xprop._wid_re.findall(active)[0], xprop._wid_re.findall(client_list)
+
+
+def bench(name, fn, repeat):
+    seconds = min(timeit.repeat(fn, number=1, repeat=repeat))
+    print(f"{name:<28} {seconds * 1000:9.3f} ms")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    wids = window_ids(args.clients)
+    dumps = [(wid, window_dump(wid, rng)) for wid in wids]
+    root = root_dump(wids, rng)
+    size = sum(len(d) for _, d in dumps)
+    print(f"{args.clients} clients, {size / 1024:.0f} KiB of window dumps")
+
+    legacy = bench("windows, per-field findall", lambda: [legacy_get_window(d, w) for w, d in dumps], args.repeat)
+    new = bench("windows, single pass", lambda: [xprop.parse_window(d, w) for w, d in dumps], args.repeat)
+    print(f"{'speedup':<28} {legacy / new:9.1f}x")
+
+    legacy = bench("root, split + scan", lambda: legacy_root(root), args.repeat * 20)
+    new = bench("root, prefix find", lambda: new_root(root), args.repeat * 20)
+    print(f"{'speedup':<28} {legacy / new:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Soak test heartbeat_loop on the synthetic window source.
+
+Runs the real loop, sped up --speedup times, against a SyntheticSource until
+--samples samples were taken. RSS and open file descriptors are checked
+every second. Exits with 1 if, after the first tenth of the run, RSS grew by
+more than --max-rss-growth MB or the number of file descriptors changed.
+Events go nowhere by default, or to aw-server (or tests/mock_server.py) at
+--port.
+
+    python benchmarks/soak_synthetic.py --samples 2000000 --heartbeats batch
+"""
+import argparse
+import importlib
+import os
+import sys
+import threading
+import time
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_watcher_window import lib
+from aw_watcher_window.synthetic import SyntheticSource
+
+# The package exports the main() function under the same name
+watcher_main = importlib.import_module("aw_watcher_window.main")
+
+
+class NullClient:
+    """Accepts heartbeats and events and forgets them."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def heartbeat(self, *args, **kwargs):
+        self.requests += 1
+
+    def insert_events(self, *args, **kwargs):
+        self.requests += 1
+
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def open_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+
+def monitor(source, samples, stop, checks):
+    baseline = None
+    while not stop.wait(1.0):
+        taken = source.samples
+        if baseline is None and taken >= samples // 10:
+            baseline = (rss(), open_fds())
+        checks.append((taken, rss(), open_fds()))
+        print(f"{taken:>10} samples  rss {checks[-1][1] / (1 << 20):7.1f} MB  {checks[-1][2]} fds", flush=True)
+        if taken >= samples:
+            stop.set()
+    return baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=2000000)
+    parser.add_argument("--speedup", type=float, default=10000.0)
+    parser.add_argument("--poll-time", type=float, default=1.0)
+    parser.add_argument("--heartbeats", choices=["every", "changes", "batch"], default="changes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, help="send to aw-server at this port instead of nowhere")
+    parser.add_argument("--max-rss-growth", type=float, default=8.0, help="MB")
+    args = parser.parse_args()
+
+    if not os.path.isdir("/proc/self/fd"):
+        print("This soak test reads RSS and file descriptors from /proc (Linux)")
+        sys.exit(1)
+
+    source = SyntheticSource(seed=args.seed)
+    lib.register_source("synthetic", source)
+    if args.port:
+        from aw_client import ActivityWatchClient
+
+        client = ActivityWatchClient("aw-watcher-window-soak", port=args.port, testing=True)
+        bucket_id = f"{client.client_name}_{client.client_hostname}"
+        client.create_bucket(bucket_id, "currentwindow", queued=False)
+    else:
+        client, bucket_id = NullClient(), "soak"
+
+    stop = threading.Event()
+    checks = []
+    result = {}
+    checker = threading.Thread(
+        target=lambda: result.setdefault("baseline", monitor(source, args.samples, stop, checks)),
+        daemon=True,
+    )
+    checker.start()
+    start = time.monotonic()
+    watcher_main.heartbeat_loop(
+        client,
+        bucket_id,
+        poll_time=args.poll_time,
+        strategy="synthetic",
+        heartbeats=args.heartbeats,
+        batch_size=1000,
+        stop_event=stop,
+        speedup=args.speedup,
+    )
+    elapsed = time.monotonic() - start
+    checker.join()
+
+    print(f"{source.samples} samples in {elapsed:.0f}s, {source.samples / elapsed:.0f} samples/s")
+    baseline = result.get("baseline")
+    if baseline is None:
+        print("Run too short to check for leaks")
+        sys.exit(1)
+    growth = (checks[-1][1] - baseline[0]) / (1 << 20)
+    fds = checks[-1][2] - baseline[1]
+    print(f"RSS grew {growth:.1f} MB, file descriptors changed by {fds}")
+    if growth > args.max_rss_growth or fds:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Generates xprop output shaped like real recordings, for benchmarks and tests.
+
+Window dumps follow `xprop -id` on a typical client (including the multi-line
+WM_HINTS and _NET_WM_ICON blocks that dominate its size), root dumps follow
+`xprop -root` with a _NET_CLIENT_LIST of the given length.
+"""
+import random
+from typing import List, Sequence
+
+WINDOW_TEMPLATE = """\
+_NET_WM_USER_TIME(CARDINAL) = {user_time}
+_NET_WM_ICON_GEOMETRY(CARDINAL) = 0, 0, 0, 0
+_NET_WM_DESKTOP(CARDINAL) = {desktop}
+WM_STATE(WM_STATE):
+\t\twindow state: Normal
+\t\ticon window: 0x0
+_NET_WM_ICON(CARDINAL) = {icon_art}
+_NET_WM_PID(CARDINAL) = {pid}
+WM_CLIENT_LEADER(WINDOW): window id # {wid}
+WM_WINDOW_ROLE(STRING) = "{role}"
+WM_HINTS(WM_HINTS):
+\t\tClient accepts input or input focus: True
+\t\tInitial state is Normal State.
+\t\tbitmap id # to use for icon: 0x1a00011
+_NET_WM_WINDOW_TYPE(ATOM) = _NET_WM_WINDOW_TYPE_NORMAL
+WM_CLASS(STRING) = "{instance}", "{cls}"
+WM_ICON_NAME(STRING) = "{title}"
+_NET_WM_ICON_NAME(UTF8_STRING) = "{title}"
+WM_NAME(STRING) = "{title}"
+_NET_WM_NAME(UTF8_STRING) = "{title}"
+WM_COMMAND(STRING) = {{ "{instance}", "--new-window" }}
+WM_CLIENT_MACHINE(STRING) = "workstation"
+"""
+
+APPS = [
+    ("firefox", "Firefox", "browser"),
+    ("code", "Code", "editor"),
+    ("xterm", "XTerm", "terminal"),
+    ("slack", "Slack", "browser-window"),
+    ("evince", "Evince", "document"),
+]
+
+
+def _icon_art(size: int, rng: random.Random) -> str:
+    rows = ("".join(rng.choice(" .:-=+*#%@") for _ in range(size)) for _ in range(size))
+    return f"\tIcon ({size} x {size}):\n" + "\n".join("\t" + row for row in rows)
+
+
+def window_dump(wid: str, rng: random.Random, icons: Sequence[int] = (16, 32, 48)) -> str:
+    """xprop -id output for one window. Real applications usually set several icon sizes."""
+    instance, cls, role = rng.choice(APPS)
+    return WINDOW_TEMPLATE.format(
+        user_time=rng.randrange(10**8),
+        desktop=rng.randrange(4),
+        icon_art="\n".join(_icon_art(size, rng) for size in icons),
+        pid=rng.randrange(1000, 99999),
+        wid=wid,
+        role=role,
+        instance=instance,
+        cls=cls,
+        title=f"{rng.randrange(10**6)} - {cls}",
+    )
+
+
+def window_ids(clients: int) -> List[str]:
+    return [hex(0x1A00003 + i * 0x100000) for i in range(clients)]
+
+
+def root_dump(wids: List[str], rng: random.Random) -> str:
+    client_list = ", ".join(wids)
+    stacking = ", ".join(rng.sample(wids, len(wids)))
+    return "\n".join(
+        [
+            "_NET_SUPPORTING_WM_CHECK(WINDOW): window id # 0x800004",
+            "_NET_DESKTOP_NAMES(UTF8_STRING) = \"Dev\", \"Web\", \"Chat\", \"Docs\"",
+            "_NET_NUMBER_OF_DESKTOPS(CARDINAL) = 4",
+            "_NET_CURRENT_DESKTOP(CARDINAL) = 1",
+            f"_NET_CLIENT_LIST_STACKING(WINDOW): window id # {stacking}",
+            f"_NET_CLIENT_LIST(WINDOW): window id # {client_list}",
+            f"_NET_ACTIVE_WINDOW(WINDOW): window id # {rng.choice(wids)}",
+            "_NET_WORKAREA(CARDINAL) = 0, 0, 1920, 1080, 0, 0, 1920, 1080",
+            "RESOURCE_MANAGER(STRING) = " + "\\n".join(f"Xft.key{i}:\\tvalue" for i in range(50)),
+            "",
+        ]
+    )
@@ -0,0 +1,17 @@
+"""
+Fixtures shared by the tests
+"""
+import pytest
+
+from tests.mock_server import MockActivityWatchServer
+
+
+@pytest.fixture(scope="module")
+def mock_server(request):
+    """A mock aw-server listening on the `PORT` of the test module, so modules don't share one."""
+    server = MockActivityWatchServer(port=request.module.PORT)
+    assert server.start()
+    try:
+        yield server
+    finally:
+        server.stop()
@@ -6,18 +6,28 @@ import json
 import time
 import threading
 import logging
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 
+from aw_core.models import Event
+from aw_transform.heartbeats import heartbeat_merge
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class MockActivityWatchHandler(BaseHTTPRequestHandler):
     """Mock ActivityWatch server handler"""
     
+    # Keep connections open between requests like aw-server
+    protocol_version = 'HTTP/1.1'
+    
     # Store buckets and events in memory
     buckets = {}
     events = {}
+    # Seconds to wait before answering a POST, to simulate a slow server
+    post_delay = 0.0
+    # Requests are handled in threads
+    lock = threading.Lock()
     
     def do_GET(self):
         """Handle GET requests"""
@@ -40,7 +50,7 @@ class MockActivityWatchHandler(BaseHTTPRequestHandler):
                 limit = int(query.get('limit', [100])[0])
                 
                 bucket_events = self.events.get(bucket_id, [])
-                response_events = bucket_events[-limit:] if bucket_events else []
+                response_events = bucket_events[-limit:] if limit > 0 else bucket_events
                 self._send_json_response(response_events)
             else:
                 self._send_error_response(404, 'Not Found')
@@ -52,22 +62,42 @@ class MockActivityWatchHandler(BaseHTTPRequestHandler):
     def do_POST(self):
         """Handle POST requests"""
         try:
+            time.sleep(self.post_delay)
             content_length = int(self.headers.get('Content-Length', 0))
             post_data = self.rfile.read(content_length).decode('utf-8')
             
             if self.path.startswith('/api/0/buckets/') and '/heartbeat' in self.path:
-                # Handle heartbeat
-                bucket_id = self.path.split('/')[3]
+                # Handle heartbeat, merging it like aw-server does
+                parsed = urlparse(self.path)
+                bucket_id = parsed.path.split('/')[4]
+                pulsetime = float(parse_qs(parsed.query).get('pulsetime', [0])[0])
                 if post_data:
-                    event_data = json.loads(post_data)
-                    if bucket_id not in self.events:
-                        self.events[bucket_id] = []
-                    self.events[bucket_id].append(event_data)
+                    with self.lock:
+                        self._heartbeat(bucket_id, Event(**json.loads(post_data)), pulsetime)
+                self._send_json_response({'success': True})
+                
+            elif self.path.startswith('/api/0/buckets/') and self.path.endswith('/events'):
+                # Handle bulk insert of one or many events
+                bucket_id = self.path.split('/')[4]
+                events = json.loads(post_data) if post_data else []
+                if isinstance(events, dict):
+                    events = [events]
+                with self.lock:
+                    bucket_events = self.events.setdefault(bucket_id, [])
+                    for event_data in events:
+                        event = Event(**event_data)
+                        event.id = len(bucket_events) + 1
+                        bucket_events.append(event.to_json_dict())
                 self._send_json_response({'success': True})
                 
             elif self.path.startswith('/api/0/buckets/'):
                 # Handle bucket creation
                 bucket_id = self.path.split('/')[-1]
+                if bucket_id in self.buckets:
+                    # Like aw-server: 304 without a body or Content-Length
+                    self.send_response(304)
+                    self.end_headers()
+                    return
                 if post_data:
                     bucket_data = json.loads(post_data)
                     self.buckets[bucket_id] = bucket_data
@@ -82,21 +112,35 @@ class MockActivityWatchHandler(BaseHTTPRequestHandler):
             logger.error(f"POST error: {e}")
             self._send_error_response(500, str(e))
     
+    def _heartbeat(self, bucket_id, heartbeat, pulsetime):
+        """Merge `heartbeat` into the last event of the bucket or store it as a new event"""
+        bucket_events = self.events.setdefault(bucket_id, [])
+        if bucket_events:
+            last_event = Event(**bucket_events[-1])
+            merged = heartbeat_merge(last_event, heartbeat, pulsetime)
+            if merged is not None:
+                bucket_events[-1] = merged.to_json_dict()
+                return
+        heartbeat.id = len(bucket_events) + 1
+        bucket_events.append(heartbeat.to_json_dict())
+    
     def _send_json_response(self, data, status=200):
         """Send JSON response"""
         self.send_response(status)
+        response = json.dumps(data).encode('utf-8')
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        response = json.dumps(data).encode('utf-8')
         self.wfile.write(response)
     
     def _send_error_response(self, status, message):
         """Send error response"""
         self.send_response(status)
+        error_response = json.dumps({'error': message}).encode('utf-8')
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(error_response)))
         self.end_headers()
-        error_response = json.dumps({'error': message}).encode('utf-8')
         self.wfile.write(error_response)
     
     def log_message(self, format, *args):
@@ -116,7 +160,7 @@ class MockActivityWatchServer:
     def start(self):
         """Start the mock server"""
         try:
-            self.server = HTTPServer((self.host, self.port), MockActivityWatchHandler)
+            self.server = ThreadingHTTPServer((self.host, self.port), MockActivityWatchHandler)
             self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
             self.thread.start()
             self.running = True
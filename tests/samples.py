@@ -0,0 +1,18 @@
+"""
+Sample data shared by the tests
+"""
+from datetime import datetime, timedelta, timezone
+
+EDITOR = {"app": "code", "title": "main.py", "desktop": "Work"}
+BROWSER = {"app": "firefox", "title": "Docs", "desktop": "Work"}
+CHAT = {"app": "slack", "title": "general", "desktop": "Chat"}
+
+START = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+
+
+def samples(editor_seconds=70):
+    """One sample per second, with a few switches and a 10 second suspend."""
+    stream = [EDITOR] * 10 + [BROWSER] * 3 + [EDITOR] * editor_seconds + [CHAT] + [None] * 10 + [CHAT] * 5
+    for second, data in enumerate(stream):
+        if data is not None:
+            yield dict(data), START + timedelta(seconds=second)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Tests for the asyncio watcher core against the mock server
+"""
+import asyncio
+import importlib
+import os
+import sys
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_watcher_window.aio import AsyncTransport, HTTPError, watch
+from aw_watcher_window.sample import WindowSample
+from tests.mock_server import MockActivityWatchHandler, MockActivityWatchServer
+
+# The package exports the main() function under the same name
+main = importlib.import_module("aw_watcher_window.main")
+
+PORT = 5671
+
+
+def test_requests_share_one_connection(mock_server):
+    async def run():
+        async with AsyncTransport("localhost", PORT) as transport:
+            info = await transport.get_info()
+            await transport.create_bucket("aio-bucket", "currentwindow", "test", "host")
+            with pytest.raises(HTTPError):
+                await transport.request("GET", "/api/0/nothing")
+            return info, transport.requests, transport.connects
+
+    info, requests, connects = asyncio.run(run())
+    assert info["testing"]
+    assert (requests, connects) == (3, 1)
+    assert "aio-bucket" in MockActivityWatchHandler.buckets
+
+
+def test_existing_bucket_answered_with_304(mock_server):
+    async def run():
+        async with AsyncTransport("localhost", PORT, timeout=2.0) as transport:
+            await transport.create_bucket("aio-existing", "currentwindow", "test", "host")
+            # No body and no Content-Length, the connection stays usable
+            await transport.create_bucket("aio-existing", "currentwindow", "test", "host")
+            await transport.get_info()
+            return transport.requests, transport.connects
+
+    assert asyncio.run(run()) == (3, 1)
+
+
+def test_watchers_share_one_loop(mock_server, monkeypatch):
+    windows = {
+        "editor": WindowSample("code", "main.py"),
+        "browser": WindowSample("firefox", "Secret plans"),
+    }
+    monkeypatch.setattr(main, "get_current_window", lambda strategy: windows[strategy])
+
+    async def run():
+        async with AsyncTransport("localhost", PORT) as transport:
+            watchers = [
+                asyncio.create_task(watch(transport, "aio-editor", 0.01, "editor")),
+                asyncio.create_task(
+                    watch(
+                        transport,
+                        "aio-browser",
+                        0.01,
+                        "browser",
+                        exclude_titles=[main.try_compile_title_regex("secret")],
+                    )
+                ),
+            ]
+            await asyncio.sleep(0.3)
+            for task in watchers:
+                task.cancel()
+            await asyncio.gather(*watchers, return_exceptions=True)
+        return transport
+
+    transport = asyncio.run(run())
+    assert transport.connects == 1
+    assert transport.failures == 0 and transport.dropped == 0
+
+    [editor] = MockActivityWatchHandler.events["aio-editor"]
+    [browser] = MockActivityWatchHandler.events["aio-browser"]
+    assert editor["data"]["title"] == "main.py"
+    assert browser["data"]["title"] == "excluded"
+    assert editor["duration"] > 0.2
+
+
+def test_queued_requests_survive_server_outage():
+    async def run():
+        # Nothing listens on this port until the server starts below
+        async with AsyncTransport("localhost", PORT + 1) as transport:
+            transport.insert_events("aio-outage", [])
+            await asyncio.sleep(0.2)
+            assert transport.failures > 0
+
+            late = MockActivityWatchServer(port=PORT + 1)
+            assert late.start()
+            try:
+                await transport.close(timeout=5.0)
+            finally:
+                late.stop()
+        return transport
+
+    transport = asyncio.run(run())
+    assert transport.requests == 1
+    assert "aio-outage" in MockActivityWatchHandler.events
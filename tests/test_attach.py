@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""
+Tests for sampling into a backlog before aw-server is up and attaching to it later
+"""
+import json
+import os
+import sys
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_client import ActivityWatchClient
+from aw_core.models import Event
+from requests import HTTPError, Response
+
+from aw_watcher_window.attach import AttachState, Attacher, DeferredClient, NotAttachedError
+from aw_watcher_window.heartbeat import EventBatcher, HeartbeatEmitter
+from tests.mock_server import MockActivityWatchHandler, MockActivityWatchServer
+from tests.samples import BROWSER, CHAT, EDITOR, START, samples
+
+PORT = 5674
+
+
+def not_found():
+    response = Response()
+    response.status_code = 404
+    return HTTPError("404 Client Error: Not Found", response=response)
+
+
+class FakeClient:
+    """Records requests, and fails get_info until `up` is set."""
+
+    def __init__(self):
+        self.up = threading.Event()
+        self.requests = []
+        # Buckets registered with the request queue, which sends no request
+        self.registered = []
+        # Errors to raise from the next inserts
+        self.insert_errors = []
+
+    def get_info(self):
+        if not self.up.is_set():
+            raise ConnectionError("connection refused")
+        return {}
+
+    def create_bucket(self, bucket_id, event_type, queued=False):
+        if queued:
+            self.registered.append(bucket_id)
+        else:
+            self.requests.append(("create_bucket", bucket_id))
+
+    def insert_events(self, bucket_id, events):
+        if self.insert_errors:
+            raise self.insert_errors.pop(0)
+        self.requests.append(("insert_events", len(events)))
+
+    def heartbeat(self, bucket_id, event, pulsetime, queued=False):
+        self.requests.append(("heartbeat", event.data))
+
+
+def deferred_client(client, state=None, **kwargs):
+    state = state or AttachState(None, "server", "bucket")
+    return DeferredClient(client, "bucket", "currentwindow", state, **kwargs)
+
+
+def attach(deferred):
+    attacher = Attacher(deferred, retry=0.01)
+    attacher.start()
+    attacher.join(10)
+    assert deferred.attached
+    return attacher
+
+
+def test_backlog_merges_heartbeats_and_flushes_once(tmp_path):
+    client = FakeClient()
+    deferred = deferred_client(client, AttachState(str(tmp_path / "state.json"), "server", "bucket"))
+    emitter = HeartbeatEmitter(deferred, "bucket", interval=1.0, queued=False)
+    for data, timestamp in samples(editor_seconds=20):
+        emitter.emit(data, timestamp)
+
+    # One event per change, and a new one after the suspend
+    assert [event.data for event in deferred.backlog] == [EDITOR, BROWSER, EDITOR, CHAT, CHAT]
+    assert deferred.backlog[0].duration == timedelta(seconds=9)
+    assert client.requests == []
+
+    client.up.set()
+    attacher = attach(deferred)
+    assert attacher.attempts == 1
+    assert client.requests == [("create_bucket", "bucket"), ("insert_events", 5)]
+    assert client.registered == ["bucket"]
+
+    # Passed straight on once attached
+    emitter.emit(dict(BROWSER), START + timedelta(minutes=5))
+    assert client.requests[-1] == ("heartbeat", BROWSER)
+    assert not deferred.backlog
+
+
+def test_backlog_is_bounded():
+    deferred = deferred_client(FakeClient(), max_events=2)
+    for i in range(5):
+        deferred.heartbeat("bucket", Event(timestamp=START, data={"i": i}), pulsetime=1.0)
+    assert [event.data["i"] for event in deferred.backlog] == [3, 4]
+    assert deferred.dropped == 3
+
+
+def test_batched_events_stay_in_the_batcher_until_attached():
+    client = FakeClient()
+    deferred = deferred_client(client)
+    batcher = EventBatcher(deferred, "bucket", interval=1.0, batch_size=1000)
+    for data, timestamp in samples(editor_seconds=20):
+        batcher.emit(data, timestamp)
+    batcher.flush()
+    assert len(batcher.pending) == 5
+    with pytest.raises(NotAttachedError):
+        deferred.insert_events("bucket", batcher.pending)
+
+    client.up.set()
+    attach(deferred)
+    batcher.flush()
+    assert not batcher.pending
+    assert client.requests[-1] == ("insert_events", 5)
+
+
+def test_state_skips_create_bucket_after_restart(tmp_path):
+    path = str(tmp_path / "state.json")
+    client = FakeClient()
+    client.up.set()
+    deferred = deferred_client(client, AttachState(path, "server", "bucket"))
+    deferred.heartbeat("bucket", Event(timestamp=START, data=EDITOR), pulsetime=1.0)
+    attach(deferred)
+    deferred.close()
+    with open(path) as f:
+        saved = json.load(f)
+    assert saved["bucket_exists"]
+    assert saved["last_event"]["data"] == EDITOR
+
+    restarted = FakeClient()
+    restarted.up.set()
+    state = AttachState(path, "server", "bucket")
+    assert state.bucket_exists and state.last_event["data"] == EDITOR
+    attach(deferred_client(restarted, state))
+    assert restarted.requests == []
+    # Created by the request queue if the server lost it by the time it connects
+    assert restarted.registered == ["bucket"]
+
+    # Written for another server
+    assert not AttachState(path, "other-server", "bucket").bucket_exists
+
+
+def test_missing_bucket_is_created_again():
+    client = FakeClient()
+    client.up.set()
+    client.insert_errors = [ConnectionError("connection reset"), not_found()]
+    state = AttachState(None, "server", "bucket")
+    state.bucket_exists = True
+    deferred = deferred_client(client, state)
+    deferred.heartbeat("bucket", Event(timestamp=START, data=EDITOR), pulsetime=1.0)
+
+    # Only the 404 means the bucket is gone
+    attacher = attach(deferred)
+    assert attacher.attempts == 3
+    assert client.requests == [("create_bucket", "bucket"), ("insert_events", 1)]
+
+    # Also once attached
+    client.insert_errors = [not_found()]
+    with pytest.raises(HTTPError):
+        deferred.insert_events("bucket", [Event(timestamp=START, data=CHAT)])
+    assert not state.bucket_exists
+    deferred.insert_events("bucket", [Event(timestamp=START, data=CHAT)])
+    assert client.requests[2:] == [("create_bucket", "bucket"), ("insert_events", 1)]
+
+
+def test_mock_server_started_late():
+    MockActivityWatchHandler.events.pop("late", None)
+    client = ActivityWatchClient("test-attach", host="localhost", port=PORT, testing=True)
+    deferred = DeferredClient(client, "late", "currentwindow", AttachState(None, client.server_address, "late"))
+    attacher = Attacher(deferred, retry=0.05, max_retry=0.2)
+    attacher.start()
+
+    emitter = HeartbeatEmitter(deferred, "late", interval=1.0, queued=False)
+    for data, timestamp in samples(editor_seconds=20):
+        emitter.emit(data, timestamp)
+    deadline = time.monotonic() + 10
+    while attacher.attempts < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not deferred.attached
+
+    server = MockActivityWatchServer(port=PORT)
+    assert server.start()
+    try:
+        attacher.join(10)
+        assert deferred.attached and attacher.attempts > 3
+        emitter.emit(dict(CHAT), START + timedelta(seconds=49))
+
+        events = sorted(client.get_events("late"), key=lambda e: e.timestamp)
+        assert [e.data for e in events] == [EDITOR, BROWSER, EDITOR, CHAT, CHAT]
+        # The first sample was taken long before the server started
+        assert events[0].timestamp == START
+        # The live heartbeat continued the last backlogged event
+        assert events[-1].duration == timedelta(seconds=5)
+    finally:
+        attacher.stop()
+        server.stop()
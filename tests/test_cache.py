@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Tests for the hot path caches
+"""
+import os
+import sys
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_watcher_window.cache import ExpiringSet, LRUCache
+
+
+def test_lru_counts_hits_and_misses():
+    cache = LRUCache(maxsize=2)
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_evicts_least_recently_used():
+    evicted = []
+    cache = LRUCache(maxsize=2, on_evict=lambda key, value: evicted.append(key))
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert evicted == ["b"]
+    assert "a" in cache and "c" in cache
+    assert cache.evictions == 1
+
+
+def test_lru_pop_is_not_an_eviction():
+    evicted = []
+    cache = LRUCache(maxsize=2, on_evict=lambda key, value: evicted.append(key))
+    cache.put("a", 1)
+    assert cache.pop("a") == 1
+    assert cache.pop("a") is None
+    assert evicted == [] and len(cache) == 0
+
+
+def test_expiring_set_forgets_after_ttl():
+    now = [0.0]
+    dead = ExpiringSet(ttl=5.0, clock=lambda: now[0])
+    dead.add(42)
+
+    assert 42 in dead
+    assert 43 not in dead
+    now[0] = 4.9
+    assert 42 in dead
+    assert dead.hits == 2
+
+    now[0] = 5.0
+    assert 42 not in dead
+    assert len(dead) == 0
+
+
+def test_expiring_set_is_bounded():
+    dead = ExpiringSet(ttl=60.0, maxsize=2)
+    for key in (1, 2, 3):
+        dead.add(key)
+    assert 1 not in dead
+    assert 2 in dead and 3 in dead
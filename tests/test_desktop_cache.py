@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Tests for the Linux desktop name cache
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_watcher_window.virtualdesktop import DesktopNameCache
+
+
+class FakeRoot:
+    def __init__(self, current, names):
+        self.properties = {"_NET_CURRENT_DESKTOP": [current], "_NET_DESKTOP_NAMES": names}
+
+    def get_full_property(self, atom, property_type):
+        return SimpleNamespace(value=self.properties[atom])
+
+
+class FakeConnection:
+    def __init__(self, current=0, names=b"Dev\x00Web\x00"):
+        self.connects = 1
+        self.atoms = {"_NET_CURRENT_DESKTOP": "_NET_CURRENT_DESKTOP", "_NET_DESKTOP_NAMES": "_NET_DESKTOP_NAMES"}
+        self.root = FakeRoot(current, names)
+
+    def atom(self, name):
+        return self.atoms[name]
+
+
+class FakeWatcher:
+    def __init__(self, watching_root):
+        self.watching_root = watching_root
+        self.listeners = {}
+
+    def on_root_change(self, name, callback):
+        self.listeners.setdefault(name, []).append(callback)
+
+    def poll(self):
+        return []
+
+    def fire(self, name):
+        for callback in self.listeners.get(name, []):
+            callback()
+
+
+def test_poll_mode_reads_index_but_caches_names():
+    connection = FakeConnection()
+    cache = DesktopNameCache(ttl=3600)
+    watcher = FakeWatcher(watching_root=False)
+
+    for _ in range(10):
+        assert cache.get_desktop_name(connection, watcher) == "Dev"
+    connection.root.properties["_NET_CURRENT_DESKTOP"] = [1]
+    assert cache.get_desktop_name(connection, watcher) == "Web"
+
+    assert cache.current_reads == 11
+    assert cache.name_reads == 1
+
+
+def test_poll_mode_rereads_names_after_ttl():
+    connection = FakeConnection()
+    cache = DesktopNameCache(ttl=0)
+    watcher = FakeWatcher(watching_root=False)
+
+    assert cache.get_desktop_name(connection, watcher) == "Dev"
+    connection.root.properties["_NET_DESKTOP_NAMES"] = b"Code\x00Web\x00"
+    assert cache.get_desktop_name(connection, watcher) == "Code"
+    assert cache.name_reads == 2
+
+
+def test_events_mode_reads_nothing_until_invalidated():
+    connection = FakeConnection()
+    cache = DesktopNameCache(ttl=0)
+    watcher = FakeWatcher(watching_root=True)
+
+    for _ in range(10):
+        assert cache.get_desktop_name(connection, watcher) == "Dev"
+    assert (cache.current_reads, cache.name_reads) == (1, 1)
+
+    connection.root.properties["_NET_CURRENT_DESKTOP"] = [1]
+    watcher.fire("_NET_CURRENT_DESKTOP")
+    assert cache.get_desktop_name(connection, watcher) == "Web"
+    assert (cache.current_reads, cache.name_reads) == (2, 1)
+
+    connection.root.properties["_NET_DESKTOP_NAMES"] = b"Dev\x00Mail\x00"
+    watcher.fire("_NET_DESKTOP_NAMES")
+    assert cache.get_desktop_name(connection, watcher) == "Mail"
+    assert (cache.current_reads, cache.name_reads) == (2, 2)
+
+
+def test_reconnect_invalidates_everything():
+    connection = FakeConnection()
+    cache = DesktopNameCache()
+    watcher = FakeWatcher(watching_root=True)
+
+    cache.get_desktop_name(connection, watcher)
+    connection.connects += 1
+    cache.get_desktop_name(connection, watcher)
+    assert (cache.current_reads, cache.name_reads) == (2, 2)
+
+
+def test_fallback_to_desktop_number():
+    watcher = FakeWatcher(watching_root=False)
+    assert DesktopNameCache().get_desktop_name(FakeConnection(current=2), watcher) == "Desktop 3"
+    assert DesktopNameCache().get_desktop_name(FakeConnection(names=b""), watcher) == "Desktop 1"
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Tests for the combined title exclusion matcher
+"""
+import os
+import re
+import sys
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_watcher_window.exclusion import TitleExcluder, combine_patterns
+
+
+def compile_all(patterns):
+    return [re.compile(p, re.IGNORECASE) for p in patterns]
+
+
+def test_combined_matcher_agrees_with_each_pattern():
+    patterns = compile_all(["bank", r"^private\b", r"(\w+) - \1$", "(?i)secret", r"inbox \(\d+\)"])
+    excluder = TitleExcluder(patterns)
+    titles = [
+        "My Bank - Firefox",
+        "Private browsing",
+        "not private",
+        "echo - echo",
+        "echo - other",
+        "SECRET plans",
+        "Inbox (3) - Mail",
+        "README.md - code",
+    ]
+    for title in titles:
+        expected = any(p.search(title) for p in patterns)
+        assert excluder.excluded(title) == expected, title
+
+
+def test_patterns_are_combined_where_possible():
+    matchers = combine_patterns(compile_all(["a", "b", "c", r"(x)\1", "(?i)d"]))
+    assert len(matchers) == 3
+
+
+def test_same_group_names_fall_back_to_separate_patterns():
+    matchers = combine_patterns(compile_all([r"(?P<doc>\w+)\.pdf", r"(?P<doc>\w+)\.docx"]))
+    assert len(matchers) == 2
+
+
+def test_conditional_group_references_are_compiled_on_their_own():
+    patterns = compile_all([r"x(y)z", r"a(b)?(?(1)c|d)"])
+    assert len(combine_patterns(patterns)) == 2
+    # Combined, (?(1)...) would test the first pattern's group
+    assert TitleExcluder(patterns).excluded("abc")
+
+
+def test_repeated_titles_are_not_matched_again():
+    excluder = TitleExcluder(compile_all(["bank"]))
+    for title in ["bank", "bank", "bank", "mail", "bank", "mail"]:
+        excluder.excluded(title)
+    assert excluder.repeats == 2
+    assert (excluder.verdicts.hits, excluder.verdicts.misses) == (2, 2)
+    assert excluder.hit_rate == 4 / 6
+
+
+def test_no_patterns_is_falsy():
+    assert not TitleExcluder([])
+    assert TitleExcluder([]).excluded("anything") is False
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+"""
+Tests for change-aware heartbeats and batched events against the mock server
+"""
+import importlib
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_client import ActivityWatchClient
+from requests import RequestException
+
+from aw_watcher_window import lib
+from aw_watcher_window.heartbeat import EventBatcher, HeartbeatEmitter
+from aw_watcher_window.sample import WindowSample
+from aw_watcher_window.spool import Spool
+from tests.samples import BROWSER, CHAT, EDITOR, samples
+
+# The package exports the main() function under the same name
+main = importlib.import_module("aw_watcher_window.main")
+
+PORT = 5667
+
+
+@pytest.fixture(scope="module")
+def client(mock_server):
+    return ActivityWatchClient("test-heartbeat", host="localhost", port=PORT, testing=True)
+
+
+def timeline(client, bucket_id):
+    events = sorted(client.get_events(bucket_id), key=lambda e: e.timestamp)
+    return [(e.timestamp, e.duration, e.data) for e in events]
+
+
+def test_changes_only_stores_same_timeline(client):
+    every = HeartbeatEmitter(client, "every", interval=1.0, queued=False)
+    changes = HeartbeatEmitter(client, "changes", interval=1.0, keepalive_time=30.0, queued=False)
+    for data, timestamp in samples():
+        every.emit(data, timestamp)
+        changes.emit(data, timestamp)
+    changes.flush()
+
+    assert timeline(client, "changes") == timeline(client, "every")
+    assert len(timeline(client, "every")) == 5
+    assert changes.sent < every.sent / 5
+
+
+def test_event_driven_closes_previous_window_at_switch(client):
+    emitter = HeartbeatEmitter(client, "events", interval=60.0, event_driven=True, queued=False)
+    start = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+    emitter.emit(dict(EDITOR), start)
+    emitter.emit(dict(EDITOR), start + timedelta(seconds=60))
+    emitter.emit(dict(BROWSER), start + timedelta(seconds=75))
+
+    (_, editor_duration, _), (browser_start, _, _) = timeline(client, "events")
+    assert editor_duration == timedelta(seconds=75)
+    assert browser_start == start + timedelta(seconds=75)
+    assert emitter.suppressed == 0
+
+
+def test_batched_events_store_same_timeline(client):
+    every = HeartbeatEmitter(client, "every-batch", interval=1.0, queued=False)
+    batcher = EventBatcher(client, "batch", interval=1.0, batch_interval=3600.0, batch_size=2)
+    for data, timestamp in samples():
+        every.emit(data, timestamp)
+        batcher.emit(data, timestamp)
+    batcher.flush()
+
+    assert timeline(client, "batch") == timeline(client, "every-batch")
+    assert batcher.sent == 5
+    assert batcher.requests == 3
+
+
+def test_batch_interval_sends_event_in_progress(client):
+    now = [0.0]
+    batcher = EventBatcher(
+        client, "batch-cut", interval=1.0, batch_interval=60.0, clock=lambda: now[0]
+    )
+    start = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+    for second in range(90):
+        now[0] = second
+        batcher.emit(dict(EDITOR), start + timedelta(seconds=second))
+
+    [(timestamp, duration, data)] = timeline(client, "batch-cut")
+    assert (timestamp, duration) == (start, timedelta(seconds=60))
+
+    # The rest is merged into the same event instead of inserted after it
+    now[0] = 125
+    batcher.emit(dict(BROWSER), start + timedelta(seconds=125))
+    batcher.flush()
+    assert timeline(client, "batch-cut") == [
+        (start, timedelta(seconds=89), EDITOR),
+        (start + timedelta(seconds=125), timedelta(0), BROWSER),
+    ]
+    assert batcher.sent == 2
+
+
+def test_event_in_progress_is_split_if_merging_fails():
+    class FlakyClient:
+        online = True
+
+        def __init__(self):
+            self.events = []
+
+        def heartbeat(self, bucket_id, event, pulsetime, queued=False):
+            if not self.online:
+                raise RequestException("connection refused")
+            self.events.append((event.timestamp, event.duration))
+
+        def insert_events(self, bucket_id, events):
+            if not self.online:
+                raise RequestException("connection refused")
+            self.events.extend((event.timestamp, event.duration) for event in events)
+
+    now = [0.0]
+    flaky = FlakyClient()
+    batcher = EventBatcher(flaky, "flaky", interval=1.0, batch_interval=60.0, clock=lambda: now[0])
+    start = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+    for second in range(90):
+        now[0] = second
+        batcher.emit(dict(EDITOR), start + timedelta(seconds=second))
+
+    flaky.online = False
+    batcher.flush()
+    flaky.online = True
+    batcher.flush()
+    # Only the part the server didn't have yet is inserted
+    assert flaky.events == [
+        (start, timedelta(seconds=60)),
+        (start + timedelta(seconds=60), timedelta(seconds=29)),
+    ]
+
+
+def test_failed_insert_is_retried():
+    class OfflineClient:
+        def insert_events(self, bucket_id, events):
+            raise RequestException("connection refused")
+
+    batcher = EventBatcher(OfflineClient(), "offline", interval=1.0, batch_size=1)
+    start = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+    batcher.emit(dict(EDITOR), start)
+    batcher.emit(dict(BROWSER), start + timedelta(seconds=1))
+    batcher.emit(dict(EDITOR), start + timedelta(seconds=2))
+
+    assert batcher.sent == 0
+    assert [event.data for event in batcher.pending] == [EDITOR, BROWSER]
+
+
+def test_spooled_events_are_inserted_once_server_is_back(client, tmp_path):
+    spool = Spool(str(tmp_path / "spool.bin"))
+
+    class FlakyClient:
+        online = False
+
+        def insert_events(self, bucket_id, events):
+            if not self.online:
+                raise RequestException("connection refused")
+            client.insert_events(bucket_id, events)
+
+    flaky = FlakyClient()
+    every = HeartbeatEmitter(client, "every-spool", interval=1.0, queued=False)
+    batcher = EventBatcher(flaky, "spool", interval=1.0, batch_size=1, spool=spool)
+    for data, timestamp in samples():
+        every.emit(data, timestamp)
+        batcher.emit(data, timestamp)
+    assert batcher.sent == 0
+    assert len(spool) == 4
+
+    flaky.online = True
+    batcher.flush()
+    assert timeline(client, "spool") == timeline(client, "every-spool")
+    assert len(spool) == 0
+
+
+@pytest.mark.parametrize("error", [OSError(28, "No space left on device"), ValueError("Event too large")])
+def test_events_stay_pending_if_spooling_fails(tmp_path, monkeypatch, error):
+    class OfflineClient:
+        def insert_events(self, bucket_id, events):
+            raise RequestException("connection refused")
+
+    spool = Spool(str(tmp_path / "spool.bin"))
+    batcher = EventBatcher(OfflineClient(), "offline", interval=1.0, batch_size=1, spool=spool)
+    start = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+    batcher.emit(dict(EDITOR), start)
+    batcher.emit(dict(BROWSER), start + timedelta(seconds=1))
+    assert len(spool) == 1
+
+    def fail(event):
+        raise error
+
+    monkeypatch.setattr(spool, "append", fail)
+    batcher.emit(dict(EDITOR), start + timedelta(seconds=2))
+    batcher.flush()
+    assert [event.data for event in batcher.pending] == [BROWSER, EDITOR]
+    assert len(spool) == 1
+
+
+def test_long_titles_are_only_cut_when_spooled(client, tmp_path):
+    spool = Spool(str(tmp_path / "spool.bin"))
+    batcher = EventBatcher(client, "spool-long", interval=1.0, batch_size=1, spool=spool)
+    start = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+    long_title = dict(EDITOR, title="x" * 5000)
+    batcher.emit(long_title, start)
+    batcher.flush()
+
+    assert len(spool) == 0
+    [(_, _, data)] = timeline(client, "spool-long")
+    assert data == long_title
+
+
+def test_suppressed_samples_are_sent_when_loop_is_interrupted(monkeypatch):
+    class InterruptedSource:
+        """The same window a few times, then Ctrl+C."""
+
+        def __init__(self):
+            self.samples = 0
+
+        def get_current_window(self):
+            self.samples += 1
+            if self.samples > 3:
+                raise KeyboardInterrupt
+            return WindowSample(EDITOR["app"], EDITOR["title"], EDITOR["desktop"])
+
+    class RecordingClient:
+        def __init__(self):
+            self.heartbeats = []
+
+        def heartbeat(self, bucket_id, event, pulsetime, queued=False):
+            self.heartbeats.append(event)
+
+    monkeypatch.setattr(lib, "_sources", {})
+    lib.register_source("interrupted", InterruptedSource())
+    recording = RecordingClient()
+    with pytest.raises(KeyboardInterrupt):
+        main.heartbeat_loop(
+            recording,
+            "bucket",
+            poll_time=0.01,
+            strategy="interrupted",
+            heartbeats="changes",
+            keepalive_time=60.0,
+        )
+
+    # The first sample, and the suppressed ones up to the last
+    assert len(recording.heartbeats) == 2
+    assert recording.heartbeats[-1].timestamp > recording.heartbeats[0].timestamp
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="events mode is Linux only")
+def test_sigterm_stops_events_mode_while_waiting(monkeypatch):
+    from aw_watcher_window.xevents import PropertyWatcher
+
+    class QuietConnection:
+        """An X connection on which nothing ever changes."""
+
+        connects = 1
+        connected = True
+
+        def __init__(self, fd):
+            self.root = SimpleNamespace(id=1, change_attributes=lambda **kwargs: None)
+            self.display = SimpleNamespace(
+                fileno=lambda: fd, flush=lambda: None, pending_events=lambda: 0
+            )
+
+        def atom(self, name):
+            return hash(name)
+
+    class RecordingClient:
+        def __init__(self):
+            self.heartbeats = []
+
+        def heartbeat(self, bucket_id, event, pulsetime, queued=False):
+            self.heartbeats.append(event)
+
+    read_fd, write_fd = os.pipe()
+    watcher = PropertyWatcher(QuietConnection(read_fd))
+    monkeypatch.setattr(main, "get_events_watcher", lambda: watcher)
+    monkeypatch.setattr(lib, "_sources", {})
+    lib.register_source("still", SimpleNamespace(get_current_window=lambda: WindowSample(**EDITOR)))
+    previous_handler = signal.getsignal(signal.SIGTERM)
+    stop = threading.Event()
+    main.stop_on_sigterm(stop, "events")
+    timer = threading.Timer(0.2, os.kill, args=(os.getpid(), signal.SIGTERM))
+    recording = RecordingClient()
+    started = time.monotonic()
+    timer.start()
+    try:
+        main.heartbeat_loop(
+            recording,
+            "bucket",
+            poll_time=1.0,
+            strategy="still",
+            mode="events",
+            keepalive_time=60.0,
+            stop_event=stop,
+        )
+    finally:
+        timer.cancel()
+        signal.signal(signal.SIGTERM, previous_handler)
+        os.close(read_fd)
+        os.close(write_fd)
+
+    # Well before the next keepalive
+    assert time.monotonic() - started < 5.0
+    assert stop.is_set()
+    assert [event.data for event in recording.heartbeats] == [EDITOR]
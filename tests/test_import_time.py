@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Tests that importing the watcher stays cheap and opens no platform handles
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative `python -X importtime` of aw_watcher_window.main, in ms. It's
+# about 50 ms here; importing aw_client alone takes over 150 ms.
+IMPORT_BUDGET_MS = 120
+
+# Only imported once the watcher runs, or on first use
+HEAVY_MODULES = ("aw_client", "aw_core", "requests", "Xlib", "http.server", "tomlkit")
+
+
+def run_python(code, **env):
+    environ = dict(os.environ, **env)
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=environ,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+
+def cumulative_ms(stderr, module):
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() == module:
+            return int(cumulative) / 1000
+    raise AssertionError(f"{module} not in importtime output")
+
+
+def test_import_main_within_budget():
+    # Best of three, a single run can be slowed down by the machine
+    times = [
+        cumulative_ms(run_python("import aw_watcher_window.main").stderr, "aw_watcher_window.main")
+        for _ in range(3)
+    ]
+    assert min(times) < IMPORT_BUDGET_MS
+
+
+def test_import_main_skips_heavy_modules():
+    result = run_python(
+        "import sys, aw_watcher_window.main\n"
+        f"print(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_package_main_is_the_entry_point():
+    result = run_python(
+        "import sys, aw_watcher_window\n"
+        "print(aw_watcher_window.main.__module__)\n"
+        f"print(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    assert result.stdout.split("\n")[:2] == ["aw_watcher_window.main", "[]"]
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Linux only")
+def test_import_xlib_without_display():
+    result = run_python(
+        "import os\n"
+        "os.environ.pop('DISPLAY', None)\n"
+        "from aw_watcher_window import xlib\n"
+        "print(xlib.connection.connected)"
+    )
+    assert result.stdout.strip() == "False"
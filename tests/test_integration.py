@@ -78,6 +78,7 @@ def test_window_info_with_desktop():
                 window_info = get_current_window(strategy="jxa")
             else:
                 window_info = get_current_window()
+            window_info = window_info and window_info.to_dict()
         
         logger.info(f"Window info: {window_info}")
         
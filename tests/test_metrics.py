@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Tests for the hot-path metrics and their Prometheus endpoint
+"""
+import importlib
+import os
+import sys
+import urllib.request
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_watcher_window import metrics as metrics_module
+from aw_watcher_window.metrics import Metrics, serve_metrics
+from aw_watcher_window.sample import WindowSample
+
+# The package exports the main() function under the same name
+main = importlib.import_module("aw_watcher_window.main")
+
+
+def test_disabled_records_nothing():
+    m = Metrics()
+    assert m.stage("a") is m.stage("b")
+    with m.stage("a"):
+        pass
+    m.count("samples")
+    assert m.stages == {} and m.counters == {}
+
+
+def test_stages_and_counters():
+    m = Metrics()
+    m.enable()
+    for _ in range(3):
+        with m.stage("window_name"):
+            pass
+    m.count("samples", 3)
+    m.register("emitter", lambda: {"heartbeats": 2})
+    # Registering again under the same key replaces the collector
+    m.register("emitter", lambda: {"heartbeats": 5})
+
+    assert m.stages["window_name"].count == 3
+    assert m.values() == {"samples": 3, "heartbeats": 5}
+    summary = m.summary()
+    assert "heartbeats=5 samples=3" in summary and "window_name p50=" in summary
+
+
+def test_prometheus_text():
+    m = Metrics()
+    m.enable()
+    for _ in range(2):
+        with m.stage("desktop"):
+            pass
+    m.count("exceptions")
+    text = m.render()
+    assert '# TYPE aw_watcher_window_stage_seconds histogram' in text
+    assert 'aw_watcher_window_stage_seconds_bucket{stage="desktop",le="+Inf"} 2' in text
+    assert 'aw_watcher_window_stage_seconds_count{stage="desktop"} 2' in text
+    assert "aw_watcher_window_exceptions_total 1" in text
+    # Buckets are cumulative
+    buckets = [
+        int(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith("aw_watcher_window_stage_seconds_bucket")
+    ]
+    assert buckets == sorted(buckets)
+
+
+def test_gauges_have_no_total_suffix():
+    m = Metrics()
+    m.enable()
+    m.register("spool", lambda: {"spool_events": 3, "spool_dropped": 1}, gauges=("spool_events",))
+    text = m.render()
+    assert "# TYPE aw_watcher_window_spool_events gauge\naw_watcher_window_spool_events 3\n" in text
+    assert "# TYPE aw_watcher_window_spool_dropped_total counter\naw_watcher_window_spool_dropped_total 1\n" in text
+    assert "spool_events_total" not in text
+
+
+def test_endpoint_serves_metrics(monkeypatch):
+    m = Metrics()
+    m.enable()
+    m.count("samples", 7)
+    monkeypatch.setattr(metrics_module, "metrics", m)
+    server = serve_metrics(0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "aw_watcher_window_samples_total 7" in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other", timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_sample_window_counts(monkeypatch):
+    m = Metrics()
+    m.enable()
+    monkeypatch.setattr(main, "metrics", m)
+    windows = iter([WindowSample("code", "main.py"), RuntimeError("flaky")])
+
+    def source(strategy):
+        window = next(windows)
+        if isinstance(window, Exception):
+            raise window
+        return window
+
+    monkeypatch.setattr(main, "get_current_window", source)
+    assert main.sample_window(None) is not None
+    assert main.sample_window(None) is None
+    assert m.counters == {"samples": 2, "exceptions": 1}
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Tests for the sampler/sender pipeline
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_client import ActivityWatchClient
+
+from aw_watcher_window.heartbeat import HeartbeatEmitter
+from aw_watcher_window.pipeline import SampleBuffer, SampleRun, Sender
+from tests.mock_server import MockActivityWatchHandler
+from tests.samples import BROWSER, EDITOR, START
+
+PORT = 5670
+
+
+def at(seconds):
+    return START + timedelta(seconds=seconds)
+
+
+def test_full_buffer_coalesces_identical_samples_first():
+    buffer = SampleBuffer(maxsize=3)
+    buffer.put(EDITOR, at(0))
+    buffer.put(BROWSER, at(1))
+    buffer.put(BROWSER, at(2))
+    buffer.put(EDITOR, at(3))
+
+    assert buffer.coalesced == 1 and buffer.dropped == 0
+    assert buffer.drain() == [
+        SampleRun(EDITOR, at(0), at(0)),
+        SampleRun(BROWSER, at(1), at(2)),
+        SampleRun(EDITOR, at(3), at(3)),
+    ]
+
+
+def test_full_buffer_drops_oldest_without_duplicates():
+    buffer = SampleBuffer(maxsize=2, max_gap=lambda: 2.0)
+    buffer.put(EDITOR, at(0))
+    buffer.put(EDITOR, at(10))
+    buffer.put(BROWSER, at(11))
+
+    assert buffer.dropped == 1
+    assert [run.start for run in buffer.drain()] == [at(10), at(11)]
+
+
+def test_gap_follows_changing_pulsetime():
+    pulsetime = [2.0]
+    buffer = SampleBuffer(maxsize=2, max_gap=lambda: pulsetime[0])
+    buffer.put(EDITOR, at(0))
+    buffer.put(EDITOR, at(10))
+    # E.g. adaptive polling backed off to a longer interval
+    pulsetime[0] = 20.0
+    buffer.put(BROWSER, at(11))
+
+    assert buffer.coalesced == 1 and buffer.dropped == 0
+    assert [run.start for run in buffer.drain()] == [at(0), at(11)]
+
+
+def test_get_returns_none_once_closed_and_empty():
+    buffer = SampleBuffer()
+    buffer.put(EDITOR, at(0))
+    buffer.close()
+    assert buffer.get() == SampleRun(EDITOR, at(0), at(0))
+    assert buffer.get() is None
+
+
+@pytest.fixture
+def slow_client(mock_server):
+    MockActivityWatchHandler.post_delay = 0.1
+    try:
+        yield ActivityWatchClient("test-pipeline", host="localhost", port=PORT, testing=True)
+    finally:
+        MockActivityWatchHandler.post_delay = 0.0
+
+
+def test_sampling_is_not_delayed_by_slow_server(slow_client):
+    poll_time = 0.01
+    emitter = HeartbeatEmitter(slow_client, "slow", interval=poll_time, queued=False)
+    buffer = SampleBuffer(maxsize=4, max_gap=lambda: emitter.pulsetime)
+    sender = Sender(buffer, emitter)
+    sender.start()
+
+    timestamps = []
+    slowest_put = 0.0
+    for _ in range(50):
+        now = datetime.now(timezone.utc)
+        # Timestamps are stored with millisecond precision
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        timestamps.append(now)
+        start = time.perf_counter()
+        buffer.put(dict(EDITOR), now)
+        slowest_put = max(slowest_put, time.perf_counter() - start)
+        time.sleep(poll_time)
+    sender.stop()
+
+    # Sending one heartbeat takes 10 sampling intervals
+    assert slowest_put < poll_time / 2
+    assert buffer.coalesced > 0 and buffer.dropped == 0
+    assert sender.errors == 0
+
+    [event] = slow_client.get_events("slow")
+    assert event.timestamp == timestamps[0]
+    assert event.duration == timestamps[-1] - timestamps[0]
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Tests for the title rewrite and redaction rules
+"""
+import os
+import re
+import sys
+
+import pytest
+import tomlkit
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_watcher_window.rules import RuleEngine, load_rules
+from aw_watcher_window.sample import WindowSample
+
+CONFIG = r"""
+[aw-watcher-window]
+[[aw-watcher-window.rules]]
+app = "soffice"
+title = '^(.*) - (\w+)\.odt'
+action = "rewrite"
+replace = '\2 document'
+
+[[aw-watcher-window.rules]]
+app = "soffice"
+action = "exclude"
+desktop = "Personal*"
+
+[[aw-watcher-window.rules]]
+app = "*term*"
+title = "ssh"
+action = "hash"
+
+[[aw-watcher-window.rules]]
+app_regex = "^(firefox|chromium)$"
+title = "bank"
+action = "exclude"
+"""
+
+
+def apply(engine, app, title, desktop="Work"):
+    return engine.apply(WindowSample(app, title, desktop)).title
+
+
+@pytest.fixture
+def engine():
+    rules = load_rules(tomlkit.parse(CONFIG)["aw-watcher-window"]["rules"])
+    return RuleEngine(rules, [re.compile("secret", re.IGNORECASE)])
+
+
+def test_rewrite_with_groups(engine):
+    assert apply(engine, "soffice", "Q3 plan - budget.odt") == "budget document"
+    # The title regex must match for the rule to apply
+    assert apply(engine, "soffice", "Start Center") == "Start Center"
+
+
+def test_desktop_rule_overrides(engine):
+    assert apply(engine, "soffice", "Q3 plan - budget.odt", desktop="Personal 2") == "excluded"
+
+
+def test_glob_and_regex_apps(engine):
+    hashed = apply(engine, "xterm", "ssh prod-db")
+    assert hashed.startswith("sha256:") and "prod" not in hashed
+    assert apply(engine, "xterm", "ssh prod-db") == hashed
+    assert apply(engine, "firefox", "My Bank") == "excluded"
+    assert apply(engine, "firefox-esr", "My Bank") == "My Bank"
+
+
+def test_only_rules_for_the_app_are_evaluated(engine):
+    assert engine.rules_for("gedit") == []
+    apply(engine, "gedit", "notes.txt")
+    assert engine.evaluated == 0
+    # --exclude-titles still apply to every app
+    assert apply(engine, "gedit", "Secret plans") == "excluded"
+
+
+def test_exclude_titles_win_over_rules():
+    rules = load_rules(
+        [{"app": "firefox", "title": "^(.*) - Mozilla Firefox$", "action": "rewrite", "replace": r"\1"}]
+    )
+    engine = RuleEngine(rules, [re.compile("Mozilla Firefox$")])
+    # Matched against the title before the rewrite, which no longer ends in it
+    assert apply(engine, "firefox", "My Bank account - Mozilla Firefox") == "excluded"
+    assert engine.evaluated == 0
+
+
+def test_results_are_cached_and_timed(engine):
+    apply(engine, "soffice", "Q3 plan - budget.odt")
+    # The desktop rule, then the rewrite
+    assert engine.evaluated == 2
+    apply(engine, "soffice", "Q3 plan - budget.odt")
+    apply(engine, "soffice", "Q3 plan - budget.odt")
+    assert engine.evaluated == 2
+    assert engine.samples == 3
+    assert engine.timings.count == 3
+
+
+def test_invalid_rules():
+    with pytest.raises(ValueError, match="Rule 2"):
+        load_rules([{"app": "a"}, {"app": "b", "action": "rewrite"}])
+    with pytest.raises(ValueError, match="action"):
+        load_rules([{"action": "drop"}])
+    with pytest.raises(ValueError, match="regex"):
+        load_rules([{"title": "("}])
+    with pytest.raises(ValueError, match="keys"):
+        load_rules([{"apps": "a"}])
+
+
+def test_empty_engine():
+    assert not RuleEngine()
+    assert apply(RuleEngine(), "any", "title") == "title"
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Tests for WindowSample and the allocations of a steady-state poll
+"""
+import os
+import re
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_watcher_window import lib
+from aw_watcher_window.heartbeat import HeartbeatEmitter
+from aw_watcher_window.main import sample_window
+from aw_watcher_window.rules import RuleEngine, load_rules
+from aw_watcher_window.sample import WindowSample
+
+# Bytes a poll may allocate at its peak, and the whole run may keep
+POLL_BUDGET = 2048
+GROWTH_BUDGET = 1024
+
+
+def test_equality_ignores_window_id_and_pid():
+    a = WindowSample("code", "main.py", "Work", window_id=1, pid=10)
+    b = WindowSample("code", "main.py", "Work", window_id=2, pid=20)
+    assert a == b and hash(a) == hash(b)
+    assert a != a.with_title("other.py")
+    assert a.with_title("main.py") is a
+
+
+def test_immutable():
+    sample = WindowSample("code", "main.py")
+    with pytest.raises(AttributeError):
+        sample.title = "other"
+    with pytest.raises(AttributeError):
+        sample.anything = 1
+
+
+def test_interned_names():
+    a = WindowSample("".join(["co", "de"]), "t", "".join(["Wo", "rk"]))
+    b = WindowSample("".join(["co", "de"]), "t", "".join(["Wo", "rk"]))
+    assert a.app is b.app and a.desktop is b.desktop
+
+
+def test_dict_round_trip():
+    data = {"app": "Safari", "title": "Docs", "desktop": "Main", "url": "https://x", "incognito": False}
+    sample = WindowSample.from_dict(data)
+    assert sample.to_dict() == data
+    assert sample == WindowSample.from_dict(dict(data))
+
+
+class NullClient:
+    def heartbeat(self, *args, **kwargs):
+        pass
+
+
+@pytest.mark.skipif(sys.version_info < (3, 9), reason="tracemalloc.reset_peak() needs Python 3.9")
+def test_steady_state_poll_allocations(monkeypatch):
+    class FreshSource:
+        def get_current_window(self):
+            # A fresh sample from fresh strings, like a backend builds every poll
+            return WindowSample(
+                "".join(["co", "de"]), "".join(["main", ".py"]), "".join(["Wo", "rk"]), window_id=42, pid=1000
+            )
+
+    monkeypatch.setattr(lib, "_sources", {})
+    lib.register_source("fresh", FreshSource())
+    engine = RuleEngine(
+        load_rules([{"app": "code", "title": "secret", "action": "hash"}]), [re.compile("bank")]
+    )
+    emitter = HeartbeatEmitter(NullClient(), "bucket", 1.0, keepalive_time=3600.0)
+    now = datetime.now(timezone.utc)
+
+    def poll():
+        emitter.emit(sample_window("fresh", False, engine), now)
+
+    for _ in range(100):
+        poll()
+
+    tracemalloc.start()
+    try:
+        poll()
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(1000):
+            poll()
+        end, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert emitter.sent == 1
+    assert peak - start < POLL_BUDGET
+    assert end - start < GROWTH_BUDGET
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+Tests for the deadline scheduler
+"""
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_transform.heartbeats import heartbeat_merge
+
+from aw_watcher_window.heartbeat import HeartbeatEmitter
+from aw_watcher_window.scheduler import AdaptiveInterval, Scheduler
+from aw_watcher_window.stats import Histogram
+
+
+class FakeTime:
+    """A clock that only moves when waited on or worked."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.stopped = False
+
+    def clock(self):
+        return self.now
+
+    # threading.Event interface
+    def wait(self, timeout):
+        self.now += timeout
+        return self.stopped
+
+    def is_set(self):
+        return self.stopped
+
+    def set(self):
+        self.stopped = True
+
+
+def run(policy, work):
+    """Tick times for iterations that take work[i] seconds each."""
+    fake = FakeTime()
+    scheduler = Scheduler(1.0, policy=policy, clock=fake.clock, stop_event=fake)
+    ticks = []
+    for seconds in work:
+        assert scheduler.wait()
+        ticks.append(fake.now)
+        fake.now += seconds
+    return scheduler, ticks
+
+
+def test_ticks_do_not_drift():
+    scheduler, ticks = run("skip", [0.3] * 5)
+    assert ticks == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert scheduler.lateness.max == 0.0
+
+
+def test_skip_policy_drops_missed_ticks():
+    scheduler, ticks = run("skip", [0.2, 3.5, 0.2, 0.2])
+    assert ticks == [0.0, 1.0, 4.5, 5.0]
+    assert scheduler.skipped == 2
+    assert scheduler.lateness.max == 0.5
+
+
+def test_catch_up_policy_runs_missed_ticks():
+    scheduler, ticks = run("catch-up", [0.2, 3.5, 0, 0, 0, 0])
+    assert ticks == [0.0, 1.0, 4.5, 4.5, 4.5, 5.0]
+    assert scheduler.skipped == 0
+
+
+def test_slack_covers_overruns():
+    scheduler, _ = run("skip", [0.2, 0.6, 0.2])
+    assert abs(scheduler.slack - 0.1) < 1e-9
+    scheduler, _ = run("catch-up", [0.2, 1.5, 0.2])
+    assert abs(scheduler.slack - (0.5 + 0.1)) < 1e-9
+
+
+def test_stop_interrupts_wait():
+    scheduler = Scheduler(60.0)
+    assert scheduler.wait()
+    threading.Timer(0.05, scheduler.stop).start()
+    start = time.monotonic()
+    assert not scheduler.wait()
+    assert time.monotonic() - start < 5
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(bounds=(0.001, 0.01, 0.1))
+    for value in [0.0005] * 98 + [0.05, 0.3]:
+        histogram.observe(value)
+    assert histogram.counts == [98, 0, 1, 1]
+    assert histogram.quantile(0.5) == 0.001
+    assert histogram.quantile(0.99) == 0.1
+    assert histogram.quantile(1.0) == 0.3
+
+
+def test_adaptive_interval_backs_off_and_tightens():
+    interval = AdaptiveInterval(0.5, 4.0)
+    assert [interval.update(changed) for changed in [True, False, False, False, False, True]] == [
+        0.5,
+        1.0,
+        2.0,
+        4.0,
+        4.0,
+        0.5,
+    ]
+
+
+class MergingClient:
+    """Stores heartbeats merged like aw-server does."""
+
+    def __init__(self):
+        self.events = []
+
+    def heartbeat(self, bucket_id, event, pulsetime, queued=False):
+        if self.events:
+            merged = heartbeat_merge(self.events[-1], event, pulsetime)
+            if merged is not None:
+                self.events[-1] = merged
+                return
+        self.events.append(event)
+
+
+def test_adaptive_polling_keeps_stable_windows_merged():
+    fake = FakeTime()
+    interval = AdaptiveInterval(0.5, 8.0)
+    scheduler = Scheduler(interval.current, clock=fake.clock, stop_event=fake)
+    client = MergingClient()
+    emitter = HeartbeatEmitter(client, "bucket", interval=scheduler.period, queued=False)
+    start = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+
+    # Editor for an hour, then the browser for a minute
+    last = None
+    while fake.now < 3660:
+        assert scheduler.wait()
+        emitter.interval = scheduler.period
+        emitter.slack = scheduler.slack
+        data = {"app": "code"} if fake.now < 3600 else {"app": "firefox"}
+        emitter.emit(data, start + timedelta(seconds=fake.now))
+        scheduler.period = interval.update(data != last)
+        last = data
+        fake.now += 0.01
+
+    assert [event.data["app"] for event in client.events] == ["code", "firefox"]
+    assert client.events[0].duration > timedelta(seconds=3590)
+    # Polling every 0.5s would be 7200 wake-ups per hour
+    assert scheduler.wakeups_per_hour() < 600
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+Tests for the on-disk event spool
+"""
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_core.models import Event
+from requests import RequestException
+
+from aw_watcher_window.spool import RECORD_SIZE, Spool, decode_record, encode_record
+
+START = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+
+
+def make_events(count, title="main.py"):
+    return [
+        Event(
+            timestamp=START + timedelta(seconds=10 * i),
+            duration=10,
+            data={"app": "code", "title": f"{title} {i}", "desktop": "Work"},
+        )
+        for i in range(count)
+    ]
+
+
+class RecordingClient:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    def insert_events(self, bucket_id, events):
+        if self.fail:
+            raise RequestException("connection refused")
+        self.batches.append(events)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "spool.bin")
+
+
+def test_record_roundtrip_cuts_long_titles():
+    [event] = make_events(1, title="ä" * 2000)
+    record = encode_record(event)
+    assert len(record) == RECORD_SIZE
+
+    decoded = decode_record(record)
+    assert decoded.timestamp == event.timestamp
+    assert decoded.duration == event.duration
+    assert event.data["title"].startswith(decoded.data["title"])
+
+
+def test_drain_inserts_in_batches_and_survives_restart(path):
+    spool = Spool(path)
+    spool.extend(make_events(25))
+    spool.close()
+
+    spool = Spool(path)
+    client = RecordingClient()
+    assert spool.drain(client, "bucket", batch_size=10) == 25
+    assert [len(batch) for batch in client.batches] == [10, 10, 5]
+    assert len(spool) == 0
+    assert os.path.getsize(path) == 0
+
+
+def test_failed_drain_keeps_events(path):
+    spool = Spool(path)
+    spool.extend(make_events(3))
+    assert spool.drain(RecordingClient(fail=True), "bucket") == 0
+    spool.close()
+
+    client = RecordingClient()
+    assert Spool(path).drain(client, "bucket") == 3
+    assert [e.data["title"] for e in client.batches[0]] == ["main.py 0", "main.py 1", "main.py 2"]
+
+
+def test_torn_write_is_dropped(path):
+    spool = Spool(path)
+    spool.extend(make_events(3))
+    spool.close()
+    with open(path, "ab") as f:
+        f.write(encode_record(make_events(1)[0])[: RECORD_SIZE // 2])
+
+    spool = Spool(path)
+    assert len(spool) == 3
+    assert os.path.getsize(path) == 3 * RECORD_SIZE
+
+
+def test_damaged_last_record_is_dropped(path):
+    spool = Spool(path)
+    spool.extend(make_events(3))
+    spool.close()
+    with open(path, "r+b") as f:
+        f.seek(2 * RECORD_SIZE + 20)
+        f.write(b"garbage")
+
+    assert len(Spool(path)) == 2
+
+
+def test_full_spool_drops_oldest(path):
+    spool = Spool(path, max_bytes=10 * RECORD_SIZE)
+    spool.extend(make_events(15))
+
+    assert len(spool) <= 10
+    assert os.path.getsize(path) <= 10 * RECORD_SIZE
+    assert spool.dropped == 15 - len(spool)
+
+    client = RecordingClient()
+    spool.drain(client, "bucket")
+    assert client.batches[0][-1].data["title"] == "main.py 14"
+
+
+def test_fsyncs_are_batched(path):
+    spool = Spool(path, fsync_every=64)
+    spool.extend(make_events(100))
+    assert spool.fsyncs == 2
+
+
+@pytest.mark.parametrize("crash_in", ["replace", "write_head"])
+def test_crash_during_compaction_keeps_events(path, monkeypatch, crash_in):
+    class FailingAfterFirst(RecordingClient):
+        def insert_events(self, bucket_id, events):
+            super().insert_events(bucket_id, events)
+            self.fail = True
+
+    spool = Spool(path)
+    spool.extend(make_events(5))
+    assert spool.drain(FailingAfterFirst(), "bucket", batch_size=2) == 2
+
+    def crash(*args):
+        raise KeyboardInterrupt
+
+    if crash_in == "replace":
+        monkeypatch.setattr(os, "replace", crash)
+    else:
+        monkeypatch.setattr(spool, "_write_head", crash)
+    with pytest.raises(KeyboardInterrupt):
+        spool._compact()
+    monkeypatch.undo()
+
+    client = RecordingClient()
+    assert Spool(path).drain(client, "bucket") == 3
+    assert [e.data["title"] for e in client.batches[0]] == ["main.py 2", "main.py 3", "main.py 4"]
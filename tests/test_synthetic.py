@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+Tests for the synthetic window source and running heartbeat_loop faster than real time
+"""
+import importlib
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_transform.heartbeats import heartbeat_merge
+
+from aw_watcher_window import lib
+from aw_watcher_window.synthetic import SyntheticSource
+
+# The package exports the main() function under the same name
+main = importlib.import_module("aw_watcher_window.main")
+
+
+def take(source, n):
+    return [source.get_current_window() for _ in range(n)]
+
+
+def test_reproducible_from_seed():
+    assert take(SyntheticSource(seed=3), 2000) == take(SyntheticSource(seed=3), 2000)
+    assert take(SyntheticSource(seed=3), 2000) != take(SyntheticSource(seed=4), 2000)
+
+
+def test_workload_shape():
+    source = SyntheticSource(seed=1)
+    samples = take(source, 50000)
+    apps = Counter(sample.app for sample in samples)
+    # Zipf: the most used app is active far more than the median one
+    counts = sorted(apps.values(), reverse=True)
+    assert counts[0] > 5 * counts[len(counts) // 2]
+    assert source.bursts > 0
+    assert len({sample.desktop for sample in samples}) > 1
+    runs = sum(1 for _ in groupby(samples))
+    assert runs - 1 <= source.changes < runs * 2
+    assert any(sample.title.startswith("(") for sample in samples)
+
+
+def test_registered_source_behind_get_current_window(monkeypatch):
+    monkeypatch.setattr(lib, "_sources", {})
+    source = SyntheticSource(seed=7)
+    lib.register_source("synthetic", source)
+    assert lib.get_current_window("synthetic") == SyntheticSource(seed=7).get_current_window()
+    assert source.samples == 1
+    # Created on first use if none was registered
+    monkeypatch.setattr(lib, "_sources", {})
+    assert isinstance(lib.get_source("synthetic"), SyntheticSource)
+    assert lib.get_source(None) is None and lib.get_source("xlib") is None
+
+
+class MemoryClient:
+    def __init__(self):
+        self.events = []
+
+    def insert_events(self, bucket_id, events):
+        self.events.extend(events)
+
+    def heartbeat(self, bucket_id, event, pulsetime, queued=False):
+        last = self.events[-1] if self.events else None
+        if last is not None and heartbeat_merge(last, event, pulsetime) is not None:
+            return
+        self.events.append(event)
+
+
+def test_heartbeat_loop_at_1000x(monkeypatch):
+    monkeypatch.setattr(lib, "_sources", {})
+    source = SyntheticSource(seed=11, switch=0.1)
+    lib.register_source("synthetic", source)
+    client = MemoryClient()
+    stop = threading.Event()
+    timer = threading.Timer(0.5, stop.set)
+    timer.start()
+    try:
+        main.heartbeat_loop(
+            client,
+            "bucket",
+            poll_time=1.0,
+            strategy="synthetic",
+            heartbeats="batch",
+            stop_event=stop,
+            speedup=1000.0,
+        )
+    finally:
+        timer.cancel()
+
+    # About 500 simulated seconds in half a second
+    assert source.samples >= 100
+    start = client.events[0].timestamp
+    end = client.events[-1].timestamp + client.events[-1].duration
+    assert (end - start).total_seconds() >= 0.5 * source.samples
+
+    # The stored timeline is the generated one, whatever gaps a slow tick left
+    expected = [key for key, _ in groupby(take(SyntheticSource(seed=11, switch=0.1), source.samples))]
+    stored = [key for key, _ in groupby(event.data for event in client.events)]
+    assert stored == [sample.to_dict() for sample in expected]
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_short_soak_is_flat(monkeypatch):
+    def rss():
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    class NullClient:
+        def heartbeat(self, *args, **kwargs):
+            pass
+
+    monkeypatch.setattr(lib, "_sources", {})
+    lib.register_source("synthetic", SyntheticSource(seed=5))
+    engine = main.RuleEngine()
+    emitter = main.make_emitter(NullClient(), "bucket", 1.0, heartbeats="changes")
+    now = datetime.now(timezone.utc)
+
+    def run(n):
+        nonlocal now
+        for _ in range(n):
+            emitter.emit(main.sample_window("synthetic", False, engine), now)
+            now += timedelta(seconds=1)
+
+    run(20000)
+    before_rss, before_fds = rss(), len(os.listdir("/proc/self/fd"))
+    run(100000)
+    assert rss() - before_rss < 4 << 20
+    assert len(os.listdir("/proc/self/fd")) == before_fds
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Tests for the shared X11 connection (needs an X server, e.g. xvfb-run)
+"""
+import os
+import sys
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux") or not os.environ.get("DISPLAY"),
+    reason="needs an X server",
+)
+
+
+def test_atoms_interned_once_at_connect():
+    from aw_watcher_window.xconnection import EWMH_ATOMS, XConnection
+
+    connection = XConnection()
+    connection.connect()
+    try:
+        assert set(EWMH_ATOMS) <= set(connection.atoms)
+        assert all(atom != 0 for atom in connection.atoms.values())
+
+        roundtrips = connection.roundtrips
+        connection.atom("_NET_CURRENT_DESKTOP")
+        assert connection.roundtrips == roundtrips
+    finally:
+        connection.close()
+
+
+def test_reconnect_opens_fresh_display():
+    from aw_watcher_window.xconnection import XConnection
+
+    connection = XConnection()
+    first = connection.display
+    atoms = dict(connection.atoms)
+
+    connection.reconnect()
+    try:
+        assert connection.display is not first
+        assert connection.connects == 2
+        assert connection.atoms == atoms
+    finally:
+        connection.close()
+    assert not connection.connected
+
+
+def test_virtual_desktop_reuses_shared_connection():
+    from aw_watcher_window.virtualdesktop import get_virtual_desktop_linux
+    from aw_watcher_window.xconnection import get_connection
+
+    get_virtual_desktop_linux()
+    connects = get_connection().connects
+    for _ in range(5):
+        assert "desktop" in get_virtual_desktop_linux()
+    assert get_connection().connects == connects
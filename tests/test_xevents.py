@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Tests for event-driven change detection on X11 (needs an X server, e.g. xvfb-run)
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux") or not os.environ.get("DISPLAY"),
+    reason="needs an X server",
+)
+
+
+def _set_root_cardinal(name, value):
+    """Sets a CARDINAL property on the root window from a separate client, like a WM would."""
+    import Xlib.display
+    from Xlib import Xatom
+
+    display = Xlib.display.Display()
+    try:
+        display.screen().root.change_property(
+            display.intern_atom(name), Xatom.CARDINAL, 32, [value]
+        )
+        display.sync()
+    finally:
+        display.close()
+
+
+def test_wait_times_out_without_changes():
+    from aw_watcher_window.xconnection import XConnection
+    from aw_watcher_window.xevents import PropertyWatcher
+
+    watcher = PropertyWatcher(XConnection())
+    start = time.monotonic()
+    assert watcher.wait(0.2) == []
+    assert time.monotonic() - start >= 0.2
+
+
+def test_wait_wakes_on_desktop_change():
+    from aw_watcher_window.xconnection import XConnection
+    from aw_watcher_window.xevents import PropertyWatcher
+
+    connection = XConnection()
+    watcher = PropertyWatcher(connection)
+    watcher.wait(0)  # subscribe
+
+    timer = threading.Timer(0.1, _set_root_cardinal, args=("_NET_CURRENT_DESKTOP", 1))
+    timer.start()
+    start = time.monotonic()
+    changes = watcher.wait(5.0)
+    timer.join()
+
+    assert (connection.root.id, "_NET_CURRENT_DESKTOP") in changes
+    assert time.monotonic() - start < 2.0
+
+
+def test_title_read_once_until_changed():
+    import Xlib.display
+    from Xlib import Xatom
+
+    from aw_watcher_window.xconnection import XConnection
+    from aw_watcher_window.xevents import PropertyWatcher
+
+    # A window owned by another client, like a real application window
+    app = Xlib.display.Display()
+    app_window = app.screen().root.create_window(0, 0, 10, 10, 0, app.screen().root_depth)
+    app_window.set_wm_name("first")
+    app.sync()
+
+    connection = XConnection()
+    watcher = PropertyWatcher(connection)
+    window = connection.display.create_resource_object("window", app_window.id)
+    fetches = []
+
+    def fetch(w):
+        fetches.append(w.id)
+        return w.get_wm_name()
+
+    try:
+        assert watcher.get_window_name(window, fetch) == "first"
+        assert watcher.get_window_name(window, fetch) == "first"
+        assert len(fetches) == 1
+
+        app_window.change_property(Xatom.WM_NAME, Xatom.STRING, 8, b"second")
+        app.sync()
+        connection.display.sync()
+        assert watcher.get_window_name(window, fetch) == "second"
+        assert len(fetches) == 2
+        assert watcher.title_hits == 1
+    finally:
+        app_window.destroy()
+        app.close()
+        connection.close()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""
+Tests for the X11 backend (most need an X server, e.g. xvfb-run)
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+needs_x = pytest.mark.skipif(
+    not sys.platform.startswith("linux") or not os.environ.get("DISPLAY"),
+    reason="needs an X server",
+)
+
+
+@pytest.fixture
+def focused_window():
+    """An application window set as _NET_ACTIVE_WINDOW, like a WM would do."""
+    import Xlib.display
+    import Xlib.error
+    from Xlib import Xatom
+
+    app = Xlib.display.Display()
+    root = app.screen().root
+    window = root.create_window(0, 0, 10, 10, 0, app.screen().root_depth)
+    window.set_wm_class("editor", "Editor")
+    window.change_property(
+        app.intern_atom("_NET_WM_NAME"), app.intern_atom("UTF8_STRING"), 8, "notes.txt – Editor".encode("utf8")
+    )
+    root.change_property(app.intern_atom("_NET_ACTIVE_WINDOW"), Xatom.WINDOW, 32, [window.id])
+    root.change_property(app.intern_atom("_NET_CURRENT_DESKTOP"), Xatom.CARDINAL, 32, [1])
+    root.change_property(
+        app.intern_atom("_NET_DESKTOP_NAMES"), app.intern_atom("UTF8_STRING"), 8, b"Dev\x00Writing\x00"
+    )
+    app.sync()
+    yield app, window
+    window.destroy(onerror=Xlib.error.CatchError(Xlib.error.BadWindow))
+    app.sync()
+    app.close()
+
+
+@needs_x
+def test_snapshot_matches_serial_path(focused_window):
+    from aw_watcher_window import xlib
+
+    _, app_window = focused_window
+    snapshot = xlib.get_snapshot()
+    window = xlib.get_current_window()
+
+    assert snapshot.window_id == app_window.id
+    assert snapshot.app == xlib.get_window_class(window) == "Editor"
+    assert snapshot.title == xlib.get_window_name(window) == "notes.txt – Editor"
+    assert snapshot.desktop == 1
+    assert snapshot.desktop_names == ["Dev", "Writing"]
+
+
+@needs_x
+def test_snapshot_is_one_roundtrip_when_focus_is_unchanged(focused_window):
+    from aw_watcher_window import xlib
+
+    xlib.get_snapshot()
+    roundtrips = xlib.connection.roundtrips
+    xlib.get_snapshot()
+    assert xlib.connection.roundtrips - roundtrips == 1
+
+
+@needs_x
+def test_window_class_cached_until_destroyed(focused_window):
+    from aw_watcher_window import xlib
+
+    window = xlib.get_current_window()
+    assert xlib.get_window_class(window) == "Editor"
+    hits, misses = xlib.class_cache.hits, xlib.class_cache.misses
+
+    roundtrips = xlib.connection.roundtrips
+    assert xlib.get_window_class(window) == "Editor"
+    assert xlib.connection.roundtrips == roundtrips
+    assert (xlib.class_cache.hits, xlib.class_cache.misses) == (hits + 1, misses)
+
+    app, app_window = focused_window
+    entry = xlib.resolve_window_class(window)
+    assert entry.toplevel == app_window.id
+
+    app_window.destroy()
+    app.sync()
+    xlib.connection.display.sync()
+    xlib.get_watcher().poll()
+    assert window.id not in xlib.class_cache
+
+
+def _destroy_keeping_active(app, app_window):
+    """Destroys the window but leaves its stale id in _NET_ACTIVE_WINDOW, like some WMs do."""
+    app_window.destroy()
+    app.sync()
+
+
+@needs_x
+def test_window_destroyed_mid_sample_is_unknown_and_cached(focused_window):
+    from aw_watcher_window import xlib
+    from aw_watcher_window.lib import get_current_window_linux
+
+    app, app_window = focused_window
+    window = xlib.get_current_window()
+    _destroy_keeping_active(app, app_window)
+
+    # The window is gone between reading _NET_ACTIVE_WINDOW and its properties
+    assert xlib.get_window_class(window) == "unknown"
+    assert xlib.get_window_name(window) == "unknown"
+
+    hits = xlib.dead_windows.hits
+    roundtrips = xlib.connection.roundtrips
+    info = get_current_window_linux()
+    assert (info.app, info.title) == ("unknown", "unknown")
+    assert xlib.dead_windows.hits > hits
+    # Only _NET_ACTIVE_WINDOW and the desktop are read, nothing for the dead window
+    assert xlib.connection.roundtrips - roundtrips <= 2
+
+
+@needs_x
+def test_dead_window_cache_recovers(focused_window, monkeypatch):
+    from Xlib import Xatom
+
+    from aw_watcher_window import xlib
+
+    app, app_window = focused_window
+    monkeypatch.setattr(xlib.dead_windows, "ttl", 0.0)
+    _destroy_keeping_active(app, app_window)
+    assert xlib.get_snapshot().app == "unknown"
+
+    # Focus moves on to a live window once the WM catches up
+    root = app.screen().root
+    other = root.create_window(0, 0, 10, 10, 0, app.screen().root_depth)
+    other.set_wm_class("term", "Terminal")
+    root.change_property(app.intern_atom("_NET_ACTIVE_WINDOW"), Xatom.WINDOW, 32, [other.id])
+    app.sync()
+    try:
+        assert xlib.get_snapshot().app == "Terminal"
+        assert xlib.get_window_class(xlib.get_current_window()) == "Terminal"
+    finally:
+        other.destroy()
+        app.sync()
+
+
+class FakeWindow:
+    def __init__(self, window_id, properties, wm_class=None):
+        self.id = window_id
+        self.properties = properties
+        self.wm_class = wm_class
+
+    def get_full_property(self, atom, property_type):
+        return self.properties.get(atom)
+
+    def get_wm_class(self):
+        return self.wm_class
+
+
+class FakeDisplay:
+    def __init__(self, root, windows):
+        self.root = root
+        self.windows = windows
+
+    def screen(self):
+        return SimpleNamespace(root=self.root)
+
+    def create_resource_object(self, kind, window_id):
+        return self.windows[window_id]
+
+
+def fake_connection(window_id=0x400001):
+    """An XConnection that, like the real one, only has atoms once it's connected."""
+    from aw_watcher_window.xconnection import EWMH_ATOMS, XConnection
+
+    class FakeConnection(XConnection):
+        def connect(self):
+            self.atoms = {name: atom for atom, name in enumerate(EWMH_ATOMS, start=1000)}
+            window = FakeWindow(
+                window_id,
+                {self.atoms["_NET_WM_NAME"]: SimpleNamespace(format=8, value="notes.txt".encode("utf8"))},
+                wm_class=("editor", "Editor"),
+            )
+            root = FakeWindow(1, {self.atoms["_NET_ACTIVE_WINDOW"]: SimpleNamespace(value=[window_id])})
+            self._display = FakeDisplay(root, {window_id: window})
+            self.connects += 1
+
+    return FakeConnection()
+
+
+class FakeWatcher:
+    def poll(self):
+        return []
+
+    def track(self, window_id):
+        pass
+
+    def get_window_name(self, window, fetch):
+        return fetch(window)
+
+
+def test_first_sample_connects_for_atoms(monkeypatch):
+    from aw_watcher_window import lib, xevents, xlib
+
+    connection = fake_connection()
+    monkeypatch.setattr(xlib, "connection", connection)
+    monkeypatch.setattr(xlib, "get_watcher", FakeWatcher)
+    monkeypatch.setattr(xevents, "get_watcher", FakeWatcher)
+    monkeypatch.setattr(xlib, "class_cache", xlib.LRUCache(maxsize=16))
+    monkeypatch.delenv("DISPLAY", raising=False)
+    assert not connection.connected
+
+    sample = lib.get_current_window_linux("xlib")
+
+    assert (sample.app, sample.title, sample.window_id) == ("Editor", "notes.txt", 0x400001)
+    assert connection.connects == 1
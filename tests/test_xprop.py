@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+Tests for the xprop backends, using a fake xprop so that no X server is needed
+"""
+import os
+import sys
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_watcher_window import xprop
+from aw_watcher_window.xprop import XpropSpy, XpropSpyBackend, parse_spy_line, parse_strings
+
+WINDOW_DUMP = """\
+_NET_WM_DESKTOP(CARDINAL) = 2
+_NET_WM_ICON(CARDINAL) = \tIcon (2 x 2):
+\t WM_NAME(STRING) = "not a property"
+\t@@
+_NET_WM_PID(CARDINAL) = 4242
+WM_WINDOW_ROLE(STRING) = "browser"
+WM_HINTS(WM_HINTS):
+\t\tClient accepts input or input focus: True
+WM_CLASS(STRING) = "Navigator", "firefox"
+WM_ICON_NAME(STRING) = "a = b - Firefox"
+_NET_WM_NAME(UTF8_STRING) = "a = b - Firefox"
+WM_NAME(STRING) = "a = b - Firefox"
+WM_COMMAND(STRING) = { "firefox" }
+"""
+
+ROOT_DUMP = """\
+_NET_CLIENT_LIST_STACKING(WINDOW): window id # 0x1a00003, 0x2a00003
+_NET_CLIENT_LIST(WINDOW): window id # 0x2a00003, 0x1a00003
+_NET_ACTIVE_WINDOW(WINDOW): window id # 0x1a00003, 0x0
+"""
+
+# Behaves like `xprop -spy`: prints the current values, then keeps running
+FAKE_XPROP_SPY = r'''
+import sys, time
+if "-root" in sys.argv:
+    print('_NET_ACTIVE_WINDOW(WINDOW): window id # 0x1a00003', flush=True)
+    print('_NET_CURRENT_DESKTOP(CARDINAL) = 1', flush=True)
+    print('_NET_DESKTOP_NAMES(UTF8_STRING) = "Dev", "Web"', flush=True)
+else:
+    print('WM_CLASS(STRING) = "xterm", "XTerm"', flush=True)
+    print('_NET_WM_NAME(UTF8_STRING) = "vim \\"notes.txt\\""', flush=True)
+    print('WM_NAME:  not found.', flush=True)
+time.sleep(60)
+'''
+
+# Prints one value and exits, like xprop does when the window goes away
+FAKE_XPROP_EXITING = r'''
+print('_NET_CURRENT_DESKTOP(CARDINAL) = 0', flush=True)
+'''
+
+# The focused window's child prints the title with how often it was started, then exits
+FAKE_XPROP_WINDOW_EXITING = r'''
+import sys, time
+if "-root" in sys.argv:
+    print('_NET_ACTIVE_WINDOW(WINDOW): window id # 0x1a00003', flush=True)
+    print('_NET_CURRENT_DESKTOP(CARDINAL) = 0', flush=True)
+    print('_NET_DESKTOP_NAMES(UTF8_STRING) = "Dev"', flush=True)
+    time.sleep(60)
+else:
+    with open(sys.argv[1], "a+") as f:
+        f.write("x")
+        f.seek(0)
+        spawns = len(f.read())
+    print('WM_CLASS(STRING) = "xterm", "XTerm"', flush=True)
+    print(f'_NET_WM_NAME(UTF8_STRING) = "title {spawns}"', flush=True)
+'''
+
+
+def test_parse_spy_line():
+    assert parse_spy_line("_NET_ACTIVE_WINDOW(WINDOW): window id # 0x1a00003") == (
+        "_NET_ACTIVE_WINDOW",
+        "window id # 0x1a00003",
+    )
+    assert parse_spy_line("_NET_CURRENT_DESKTOP(CARDINAL) = 2") == ("_NET_CURRENT_DESKTOP", "2")
+    assert parse_spy_line("WM_NAME:  not found.") == ("WM_NAME", None)
+    assert parse_spy_line("") is None
+
+
+def test_parse_strings():
+    assert parse_strings('"xterm", "XTerm"') == ["xterm", "XTerm"]
+    assert parse_strings(r'"say \"hi\""') == ['say "hi"']
+    assert parse_strings(None) == []
+
+
+def test_parse_window_single_pass():
+    window = xprop.parse_window(WINDOW_DUMP, "0x1a00003", active_window=True)
+    assert window.to_dict() == {
+        "id": "0x1a00003",
+        "active": True,
+        "name": "a = b - Firefox",
+        "class": ["Navigator", "firefox"],
+        "desktop": 2,
+        "command": ['{ "firefox" }'],
+        "role": ["browser"],
+        "pid": 4242,
+    }
+
+
+def test_parse_window_missing_fields():
+    window = xprop.parse_window("_NET_WM_DESKTOP(CARDINAL) = 0\n", "0x1")
+    assert (window.name, window.cls, window.desktop, window.pid) == ("unknown", ["unknown"], 0, -1)
+    assert window.command == [] and window.role == []
+
+
+def test_root_dump_lookups(monkeypatch):
+    monkeypatch.setattr(xprop, "xprop_root", lambda: ROOT_DUMP)
+    assert xprop.get_active_window_id() == "0x1a00003"
+    assert xprop.get_window_ids() == ["0x2a00003", "0x1a00003"]
+
+
+def test_backend_spawns_nothing_in_steady_state():
+    backend = XpropSpyBackend(command=[sys.executable, "-c", FAKE_XPROP_SPY], startup_timeout=10.0)
+    try:
+        expected = {"app": "XTerm", "title": 'vim "notes.txt"', "desktop": "Web"}
+        assert backend.get_current_window() == expected
+        spawns = backend.spawns
+        for _ in range(5):
+            assert backend.get_current_window() == expected
+        assert backend.spawns == spawns == 2
+    finally:
+        backend.stop()
+
+
+def test_spy_restarts_after_exit():
+    spy = XpropSpy(["-root"], ["_NET_CURRENT_DESKTOP"], command=[sys.executable, "-c", FAKE_XPROP_EXITING])
+    try:
+        spy.update(10.0)
+        assert spy.values == {"_NET_CURRENT_DESKTOP": "0"}
+        while not spy.exited:
+            spy.update(1.0)
+
+        spy.update(10.0)
+        assert spy.spawns == 2
+        assert spy.values == {"_NET_CURRENT_DESKTOP": "0"}
+    finally:
+        spy.stop()
+
+
+def test_focused_window_spy_restarts_after_exit(tmp_path):
+    import time
+
+    command = [sys.executable, "-c", FAKE_XPROP_WINDOW_EXITING, str(tmp_path / "spawns")]
+    backend = XpropSpyBackend(command=command, startup_timeout=10.0)
+    try:
+        titles = []
+        for _ in range(3):
+            titles.append(backend.get_current_window()["title"])
+            time.sleep(0.2)
+    finally:
+        backend.stop()
+
+    # Focus never moved, the title is still read from a new child each time
+    spawns = [int(title.split()[1]) for title in titles]
+    assert spawns == sorted(set(spawns))
+    assert backend.window_spawns == spawns[-1]
+
+
+def test_get_windows_parallel_keeps_order(monkeypatch):
+    import threading
+    import time
+
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def fake_xprop_id(wid, timeout=None):
+        with lock:
+            running.append(wid)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(wid)
+        return f'WM_NAME(STRING) = "window {wid}"\n'
+
+    monkeypatch.setattr(xprop, "xprop_id", fake_xprop_id)
+    wids = [hex(i) for i in range(1, 13)]
+
+    windows = xprop.get_windows(wids, active_window_id="0x5", workers=4)
+    assert [w["id"] for w in windows] == wids
+    assert [w["name"] for w in windows] == [f"window {wid}" for wid in wids]
+    assert [w["active"] for w in windows] == [wid == "0x5" for wid in wids]
+    assert 1 < max(peak) <= 4
+
+
+def test_get_windows_timeout_reports_unknown(monkeypatch):
+    import subprocess
+
+    def fake_xprop_id(wid, timeout=None):
+        if wid == "0x2":
+            raise subprocess.TimeoutExpired(["xprop"], timeout)
+        return 'WM_NAME(STRING) = "ok"\n'
+
+    monkeypatch.setattr(xprop, "xprop_id", fake_xprop_id)
+    windows = xprop.get_windows(["0x1", "0x2"], workers=2, timeout=0.5)
+    assert [w["name"] for w in windows] == ["ok", "unknown"]